@@ -1,47 +1,172 @@
+import asyncio
+import logging
 import os
-from typing import List, Literal, TypedDict
+import threading
+import time
+from collections import Counter
+from typing import Annotated, Dict, List, Literal, Optional, Tuple, TypedDict
 
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, RemoveMessage
 from langchain_core.tools import tool
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_tavily import TavilySearch
 from pydantic import BaseModel, Field
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver  # hiện không dùng, nhưng cứ để đó nếu sau này muốn bật
-from langchain_core.runnables import RunnableConfig
+from langgraph.graph.message import add_messages
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+
+from config import (
+    GOOGLE_API_KEY,
+    TAVILY_API_KEY,
+    SPECULATIVE_RETRIEVAL,
+    PREROUTER_ENABLED,
+    RETRIEVAL_MODE,
+    WEB_CACHE_ENABLED,
+    WEB_CACHE_TTL,
+    WEB_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_WEB,
+    HISTORY_MAX_MESSAGES,
+    HISTORY_MESSAGE_MAX_CHARS,
+    HISTORY_SUMMARIZE,
+    HISTORY_SUMMARY_MAX_CHARS,
+    ROUTER_TIMEOUT,
+    JUDGE_TIMEOUT,
+    ANSWER_TIMEOUT,
+    WEB_TIMEOUT,
+    SUMMARY_TIMEOUT,
+    RAG_JUDGE_FAST_PATH,
+    RAG_ACCEPT_SCORE,
+    RAG_REJECT_SCORE,
+    RAG_ACCEPT_MIN_CHUNKS,
+    LLM_BATCH_MAX_SIZE,
+    LLM_BATCH_MAX_WAIT_MS,
+)
+from answer_cache import answer_cache
+from batching import LLMBatcher
+from observability import CONTEXT_CHARS, NODE_DURATION, NODE_ERRORS, observe_prompt
+from prerouter import PreRoute, PreRouter, end_reply, load_exemplars
+from resilience import ProviderError, gemini, tavily_provider
+from vectorstore import asearch_documents_with_scores, catalog, get_embeddings, search_documents_with_scores
+from web_cache import WebSearchCache
+
+logger = logging.getLogger(__name__)
+
+# =====================================================================
+# CLIENT KHỞI TẠO LƯỜI (TẠO LẦN ĐẦU DÙNG HOẶC LÚC WARM-UP, KHÔNG TẠO LÚC IMPORT)
+# =====================================================================
+
+_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+
+def _lazy_client(name: str, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def override_clients(**clients):
+    """Thay client theo tên: router_llm / judge_llm / answer_llm / tavily (benchmark, chạy offline)."""
+    with _clients_lock:
+        _clients.update(clients)
+
+
+def init_clients() -> List[str]:
+    """Tạo sẵn toàn bộ client (warm-up). Trả về tên các client đã sẵn sàng."""
+    get_tavily()
+    get_router_llm()
+    get_judge_llm()
+    get_answer_llm()
+    return sorted(_clients)
 
-from config import GOOGLE_API_KEY, TAVILY_API_KEY
-from vectorstore import get_retriever
 
 # =====================================================================
 # TOOLS
 # =====================================================================
 
-# Config Tavily
-os.environ["TAVILY_API_KEY"] = TAVILY_API_KEY
-tavily = TavilySearch(max_results=3, topic="general")
+def _build_tavily():
+    # Config Tavily
+    if TAVILY_API_KEY:
+        os.environ["TAVILY_API_KEY"] = TAVILY_API_KEY
+    return TavilySearch(max_results=3, topic="general")
+
+
+def get_tavily():
+    return _lazy_client("tavily", _build_tavily)
+
+
+def _format_tavily_result(result) -> str:
+    """Chuẩn hoá kết quả Tavily thành text cho context."""
+    if isinstance(result, dict) and "results" in result:
+        formatted_results = []
+        for item in result["results"]:
+            title = item.get("title", "No title")
+            content = item.get("content", "No content")
+            url = item.get("url", "")
+            formatted_results.append(
+                f"Title: {title}\nContent: {content}\nURL: {url}"
+            )
+        return "\n\n".join(formatted_results) if formatted_results else "No results found"
+    else:
+        return str(result)
+
+
+# Cache TTL + gộp request trùng cho Tavily (query giống nhau trong vài phút -> 1 lần gọi)
+web_cache = WebSearchCache(ttl_seconds=WEB_CACHE_TTL, max_entries=WEB_CACHE_MAX_ENTRIES)
+
+
+def _tavily_search(query: str) -> str:
+    result = tavily_provider.run("web", lambda: get_tavily().invoke({"query": query}), WEB_TIMEOUT)
+    return _format_tavily_result(result)
+
+
+async def _atavily_search(query: str) -> str:
+    result = await tavily_provider.arun("web", lambda: get_tavily().ainvoke({"query": query}), WEB_TIMEOUT)
+    return _format_tavily_result(result)
+
+
+def web_search(query: str) -> Tuple[str, str]:
+    """
+    Web search qua cache. Trả về (text, nguồn): nguồn là "hit" / "coalesced" / "miss" / "disabled".
+    Lỗi Tavily -> ("WEB_ERROR::...", ...) để web_node xử lý và không đưa vào context;
+    quá WEB_TIMEOUT -> nguồn "degraded" (trả lời không có web).
+    """
+    try:
+        if not WEB_CACHE_ENABLED:
+            return _tavily_search(query), "disabled"
+        return web_cache.search(query, _tavily_search)
+    except ProviderError as e:
+        return f"WEB_ERROR::{e}", "degraded"
+    except Exception as e:
+        return f"WEB_ERROR::{e}", "miss"
 
 
 @tool
 def web_search_tool(query: str) -> str:
     """Use Tavily to perform an up-to-date web search and return text summary."""
+    return web_search(query)[0]
+
+
+async def aweb_search(query: str) -> Tuple[str, str]:
+    """Bản async của web_search (dùng tavily.ainvoke)."""
     try:
-        result = tavily.invoke({"query": query})
-        if isinstance(result, dict) and "results" in result:
-            formatted_results = []
-            for item in result["results"]:
-                title = item.get("title", "No title")
-                content = item.get("content", "No content")
-                url = item.get("url", "")
-                formatted_results.append(
-                    f"Title: {title}\nContent: {content}\nURL: {url}"
-                )
-            return "\n\n".join(formatted_results) if formatted_results else "No results found"
-        else:
-            return str(result)
+        if not WEB_CACHE_ENABLED:
+            return await _atavily_search(query), "disabled"
+        return await web_cache.asearch(query, _atavily_search)
+    except ProviderError as e:
+        return f"WEB_ERROR::{e}", "degraded"
     except Exception as e:
-        # Để cho web_node xử lý chuỗi WEB_ERROR::... và không đưa vào context
-        return f"WEB_ERROR::{e}"
+        return f"WEB_ERROR::{e}", "miss"
+
+
+def get_web_cache_stats() -> Dict[str, int]:
+    return web_cache.stats() if WEB_CACHE_ENABLED else {}
 
 
 # =====================================================================
@@ -55,6 +180,13 @@ class RouteDecision(BaseModel):
         None,
         description="Short friendly reply when route == 'end'.",
     )
+    standalone_query: str | None = Field(
+        None,
+        description=(
+            "Only when the question is a follow-up that depends on the conversation: "
+            "the question rewritten as a self-contained search query. Otherwise null."
+        ),
+    )
 
 
 class RagJudge(BaseModel):
@@ -69,22 +201,43 @@ class RagJudge(BaseModel):
 # LLM INSTANCES (GEMINI)
 # =====================================================================
 
-os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+def _gemini(temperature: float) -> ChatGoogleGenerativeAI:
+    if GOOGLE_API_KEY:
+        os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        temperature=temperature,
+        max_retries=1,  # retry / timeout do resilience.py quản lý theo deadline của node
+    )
 
-router_llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0,
-).with_structured_output(RouteDecision)
 
-judge_llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0,
-).with_structured_output(RagJudge)
+def get_router_llm():
+    return _lazy_client("router_llm", lambda: _gemini(0).with_structured_output(RouteDecision))
+
+
+def get_judge_llm():
+    return _lazy_client("judge_llm", lambda: _gemini(0).with_structured_output(RagJudge))
+
+
+def get_answer_llm():
+    return _lazy_client("answer_llm", lambda: _gemini(0.7))
 
-answer_llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0.7,
-)
+
+# Gom lời gọi router / judge của các query chạy song song (/chat/batch) thành abatch
+router_batcher = LLMBatcher("router", get_router_llm, LLM_BATCH_MAX_SIZE, LLM_BATCH_MAX_WAIT_MS)
+judge_batcher = LLMBatcher("judge", get_judge_llm, LLM_BATCH_MAX_SIZE, LLM_BATCH_MAX_WAIT_MS)
+
+
+def get_llm_batching_stats() -> Dict[str, Dict[str, float]]:
+    return {"router": router_batcher.stats(), "judge": judge_batcher.stats()}
+
+
+# Phân loại route bằng embedding trước router LLM (xem prerouter.py)
+prerouter = PreRouter(get_embeddings, load_exemplars())
+
+
+def get_prerouter_stats() -> Dict[str, object]:
+    return prerouter.stats()
 
 # =====================================================================
 # STATE TYPE
@@ -92,29 +245,105 @@ answer_llm = ChatGoogleGenerativeAI(
 
 class AgentState(TypedDict, total=False):
     """Trạng thái chia sẻ giữa các node LangGraph."""
-    messages: List[BaseMessage]
+    # add_messages: tin nhắn mới được nối vào lịch sử của thread (checkpointer), cắt gọn ở prepare_turn
+    messages: Annotated[List[BaseMessage], add_messages]
+    # Tóm tắt dồn các tin nhắn đã bị cắt khỏi lịch sử (HISTORY_SUMMARIZE)
+    summary: str
+    # Câu hỏi dạng độc lập (router viết lại câu hỏi follow-up) dùng cho RAG / web search
+    search_query: str
     route: Literal["rag", "web", "answer", "end"]
+    # Ai quyết định route: prerouter (embedding) / llm / degraded, kèm điểm của pre-router
+    router_source: str
+    router_score: float
     rag: str
     web: str
     web_search_enabled: bool
+    # Kết quả retrieval chạy song song với router (speculative), rag_node dùng lại nếu có
+    prefetched_docs: Optional[List[Tuple[Document, float]]]
+    # Cách judge quyết định: fast_accept / fast_reject / llm_sufficient / llm_insufficient
+    rag_judge: str
+    rag_top_score: float
+    # Nguồn kết quả web: hit / coalesced / miss / disabled (xem web_cache.py)
+    web_cache: str
+    # Answer cache: hit / miss / off, độ giống với câu hỏi đã cache,
+    # scope [(file, content_hash), ...] tính lúc lookup (dùng lại khi lưu câu trả lời)
+    answer_cache: str
+    answer_cache_similarity: float
+    answer_cache_scope: Optional[List[Tuple[str, str]]]
+    # Các bước chạy ở chế độ degraded trong lượt này (provider quá deadline / lỗi liên tục)
+    degraded: List[str]
+    # Thời gian chạy (ms) của từng node trong lượt này -> TraceEvent.details
+    node_timings: Dict[str, float]
 
 
 # =====================================================================
-# NODE 1: ROUTER
+# NODE HELPERS (DÙNG CHUNG CHO BẢN SYNC & ASYNC)
 # =====================================================================
 
-def router_node(state: AgentState, config: RunnableConfig) -> AgentState:
-    """Quyết định route: rag / web / answer / end."""
-    print("\n--- Entering router_node ---")
-    query = next(
+def _latest_user_query(state: AgentState) -> str:
+    """Lấy câu hỏi mới nhất của user trong state."""
+    return next(
         (m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)),
         "",
     )
 
+
+def _search_query(state: AgentState) -> str:
+    """Query dùng cho retrieval / web: bản viết lại của router nếu có, ngược lại câu hỏi gốc."""
+    return state.get("search_query") or _latest_user_query(state)
+
+
+def _history(state: AgentState) -> List[BaseMessage]:
+    """Các tin nhắn trước câu hỏi hiện tại (đã được cắt gọn ở prepare_turn)."""
+    messages = state["messages"]
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=len(messages))
+    return [m for m in messages[:last_human] if isinstance(m, (HumanMessage, AIMessage))]
+
+
+def _format_messages(messages: List[BaseMessage]) -> str:
+    lines = []
+    for m in messages:
+        role = "User" if isinstance(m, HumanMessage) else "Assistant"
+        content = m.content if isinstance(m.content, str) else str(m.content)
+        if len(content) > HISTORY_MESSAGE_MAX_CHARS:
+            content = content[:HISTORY_MESSAGE_MAX_CHARS] + " ..."
+        lines.append(f"{role}: {content}")
+    return "\n".join(lines)
+
+
+def _conversation_context(state: AgentState) -> str:
+    """Tóm tắt + lịch sử gần đây dạng text cho prompt (rỗng nếu là lượt đầu)."""
+    parts = []
+    if state.get("summary"):
+        parts.append("Summary of earlier conversation:\n" + state["summary"])
+    history = _history(state)
+    if history:
+        parts.append("Recent messages:\n" + _format_messages(history))
+    return "\n\n".join(parts)
+
+
+def _read_settings(config: RunnableConfig):
+    """Đọc web_search_enabled / selected_files từ config.configurable."""
     configurable = config.get("configurable", {}) or {}
     web_search_enabled = configurable.get("web_search_enabled", True)
     selected_files = configurable.get("selected_files", [])
+    return web_search_enabled, selected_files
+
 
+def _batch_llm(config: RunnableConfig) -> bool:
+    """true khi query chạy trong /chat/batch -> router / judge đi qua LLMBatcher."""
+    configurable = config.get("configurable", {}) or {}
+    return bool(configurable.get("batch_llm", False))
+
+
+def _retrieval_mode(config: RunnableConfig) -> str:
+    """Mode retrieval theo request ("dense" | "hybrid"), mặc định RETRIEVAL_MODE."""
+    configurable = config.get("configurable", {}) or {}
+    return configurable.get("retrieval_mode") or RETRIEVAL_MODE
+
+
+def _router_messages(query: str, web_search_enabled: bool, selected_files: List[str], conversation: str = ""):
+    """Tạo prompt cho router."""
     # Prompt mô tả nhiệm vụ router
     system_prompt = """
     You are a routing controller in a QA system. Your job is to decide which information source the agent should use next for the user's query.
@@ -156,21 +385,39 @@ def router_node(state: AgentState, config: RunnableConfig) -> AgentState:
         If the user asks about the content of their documents/PDFs, you should choose the 'rag' route (not 'web').
         """
 
-    messages = [("system", system_prompt), ("user", query)]
-    result: RouteDecision = router_llm.invoke(messages)
+    # Lịch sử hội thoại (đã cắt gọn) -> hiểu câu hỏi follow-up
+    if conversation:
+        system_prompt += f"""
 
-    # Chặn case web_search_disabled nhưng LLM vẫn chọn "web"
-    if not web_search_enabled and result.route == "web":
-        # Nếu có KB thì dùng rag; nếu không thì answer thẳng
-        result.route = "rag" if selected_files else "answer"
+        Conversation so far (for context only):
+        {conversation}
+
+        If the latest question is a follow-up that only makes sense with this conversation
+        (e.g. uses "it", "that", "the second one"), fill "standalone_query" with a self-contained rewrite.
+        """
 
-    print(f"Router decision: {result.route}")
+    return [("system", system_prompt), ("user", query)]
+
+
+def _router_output(
+    state: AgentState,
+    result: RouteDecision,
+    web_search_enabled: bool,
+    selected_files: List[str],
+) -> AgentState:
+    """Hậu xử lý quyết định của router và tạo state đầu ra."""
+    result.route = _effective_route(result.route, web_search_enabled, selected_files)
+    logger.info("Router decision: %s", result.route)
 
     out: AgentState = {
         "messages": state["messages"],
         "route": result.route,
+        "router_source": "llm",
         "web_search_enabled": web_search_enabled,
+        "search_query": (result.standalone_query or "").strip() or _latest_user_query(state),
     }
+    if out["search_query"] != _latest_user_query(state):
+        logger.info("Standalone query: %s", out["search_query"])
 
     # Nếu là small-talk thì trả lời ngay tại đây
     if result.route == "end":
@@ -181,160 +428,225 @@ def router_node(state: AgentState, config: RunnableConfig) -> AgentState:
     return out
 
 
-# =====================================================================
-# NODE 2: RAG LOOKUP
-# =====================================================================
-
-def rag_node(state: AgentState, config: RunnableConfig) -> AgentState:
-    """Tìm kiếm trên vectorstore + dùng judge để đánh giá đủ / chưa."""
-    print("\n--- Entering rag_node ---")
-    query = next(
-        (m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)),
-        "",
+def _effective_route(route: str, web_search_enabled: bool, selected_files: List[str]) -> str:
+    # Chặn case web_search_disabled nhưng LLM vẫn chọn "web"
+    if not web_search_enabled and route == "web":
+        # Nếu có KB thì dùng rag; nếu không thì answer thẳng
+        return "rag" if selected_files else "answer"
+    return route
+
+
+def _degraded_router_output(
+    state: AgentState,
+    error: ProviderError,
+    web_search_enabled: bool,
+    selected_files: List[str],
+) -> AgentState:
+    """Router quá deadline -> có file thì thử RAG, không thì trả lời trực tiếp."""
+    logger.warning("Router degraded (%s).", error)
+    out = _router_output(
+        state,
+        RouteDecision(route="rag" if selected_files else "answer"),
+        web_search_enabled,
+        selected_files,
     )
+    out["router_source"] = "degraded"
+    out["degraded"] = state.get("degraded", []) + ["router"]
+    return out
+
 
+def _prerouter_enabled(config: RunnableConfig) -> bool:
     configurable = config.get("configurable", {}) or {}
-    web_search_enabled = configurable.get("web_search_enabled", True)
-    selected_files = configurable.get("selected_files", [])
+    return configurable.get("use_prerouter", PREROUTER_ENABLED)
+
 
-    print(f"RAG query: {query}")
-    print(f"Web search enabled: {web_search_enabled}")
-    print(f"Selected files: {selected_files}")
+def _preroute_allowed(state: AgentState, web_search_enabled: bool, selected_files: List[str]) -> List[str]:
+    """
+    Route pre-router được tự quyết. Có lịch sử hội thoại -> chỉ "end" (câu follow-up cần router LLM
+    viết lại standalone_query); "rag" chỉ khi có file được chọn, "web" chỉ khi bật web search.
+    """
+    if _conversation_context(state):
+        return ["end"]
+    allowed = ["answer", "end"]
+    if selected_files:
+        allowed.append("rag")
+    if web_search_enabled:
+        allowed.append("web")
+    return allowed
+
+
+def _prerouter_output(
+    state: AgentState,
+    prediction: PreRoute,
+    web_search_enabled: bool,
+    selected_files: List[str],
+) -> AgentState:
+    """Pre-router đủ chắc chắn -> dùng luôn route, không gọi router LLM."""
+    reply = end_reply(_latest_user_query(state)) if prediction.route == "end" else None
+    out = _router_output(state, RouteDecision(route=prediction.route, reply=reply), web_search_enabled, selected_files)
+    out["router_source"] = "prerouter"
+    out["router_score"] = prediction.score
+    return out
 
-    chunks = ""
-    next_route: Literal["answer", "web"] = "answer"
 
-    # Nếu user không chọn file nào -> bỏ qua RAG, chuyển sang web hoặc answer
-    if not selected_files:
-        print("User selected NO files. Skipping RAG retrieval.")
-        chunks = ""
-        next_route = "web" if web_search_enabled else "answer"
-    else:
-        print(f"Searching in specific files: {selected_files}")
-        try:
-            retriever_instance = get_retriever(file_filters=selected_files)
-            docs = retriever_instance.invoke(query)
-            chunks = "\n\n".join(d.page_content for d in docs) if docs else ""
-            print(f"Retrieved {len(docs) if docs else 0} chunks.")
-        except Exception as e:
-            print(f"RAG Error: {e}")
-            chunks = ""
+# Giữ tham chiếu tới các task shadow đang chạy (tránh bị GC giữa chừng)
+_shadow_tasks = set()
 
-        # Không có chunk hữu ích -> fallback web / answer
-        if not chunks:
-            print("No useful RAG chunks. Routing to web/answer.")
-            next_route = "web" if web_search_enabled else "answer"
-        else:
-            # Judge: đánh giá xem chunks có đủ để trả lời không
-            judge_messages = [
-                (
-                    "system",
-                    """
-                    You are a judge evaluating whether the retrieved text is sufficient and relevant to fully answer the user's question.
-
-                    Criteria for sufficiency:
-                    - The retrieved text directly addresses the main question.
-                    - It contains enough detail for a clear and accurate answer.
-                    - It is specific and relevant, not just vague background.
-
-                    NOT sufficient if:
-                    - It is vague, generic, or only partially related.
-                    - It does not clearly answer the user's main question.
-                    - It is obviously incomplete or missing key details.
-                    - There was effectively no useful retrieval (e.g. 'No results found').
-
-                    Respond ONLY with a JSON object of the form:
-                    {"sufficient": true}  or  {"sufficient": false}
-
-                    Examples:
-                    - Question: 'What is the capital of France?'
-                    Retrieved: 'Paris is the capital of France.'
-                    -> {"sufficient": true}
-
-                    - Question: 'What are the symptoms of diabetes?'
-                    Retrieved: 'Diabetes is a chronic condition.'
-                    -> {"sufficient": false}  (does not list symptoms)
-
-                    - Question: 'How to fix error X in software Y?'
-                    Retrieved: 'No relevant information found.'
-                    -> {"sufficient": false}
-                    """,
-                ),
-                (
-                    "user",
-                    f"Question: {query}\n\nRetrieved info:\n{chunks}\n\nIs this sufficient to answer the question? Respond ONLY with JSON.",
-                ),
-            ]
-
-            verdict: RagJudge = judge_llm.invoke(judge_messages)
-            print(f"RAG Judge verdict: {verdict.sufficient}")
-
-            if verdict.sufficient:
-                next_route = "answer"
-            else:
-                next_route = "web" if web_search_enabled else "answer"
-                print(f"RAG not sufficient. Next route: {next_route}")
-
-    print(f"RAG node decided next_route = {next_route}")
-    print("--- Exiting rag_node ---")
+
+async def _shadow_route(prediction: PreRoute, messages, web_search_enabled: bool, selected_files: List[str]):
+    """Router LLM chạy nền cho query pre-router đã quyết định -> chỉ để đo độ khớp."""
+    try:
+        result: RouteDecision = await gemini.arun(
+            "router_shadow", lambda: get_router_llm().ainvoke(messages), ROUTER_TIMEOUT
+        )
+    except Exception as e:
+        logger.debug("Shadow router call failed: %s", e)
+        return
+    route = _effective_route(result.route, web_search_enabled, selected_files)
+    prerouter.record_agreement(prediction, route, "shadow")
+
+
+def _judge_messages(query: str, chunks: str):
+    """Prompt cho judge đánh giá chunks RAG."""
+    return [
+        (
+            "system",
+            """
+            You are a judge evaluating whether the retrieved text is sufficient and relevant to fully answer the user's question.
+
+            Criteria for sufficiency:
+            - The retrieved text directly addresses the main question.
+            - It contains enough detail for a clear and accurate answer.
+            - It is specific and relevant, not just vague background.
+
+            NOT sufficient if:
+            - It is vague, generic, or only partially related.
+            - It does not clearly answer the user's main question.
+            - It is obviously incomplete or missing key details.
+            - There was effectively no useful retrieval (e.g. 'No results found').
+
+            Respond ONLY with a JSON object of the form:
+            {"sufficient": true}  or  {"sufficient": false}
+
+            Examples:
+            - Question: 'What is the capital of France?'
+            Retrieved: 'Paris is the capital of France.'
+            -> {"sufficient": true}
+
+            - Question: 'What are the symptoms of diabetes?'
+            Retrieved: 'Diabetes is a chronic condition.'
+            -> {"sufficient": false}  (does not list symptoms)
+
+            - Question: 'How to fix error X in software Y?'
+            Retrieved: 'No relevant information found.'
+            -> {"sufficient": false}
+            """,
+        ),
+        (
+            "user",
+            f"Question: {query}\n\nRetrieved info:\n{chunks}\n\nIs this sufficient to answer the question? Respond ONLY with JSON.",
+        ),
+    ]
+
+
+def _rag_output(
+    state: AgentState,
+    chunks: str,
+    next_route: Literal["answer", "web"],
+    web_search_enabled: bool,
+    judge_path: str = "",
+    top_score: float = 0.0,
+) -> AgentState:
+    logger.info("RAG node decided next_route = %s", next_route)
+    CONTEXT_CHARS.labels(source="rag").observe(len(chunks))
 
     return {
         **state,
         "rag": chunks,
         "route": next_route,
         "web_search_enabled": web_search_enabled,
+        "rag_judge": judge_path,
+        "rag_top_score": top_score,
     }
 
 
-# =====================================================================
-# NODE 3: WEB SEARCH
-# =====================================================================
+# Đếm số lần mỗi nhánh judge được dùng (phục vụ hiệu chỉnh ngưỡng)
+judge_stats: Counter = Counter()
 
-def web_node(state: AgentState, config: RunnableConfig) -> AgentState:
-    """Gọi Tavily để lấy kết quả web."""
-    print("\n--- Entering web_node ---")
-    query = next(
-        (m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)),
-        "",
-    )
 
-    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True)
+def get_judge_stats() -> Dict[str, int]:
+    return dict(judge_stats)
 
-    # Nếu web bị tắt -> ghi chú + route sang answer
-    if not web_search_enabled:
-        return {**state, "web": "Web search disabled.", "route": "answer"}
 
-    snippets = web_search_tool.invoke(query)
-    if snippets.startswith("WEB_ERROR::"):
-        # Lỗi Tavily -> không đưa lỗi vào context
-        print(snippets)
-        snippets = ""
+def _fast_judge(scores: List[float]) -> Optional[bool]:
+    """
+    Quyết định cục bộ theo điểm similarity, không gọi LLM:
+    True = chắc chắn đủ, False = chắc chắn không đủ, None = không chắc -> hỏi judge LLM.
+    """
+    if not RAG_JUDGE_FAST_PATH or not scores:
+        return None
+    if sum(1 for score in scores if score >= RAG_ACCEPT_SCORE) >= RAG_ACCEPT_MIN_CHUNKS:
+        return True
+    if max(scores) < RAG_REJECT_SCORE:
+        return False
+    return None
+
+
+def _route_for(sufficient: bool, web_search_enabled: bool) -> Literal["answer", "web"]:
+    if sufficient:
+        return "answer"
+
+    next_route = "web" if web_search_enabled else "answer"
+    logger.info("RAG not sufficient. Next route: %s", next_route)
+    return next_route
+
+
+def _after_judge(verdict: RagJudge, web_search_enabled: bool) -> Literal["answer", "web"]:
+    logger.info("RAG Judge verdict: %s", verdict.sufficient)
+    judge_stats["llm_sufficient" if verdict.sufficient else "llm_insufficient"] += 1
+    return _route_for(verdict.sufficient, web_search_enabled)
+
+
+def _after_fast_judge(sufficient: bool, top_score: float, web_search_enabled: bool) -> Literal["answer", "web"]:
+    logger.info("RAG fast-path verdict: %s (top score %.3f), judge LLM skipped.", sufficient, top_score)
+    judge_stats["fast_accept" if sufficient else "fast_reject"] += 1
+    return _route_for(sufficient, web_search_enabled)
+
+
+def _degraded_judge_output(
+    state: AgentState,
+    chunks: str,
+    error: ProviderError,
+    web_search_enabled: bool,
+    top_score: float,
+) -> AgentState:
+    """Judge quá deadline -> coi chunks là đủ, trả lời luôn từ tài liệu."""
+    logger.warning("RAG judge degraded (%s). Treating retrieved chunks as sufficient.", error)
+    judge_stats["degraded_accept"] += 1
+    out = _rag_output(state, chunks, "answer", web_search_enabled, "degraded_accept", top_score)
+    out["degraded"] = state.get("degraded", []) + ["judge"]
+    return out
 
-    return {**state, "web": snippets, "route": "answer"}
 
+DEGRADED_ANSWER = (
+    "Xin lỗi, hệ thống đang quá tải nên chưa thể tạo câu trả lời lúc này. "
+    "Vui lòng thử lại sau ít phút."
+)
 
-# =====================================================================
-# NODE 4: ANSWER
-# =====================================================================
 
-def answer_node(state: AgentState, config: RunnableConfig) -> AgentState:
+def _answer_prompt(state: AgentState, config: RunnableConfig):
     """
-    Node cuối cùng sinh câu trả lời:
-    - Ghép context từ RAG + Web.
-    - Tôn trọng trạng thái: có/không có KB, có/không có web.
+    Ghép context + prompt cho answer node.
+    Trả về (câu trả lời cố định, None) nếu không cần gọi LLM, ngược lại (None, prompt).
     """
-    print("\n--- Entering answer_node ---")
-    user_q = next(
-        (m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)),
-        "",
-    )
-
-    configurable = config.get("configurable", {}) or {}
-    selected_files = configurable.get("selected_files", [])
-    web_search_enabled = configurable.get("web_search_enabled", True)
+    user_q = _latest_user_query(state)
+    web_search_enabled, selected_files = _read_settings(config)
 
     # Ghép context từ state
     ctx_parts: List[str] = []
+    conversation = _conversation_context(state)
+    if conversation:
+        ctx_parts.append("Conversation History:\n" + conversation)
     if state.get("rag"):
         ctx_parts.append("Knowledge Base Info:\n" + state["rag"])
     if state.get("web") and not state["web"].startswith("Web search disabled"):
@@ -351,16 +663,13 @@ def answer_node(state: AgentState, config: RunnableConfig) -> AgentState:
     )
     no_rag_context = not state.get("rag")
 
-    if no_kb and no_web_allowed and no_web_context and no_rag_context:
-        print("No KB, no web, no external context -> returning explicit 'I don't know'.")
+    if no_kb and no_web_allowed and no_web_context and no_rag_context and not conversation:
+        logger.info("No KB, no web, no external context -> returning explicit 'I don't know'.")
         ans = (
             "Hiện tại tôi không có tài liệu nào để tham chiếu và chức năng tìm kiếm web đang bị tắt, "
             "nên tôi không đủ thông tin để trả lời chính xác câu hỏi này."
         )
-        return {
-            **state,
-            "messages": state["messages"] + [AIMessage(content=ans)],
-        }
+        return ans, None
 
     # NOTE cho LLM: có / không có tài liệu
     if not selected_files:
@@ -400,11 +709,519 @@ def answer_node(state: AgentState, config: RunnableConfig) -> AgentState:
     - Never pretend to have read a document that does not appear in the context.
     """.strip()
 
-    ans = answer_llm.invoke([HumanMessage(content=prompt)]).content
+    return None, prompt
+
+
+# =====================================================================
+# NODE 0: PREPARE TURN (RESET STATE THEO LƯỢT + CẮT GỌN LỊCH SỬ)
+# =====================================================================
+
+# Field chỉ có ý nghĩa trong một lượt -> reset khi bắt đầu lượt mới (state được checkpoint giữa các lượt)
+_TURN_RESET: AgentState = {
+    "rag": "",
+    "web": "",
+    "search_query": "",
+    "router_source": "",
+    "router_score": 0.0,
+    "prefetched_docs": None,
+    "rag_judge": "",
+    "rag_top_score": 0.0,
+    "web_cache": "",
+    "answer_cache": "",
+    "answer_cache_similarity": 0.0,
+    "answer_cache_scope": None,
+    "degraded": [],
+    "node_timings": {},
+}
+
+
+def _split_history(state: AgentState) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+    """
+    Chia lịch sử thành (phần bị cắt, phần giữ lại): giữ HISTORY_MAX_MESSAGES tin nhắn cuối,
+    phần giữ lại luôn bắt đầu bằng câu hỏi của user.
+    """
+    messages = state.get("messages", [])
+    if len(messages) <= HISTORY_MAX_MESSAGES:
+        return [], messages
+    cut = len(messages) - HISTORY_MAX_MESSAGES
+    while cut < len(messages) - 1 and not isinstance(messages[cut], HumanMessage):
+        cut += 1
+    return messages[:cut], messages[cut:]
+
+
+def _summary_messages(summary: str, dropped: List[BaseMessage]):
+    return [
+        (
+            "system",
+            "Update the running summary of a conversation between a user and an assistant. "
+            "Keep facts, names, document references and open questions; drop greetings. "
+            f"Answer with the new summary only, at most {HISTORY_SUMMARY_MAX_CHARS} characters.",
+        ),
+        ("user", f"Current summary:\n{summary or '(empty)'}\n\nMessages to fold in:\n{_format_messages(dropped)}"),
+    ]
+
+
+def _prepare_output(dropped: List[BaseMessage], summary: Optional[str]) -> AgentState:
+    out: AgentState = dict(_TURN_RESET)
+    if dropped:
+        logger.info("Trimming %d old messages from conversation history.", len(dropped))
+        out["messages"] = [RemoveMessage(id=m.id) for m in dropped if m.id]
+    if summary is not None:
+        out["summary"] = summary[:HISTORY_SUMMARY_MAX_CHARS]
+    return out
+
+
+def prepare_turn_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Reset field theo lượt, cắt lịch sử về HISTORY_MAX_MESSAGES (tuỳ chọn tóm tắt phần bị cắt)."""
+    dropped, _ = _split_history(state)
+    summary = None
+    if dropped and HISTORY_SUMMARIZE:
+        messages = _summary_messages(state.get("summary", ""), dropped)
+        observe_prompt("summary", messages)
+        try:
+            summary = gemini.run("summary", lambda: get_answer_llm().invoke(messages), SUMMARY_TIMEOUT).content
+        except ProviderError as e:
+            # Degraded: chỉ cắt lịch sử, giữ tóm tắt cũ
+            logger.warning("History summary skipped: %s", e)
+    return _prepare_output(dropped, summary)
+
+
+async def aprepare_turn_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Bản async của prepare_turn_node."""
+    dropped, _ = _split_history(state)
+    summary = None
+    if dropped and HISTORY_SUMMARIZE:
+        messages = _summary_messages(state.get("summary", ""), dropped)
+        observe_prompt("summary", messages)
+        try:
+            summary = (await gemini.arun("summary", lambda: get_answer_llm().ainvoke(messages), SUMMARY_TIMEOUT)).content
+        except ProviderError as e:
+            logger.warning("History summary skipped: %s", e)
+    return _prepare_output(dropped, summary)
+
+
+# =====================================================================
+# NODE 0b: ANSWER CACHE
+# =====================================================================
+
+def _answer_cache_enabled(config: RunnableConfig) -> bool:
+    configurable = config.get("configurable", {}) or {}
+    use_cache = configurable.get("use_answer_cache")
+    return ANSWER_CACHE_ENABLED if use_cache is None else use_cache
+
+
+def _answer_cache_scope(selected_files: List[str]) -> List[Tuple[str, str]]:
+    """Phiên bản index của từng file được chọn (content_hash trong catalog)."""
+    scope = []
+    for name in sorted(set(selected_files)):
+        entry = catalog.get(name)
+        scope.append((name, entry.content_hash if entry else ""))
+    return scope
+
+
+def _cache_key(scope: List[Tuple[str, str]], web_search_enabled: bool):
+    return tuple(tuple(item) for item in scope), web_search_enabled
+
+
+def _cache_lookup_output(state: AgentState, hit: Optional[Tuple[str, float]], scope) -> AgentState:
+    if hit is None:
+        logger.info("Answer cache miss.")
+        return {**state, "answer_cache": "miss", "answer_cache_scope": scope}
+
+    answer, similarity = hit
+    logger.info("Answer cache hit (similarity %.3f). Skipping router/rag/judge/answer.", similarity)
+    return {
+        **state,
+        "messages": state["messages"] + [AIMessage(content=answer)],
+        "route": "end",
+        "answer_cache": "hit",
+        "answer_cache_similarity": similarity,
+        "answer_cache_scope": scope,
+    }
+
+
+def cache_lookup_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Tra answer cache trước router: trúng -> trả lời ngay, không gọi LLM nào."""
+    if not _answer_cache_enabled(config) or _conversation_context(state):
+        return {**state, "answer_cache": "off"}
+
+    query = _latest_user_query(state)
+    web_search_enabled, selected_files = _read_settings(config)
+    try:
+        scope = _answer_cache_scope(selected_files)
+        hit = answer_cache.lookup(query, get_embeddings().embed_query(query), _cache_key(scope, web_search_enabled))
+    except Exception as e:
+        logger.error("Answer cache lookup error: %s", e)
+        return {**state, "answer_cache": "off"}
+    return _cache_lookup_output(state, hit, scope)
+
+
+async def acache_lookup_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Bản async của cache_lookup_node."""
+    if not _answer_cache_enabled(config) or _conversation_context(state):
+        return {**state, "answer_cache": "off"}
+
+    query = _latest_user_query(state)
+    web_search_enabled, selected_files = _read_settings(config)
+    try:
+        # Vector query nằm trong LRU của embedding cache -> rag_node không phải embed lại
+        query_vector = await get_embeddings().aembed_query(query)
+        scope = await asyncio.to_thread(_answer_cache_scope, selected_files)
+        hit = answer_cache.lookup(query, query_vector, _cache_key(scope, web_search_enabled))
+    except Exception as e:
+        logger.error("Answer cache lookup error: %s", e)
+        return {**state, "answer_cache": "off"}
+    return _cache_lookup_output(state, hit, scope)
+
+
+def _should_store_answer(state: AgentState) -> bool:
+    if state.get("answer_cache") != "miss" or state.get("answer_cache_scope") is None:
+        return False
+    used_web = bool(state.get("web")) and not state["web"].startswith("Web search disabled")
+    return ANSWER_CACHE_WEB or not used_web
+
+
+# =====================================================================
+# NODE 1: ROUTER
+# =====================================================================
+
+def router_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Quyết định route: rag / web / answer / end."""
+    query = _latest_user_query(state)
+    web_search_enabled, selected_files = _read_settings(config)
+
+    prediction = None
+    if _prerouter_enabled(config):
+        try:
+            prediction = prerouter.classify(query, _preroute_allowed(state, web_search_enabled, selected_files))
+        except Exception as e:
+            logger.warning("Pre-router failed: %s", e)
+        if prediction is not None and prediction.confident:
+            return _prerouter_output(state, prediction, web_search_enabled, selected_files)
+
+    messages = _router_messages(query, web_search_enabled, selected_files, _conversation_context(state))
+    observe_prompt("router", messages)
+    try:
+        result: RouteDecision = gemini.run("router", lambda: get_router_llm().invoke(messages), ROUTER_TIMEOUT)
+    except ProviderError as e:
+        return _degraded_router_output(state, e, web_search_enabled, selected_files)
+
+    out = _router_output(state, result, web_search_enabled, selected_files)
+    if prediction is not None:
+        prerouter.record_agreement(prediction, out["route"], "fallback")
+    return out
+
+
+def _speculative_enabled(config: RunnableConfig) -> bool:
+    configurable = config.get("configurable", {}) or {}
+    return configurable.get("speculative_retrieval", SPECULATIVE_RETRIEVAL)
+
+
+async def arouter_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """
+    Bản async của router_node.
+    Speculative mode: có file được chọn -> embed query + search Qdrant chạy song song với router LLM;
+    dùng kết quả nếu router chọn "rag", huỷ nếu chọn route khác.
+    Pre-router đủ chắc chắn -> trả route ngay (shadow: vẫn gọi router LLM chạy nền để đo độ khớp).
+    """
+    query = _latest_user_query(state)
+    web_search_enabled, selected_files = _read_settings(config)
+
+    prediction = None
+    if _prerouter_enabled(config):
+        allowed = _preroute_allowed(state, web_search_enabled, selected_files)
+        try:
+            prediction = await asyncio.to_thread(prerouter.classify, query, allowed)
+        except Exception as e:
+            logger.warning("Pre-router failed: %s", e)
+        if prediction is not None and prediction.confident:
+            out = _prerouter_output(state, prediction, web_search_enabled, selected_files)
+            out["prefetched_docs"] = None
+            if prerouter.should_shadow():
+                messages = _router_messages(query, web_search_enabled, selected_files, _conversation_context(state))
+                task = asyncio.create_task(_shadow_route(prediction, messages, web_search_enabled, selected_files))
+                _shadow_tasks.add(task)
+                task.add_done_callback(_shadow_tasks.discard)
+            return out
+
+    retrieval_task = None
+    if selected_files and _speculative_enabled(config):
+        retrieval_task = asyncio.create_task(asearch_documents_with_scores(
+            query, file_filters=selected_files, mode=_retrieval_mode(config)
+        ))
+
+    messages = _router_messages(query, web_search_enabled, selected_files, _conversation_context(state))
+    observe_prompt("router", messages)
+    try:
+        if _batch_llm(config):
+            call = lambda: router_batcher.submit(messages)
+        else:
+            call = lambda: get_router_llm().ainvoke(messages, config)
+        result: RouteDecision = await gemini.arun("router", call, ROUTER_TIMEOUT)
+        out = _router_output(state, result, web_search_enabled, selected_files)
+        if prediction is not None:
+            prerouter.record_agreement(prediction, out["route"], "fallback")
+    except ProviderError as e:
+        # Speculative retrieval (nếu có) vẫn dùng được vì route degraded là "rag" khi có file
+        out = _degraded_router_output(state, e, web_search_enabled, selected_files)
+    except BaseException:
+        if retrieval_task is not None:
+            retrieval_task.cancel()
+        raise
+    out["prefetched_docs"] = None
+
+    if retrieval_task is not None:
+        # Router viết lại câu hỏi follow-up -> kết quả search theo câu gốc không dùng được
+        if out["route"] == "rag" and out["search_query"] == query:
+            try:
+                out["prefetched_docs"] = await retrieval_task
+                logger.info("Speculative retrieval hit: %d chunks ready.", len(out["prefetched_docs"]))
+            except Exception as e:
+                # rag_node sẽ tự search lại
+                logger.warning("Speculative retrieval failed: %s", e)
+        else:
+            retrieval_task.cancel()
+            logger.info("Speculative retrieval discarded (route != rag or query rewritten).")
+
+    return out
+
+
+# =====================================================================
+# NODE 2: RAG LOOKUP
+# =====================================================================
+
+def rag_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Tìm kiếm trên vectorstore + dùng judge để đánh giá đủ / chưa."""
+    query = _search_query(state)
+    web_search_enabled, selected_files = _read_settings(config)
+
+    logger.debug(
+        "RAG query: %s | web: %s | files: %s | mode: %s",
+        query, web_search_enabled, selected_files, _retrieval_mode(config),
+    )
+
+    # Nếu user không chọn file nào -> bỏ qua RAG, chuyển sang web hoặc answer
+    if not selected_files:
+        logger.info("User selected NO files. Skipping RAG retrieval.")
+        return _rag_output(state, "", "web" if web_search_enabled else "answer", web_search_enabled)
+
+    try:
+        # Vector store dùng chung, bộ lọc file truyền theo request
+        scored_docs = search_documents_with_scores(
+            query, file_filters=selected_files, mode=_retrieval_mode(config)
+        )
+        chunks = "\n\n".join(d.page_content for d, _ in scored_docs) if scored_docs else ""
+        logger.info("Retrieved %d chunks.", len(scored_docs))
+    except Exception as e:
+        logger.error("RAG Error: %s", e)
+        scored_docs, chunks = [], ""
+
+    # Không có chunk hữu ích -> fallback web / answer
+    if not chunks:
+        logger.info("No useful RAG chunks. Routing to web/answer.")
+        return _rag_output(state, "", "web" if web_search_enabled else "answer", web_search_enabled)
+
+    scores = [score for _, score in scored_docs]
+    top_score = max(scores)
+
+    # Điểm similarity đủ rõ ràng -> quyết định ngay, không gọi judge LLM
+    # (fast_reject: chunk gần như không liên quan -> không đưa vào prompt answer)
+    fast_verdict = _fast_judge(scores)
+    if fast_verdict is not None:
+        next_route = _after_fast_judge(fast_verdict, top_score, web_search_enabled)
+        judge_path = "fast_accept" if fast_verdict else "fast_reject"
+        return _rag_output(state, chunks if fast_verdict else "", next_route, web_search_enabled, judge_path, top_score)
+
+    # Judge: đánh giá xem chunks có đủ để trả lời không
+    messages = _judge_messages(query, chunks)
+    observe_prompt("judge", messages)
+    try:
+        verdict: RagJudge = gemini.run("judge", lambda: get_judge_llm().invoke(messages), JUDGE_TIMEOUT)
+    except ProviderError as e:
+        return _degraded_judge_output(state, chunks, e, web_search_enabled, top_score)
+    next_route = _after_judge(verdict, web_search_enabled)
+    judge_path = "llm_sufficient" if verdict.sufficient else "llm_insufficient"
+
+    return _rag_output(state, chunks, next_route, web_search_enabled, judge_path, top_score)
+
+
+async def arag_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Bản async của rag_node (AsyncQdrantClient + judge_llm.ainvoke)."""
+    query = _search_query(state)
+    web_search_enabled, selected_files = _read_settings(config)
+
+    logger.debug("RAG query: %s | files: %s", query, selected_files)
+
+    if not selected_files:
+        logger.info("User selected NO files. Skipping RAG retrieval.")
+        return _rag_output(state, "", "web" if web_search_enabled else "answer", web_search_enabled)
+
+    # Dùng kết quả speculative retrieval từ router nếu có (chỉ dùng 1 lần)
+    scored_docs = state.get("prefetched_docs")
+    state = {**state, "prefetched_docs": None}
+
+    try:
+        if scored_docs is None:
+            scored_docs = await asearch_documents_with_scores(
+                query, file_filters=selected_files, mode=_retrieval_mode(config)
+            )
+        chunks = "\n\n".join(d.page_content for d, _ in scored_docs) if scored_docs else ""
+        logger.info("Retrieved %d chunks.", len(scored_docs))
+    except Exception as e:
+        logger.error("RAG Error: %s", e)
+        scored_docs, chunks = [], ""
+
+    if not chunks:
+        logger.info("No useful RAG chunks. Routing to web/answer.")
+        return _rag_output(state, "", "web" if web_search_enabled else "answer", web_search_enabled)
+
+    scores = [score for _, score in scored_docs]
+    top_score = max(scores)
+
+    fast_verdict = _fast_judge(scores)
+    if fast_verdict is not None:
+        next_route = _after_fast_judge(fast_verdict, top_score, web_search_enabled)
+        judge_path = "fast_accept" if fast_verdict else "fast_reject"
+        return _rag_output(state, chunks if fast_verdict else "", next_route, web_search_enabled, judge_path, top_score)
+
+    messages = _judge_messages(query, chunks)
+    observe_prompt("judge", messages)
+    try:
+        if _batch_llm(config):
+            call = lambda: judge_batcher.submit(messages)
+        else:
+            call = lambda: get_judge_llm().ainvoke(messages, config)
+        verdict: RagJudge = await gemini.arun("judge", call, JUDGE_TIMEOUT)
+    except ProviderError as e:
+        return _degraded_judge_output(state, chunks, e, web_search_enabled, top_score)
+    next_route = _after_judge(verdict, web_search_enabled)
+    judge_path = "llm_sufficient" if verdict.sufficient else "llm_insufficient"
+
+    return _rag_output(state, chunks, next_route, web_search_enabled, judge_path, top_score)
+
+
+# =====================================================================
+# NODE 3: WEB SEARCH
+# =====================================================================
+
+def web_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Gọi Tavily để lấy kết quả web."""
+    query = _search_query(state)
+    web_search_enabled, _ = _read_settings(config)
+
+    # Nếu web bị tắt -> ghi chú + route sang answer
+    if not web_search_enabled:
+        return {**state, "web": "Web search disabled.", "route": "answer"}
+
+    snippets, cache_status = web_search(query)
+    logger.info("Web search cache: %s", cache_status)
+    if snippets.startswith("WEB_ERROR::"):
+        # Lỗi Tavily -> không đưa lỗi vào context
+        logger.warning("Web search error: %s", snippets[len("WEB_ERROR::"):])
+        snippets = ""
+    CONTEXT_CHARS.labels(source="web").observe(len(snippets))
+
+    degraded = state.get("degraded", [])
+    if cache_status == "degraded":
+        degraded = degraded + ["web"]
+    return {**state, "web": snippets, "route": "answer", "web_cache": cache_status, "degraded": degraded}
+
+
+async def aweb_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Bản async của web_node."""
+    query = _search_query(state)
+    web_search_enabled, _ = _read_settings(config)
+
+    if not web_search_enabled:
+        return {**state, "web": "Web search disabled.", "route": "answer"}
+
+    snippets, cache_status = await aweb_search(query)
+    logger.info("Web search cache: %s", cache_status)
+    if snippets.startswith("WEB_ERROR::"):
+        logger.warning("Web search error: %s", snippets[len("WEB_ERROR::"):])
+        snippets = ""
+    CONTEXT_CHARS.labels(source="web").observe(len(snippets))
+
+    degraded = state.get("degraded", [])
+    if cache_status == "degraded":
+        degraded = degraded + ["web"]
+    return {**state, "web": snippets, "route": "answer", "web_cache": cache_status, "degraded": degraded}
+
+
+# =====================================================================
+# NODE 4: ANSWER
+# =====================================================================
+
+def answer_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """
+    Node cuối cùng sinh câu trả lời:
+    - Ghép context từ RAG + Web.
+    - Tôn trọng trạng thái: có/không có KB, có/không có web.
+    """
+    ans, prompt = _answer_prompt(state, config)
+
+    degraded = state.get("degraded", [])
+    if prompt is not None:
+        messages = [HumanMessage(content=prompt)]
+        observe_prompt("answer", messages)
+        try:
+            ans = gemini.run("answer", lambda: get_answer_llm().invoke(messages), ANSWER_TIMEOUT).content
+        except ProviderError as e:
+            logger.warning("Answer degraded (%s).", e)
+            ans, degraded = DEGRADED_ANSWER, degraded + ["answer"]
+        else:
+            if _should_store_answer(state):
+                web_search_enabled, selected_files = _read_settings(config)
+                query = _latest_user_query(state)
+                answer_cache.store(
+                    query,
+                    get_embeddings().embed_query(query),
+                    ans,
+                    _cache_key(state["answer_cache_scope"], web_search_enabled),
+                    selected_files,
+                )
 
     return {
         **state,
         "messages": state["messages"] + [AIMessage(content=ans)],
+        "degraded": degraded,
+    }
+
+
+async def aanswer_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Bản async của answer_node."""
+    ans, prompt = _answer_prompt(state, config)
+
+    degraded = state.get("degraded", [])
+    if prompt is not None:
+        messages = [HumanMessage(content=prompt)]
+        observe_prompt("answer", messages)
+        try:
+            ans = (await gemini.arun(
+                "answer",
+                lambda: get_answer_llm().ainvoke(messages, config),
+                ANSWER_TIMEOUT,
+                retries=0,  # token đã stream ra client thì không sinh lại từ đầu
+            )).content
+        except ProviderError as e:
+            logger.warning("Answer degraded (%s).", e)
+            ans, degraded = DEGRADED_ANSWER, degraded + ["answer"]
+        else:
+            if _should_store_answer(state):
+                web_search_enabled, selected_files = _read_settings(config)
+                query = _latest_user_query(state)
+                answer_cache.store(
+                    query,
+                    await get_embeddings().aembed_query(query),
+                    ans,
+                    _cache_key(state["answer_cache_scope"], web_search_enabled),
+                    selected_files,
+                )
+
+    return {
+        **state,
+        "messages": state["messages"] + [AIMessage(content=ans)],
+        "degraded": degraded,
     }
 
 
@@ -412,6 +1229,11 @@ def answer_node(state: AgentState, config: RunnableConfig) -> AgentState:
 # GRAPH BUILD
 # =====================================================================
 
+def after_cache_lookup(st: AgentState) -> Literal["router", "end"]:
+    """Answer cache trúng -> kết thúc, ngược lại vào router."""
+    return "end" if st.get("answer_cache") == "hit" else "router"
+
+
 def from_router(st: AgentState) -> Literal["rag", "web", "answer", "end"]:
     """Mapping route sau router -> node tiếp theo."""
     return st["route"]
@@ -422,18 +1244,68 @@ def after_rag(st: AgentState) -> Literal["answer", "web"]:
     return st["route"]
 
 
-def build_agent():
-    """Khởi tạo và compile LangGraph agent."""
-    g = StateGraph(AgentState)
+# =====================================================================
+# ĐO THỜI GIAN NODE
+# =====================================================================
+
+def _with_timing(name: str, state: AgentState, out: AgentState, seconds: float) -> AgentState:
+    NODE_DURATION.labels(node=name).observe(seconds)
+    logger.debug("Node %s finished in %.1f ms", name, seconds * 1000, extra={"node": name, "duration_ms": seconds * 1000})
+    # prepare_turn reset node_timings trong output -> lấy từ output nếu có, không thì từ state
+    timings = out["node_timings"] if "node_timings" in out else (state.get("node_timings") or {})
+    return {**out, "node_timings": {**timings, name: round(seconds * 1000, 1)}}
+
+
+def _timed_node(name: str, func, afunc) -> RunnableLambda:
+    """Bọc node (bản sync + async): histogram Prometheus + ghi thời gian vào state."""
+
+    def run(state: AgentState, config: RunnableConfig) -> AgentState:
+        t0 = time.perf_counter()
+        try:
+            out = func(state, config)
+        except Exception:
+            NODE_ERRORS.labels(node=name).inc()
+            raise
+        return _with_timing(name, state, out, time.perf_counter() - t0)
+
+    async def arun(state: AgentState, config: RunnableConfig) -> AgentState:
+        t0 = time.perf_counter()
+        try:
+            out = await afunc(state, config)
+        except Exception:
+            NODE_ERRORS.labels(node=name).inc()
+            raise
+        return _with_timing(name, state, out, time.perf_counter() - t0)
+
+    return RunnableLambda(run, afunc=arun, name=name)
 
-    # Đăng ký node
-    g.add_node("router", router_node)
-    g.add_node("rag_lookup", rag_node)
-    g.add_node("web_search", web_node)
-    g.add_node("answer", answer_node)
 
-    # Entry point
-    g.set_entry_point("router")
+def build_agent(checkpointer=None):
+    """
+    Khởi tạo và compile LangGraph agent.
+    checkpointer: lưu state theo thread_id (session) giữa các lượt; None = mỗi lượt độc lập.
+    """
+    g = StateGraph(AgentState)
+
+    # Đăng ký node (mỗi node có bản sync cho stream() và bản async cho astream())
+    g.add_node("prepare_turn", _timed_node("prepare_turn", prepare_turn_node, aprepare_turn_node))
+    g.add_node("cache_lookup", _timed_node("cache_lookup", cache_lookup_node, acache_lookup_node))
+    g.add_node("router", _timed_node("router", router_node, arouter_node))
+    g.add_node("rag_lookup", _timed_node("rag_lookup", rag_node, arag_node))
+    g.add_node("web_search", _timed_node("web_search", web_node, aweb_node))
+    g.add_node("answer", _timed_node("answer", answer_node, aanswer_node))
+
+    # Entry point: reset / cắt lịch sử -> answer cache -> router
+    g.set_entry_point("prepare_turn")
+    g.add_edge("prepare_turn", "cache_lookup")
+    g.add_conditional_edges(
+        "cache_lookup",
+        after_cache_lookup,
+        {
+            "router": "router",
+            "end": END,
+        },
+    )
 
     # Router -> next node
     g.add_conditional_edges(
@@ -463,9 +1335,7 @@ def build_agent():
     # Answer là node cuối
     g.add_edge("answer", END)
 
-    # Nếu sau này muốn checkpoint thì dùng:
-    # return g.compile(checkpointer=MemorySaver())
-    return g.compile()
+    return g.compile(checkpointer=checkpointer)
 
 
 rag_agent = build_agent()
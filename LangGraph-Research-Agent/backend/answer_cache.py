@@ -0,0 +1,164 @@
+# answer_cache.py
+import itertools
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import (
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_POLICY,
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_TTL,
+)
+from web_cache import normalize_query
+
+
+@dataclass
+class CachedAnswer:
+    """Một câu trả lời đã sinh, gắn với phạm vi (file đã chọn + phiên bản index)."""
+    query: str
+    vector: np.ndarray  # vector query đã chuẩn hoá (norm = 1)
+    answer: str
+    scope: Hashable
+    files: Tuple[str, ...]
+    created_at: float
+    hits: int = 0
+
+
+class AnswerCache:
+    """
+    Cache câu trả lời cuối cùng của agent:
+    - Khớp query giống hệt (sau chuẩn hoá) hoặc gần giống (cosine >= similarity_threshold).
+    - Chỉ khớp trong cùng scope: tập file đã chọn + content_hash của từng file trong catalog
+      (+ web bật/tắt) -> file được ingest lại thì entry cũ tự hết hiệu lực.
+    - Giới hạn max_entries, bỏ entry theo policy: lru | lfu | fifo. Entry quá ttl_seconds bị bỏ.
+    """
+
+    def __init__(self, max_entries: int, similarity_threshold: float, ttl_seconds: float, policy: str = "lru"):
+        if policy not in ("lru", "lfu", "fifo"):
+            raise ValueError(f"Unknown answer cache policy: {policy}")
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.policy = policy
+
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._by_scope: Dict[Hashable, List[int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stats: Counter = Counter()
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _remove_locked(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        ids = self._by_scope.get(entry.scope, [])
+        if entry_id in ids:
+            ids.remove(entry_id)
+        if not ids:
+            self._by_scope.pop(entry.scope, None)
+
+    def _evict_locked(self):
+        while len(self._entries) > self.max_entries:
+            if self.policy == "lfu":
+                victim = min(self._entries, key=lambda entry_id: self._entries[entry_id].hits)
+            else:
+                # lru: entry được dùng gần đây nằm cuối; fifo: giữ nguyên thứ tự thêm vào
+                victim = next(iter(self._entries))
+            self._remove_locked(victim)
+            self._stats["evicted"] += 1
+
+    def lookup(self, query: str, query_vector: Sequence[float], scope: Hashable) -> Optional[Tuple[str, float]]:
+        """Trả về (câu trả lời, similarity) nếu có entry khớp trong scope, ngược lại None."""
+        key = normalize_query(query)
+        unit = self._unit(query_vector)
+        now = time.time()
+
+        with self._lock:
+            ids = [
+                entry_id for entry_id in self._by_scope.get(scope, [])
+                if now - self._entries[entry_id].created_at <= self.ttl_seconds
+            ]
+            for entry_id in set(self._by_scope.get(scope, [])) - set(ids):
+                self._remove_locked(entry_id)
+            if not ids:
+                self._stats["miss"] += 1
+                return None
+
+            best_id, best_similarity = None, -1.0
+            exact = next((entry_id for entry_id in ids if self._entries[entry_id].query == key), None)
+            if exact is not None:
+                best_id, best_similarity = exact, 1.0
+            else:
+                similarities = np.stack([self._entries[entry_id].vector for entry_id in ids]) @ unit
+                index = int(np.argmax(similarities))
+                if similarities[index] >= self.similarity_threshold:
+                    best_id, best_similarity = ids[index], float(similarities[index])
+
+            if best_id is None:
+                self._stats["miss"] += 1
+                return None
+
+            entry = self._entries[best_id]
+            entry.hits += 1
+            if self.policy == "lru":
+                self._entries.move_to_end(best_id)
+            self._stats["hit_exact" if exact is not None else "hit_similar"] += 1
+            return entry.answer, best_similarity
+
+    def store(self, query: str, query_vector: Sequence[float], answer: str, scope: Hashable, files: Sequence[str]):
+        key = normalize_query(query)
+        with self._lock:
+            # Cùng query trong cùng scope -> thay entry cũ
+            for entry_id in list(self._by_scope.get(scope, [])):
+                if self._entries[entry_id].query == key:
+                    self._remove_locked(entry_id)
+
+            entry_id = next(self._ids)
+            self._entries[entry_id] = CachedAnswer(
+                query=key,
+                vector=self._unit(query_vector),
+                answer=answer,
+                scope=scope,
+                files=tuple(files),
+                created_at=time.time(),
+            )
+            self._by_scope.setdefault(scope, []).append(entry_id)
+            self._stats["stored"] += 1
+            self._evict_locked()
+
+    def invalidate_file(self, file_name: str) -> int:
+        """Xoá mọi entry có dùng file này (gọi khi file được ingest lại). Trả về số entry đã xoá."""
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items() if file_name in entry.files]
+            for entry_id in stale:
+                self._remove_locked(entry_id)
+            self._stats["invalidated"] += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_scope.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "policy": self.policy}
+
+
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_SIZE,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    ttl_seconds=ANSWER_CACHE_TTL,
+    policy=ANSWER_CACHE_POLICY,
+)
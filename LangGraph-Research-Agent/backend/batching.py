@@ -0,0 +1,85 @@
+# batching.py
+import asyncio
+import logging
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBatcher:
+    """
+    Gom các lời gọi LLM cùng loại (router / judge) từ nhiều query đang chạy song song
+    thành một lần runnable.abatch(...):
+    - Flush khi đủ max_batch_size hoặc sau max_wait_ms kể từ phần tử đầu tiên.
+    - Mỗi phần tử nhận kết quả / exception riêng (return_exceptions) -> lỗi một query không làm hỏng cả batch.
+    Dùng cho workload offline (/chat/batch): đổi vài chục ms chờ gom lấy throughput.
+    """
+
+    def __init__(self, name: str, get_runnable: Callable[[], Any], max_batch_size: int, max_wait_ms: float):
+        self.name = name
+        self.get_runnable = get_runnable
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+        self._stats: Counter = Counter()
+        self._stats_lock = threading.Lock()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        # Query đã bị huỷ (timeout / client ngắt) trong lúc chờ -> không gọi LLM cho nó
+        live = [(item, future) for item, future in batch if not future.done()]
+        if not live:
+            return
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["items"] += len(live)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(live))
+
+        try:
+            results = await self.get_runnable().abatch(
+                [item for item, _ in live],
+                config={"max_concurrency": self.max_batch_size},
+                return_exceptions=True,
+            )
+        except Exception as e:
+            logger.error("LLM batch '%s' failed: %s", self.name, e)
+            results = [e] * len(live)
+
+        for (_, future), result in zip(live, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            stats: Dict[str, float] = dict(self._stats)
+        if stats.get("batches"):
+            stats["avg_batch"] = round(stats["items"] / stats["batches"], 2)
+        return stats
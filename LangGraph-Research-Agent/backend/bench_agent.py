@@ -0,0 +1,327 @@
+# bench_agent.py
+"""
+Benchmark offline cho graph agent (build_agent) với thành phần giả lập:
+- Router / judge / answer: FakeChatModel (độ trễ cấu hình được, structured output soạn sẵn theo kịch bản).
+- Tavily: FakeTavily. Embedding: HashEmbeddings (mặc định) hoặc model thật (--embeddings real).
+- Qdrant: local mode (":memory:" hoặc --qdrant-path), tài liệu tổng hợp được index trước khi chạy.
+
+Replay một tập query phủ mọi route (rag, rag -> web, web, answer, end) với N request đồng thời,
+báo p50 / p95 / p99 theo từng node + end-to-end và throughput.
+
+Chạy:
+    python bench_agent.py --requests 500 --concurrency 16
+    python bench_agent.py --router-ms 400 --answer-ms 1500 --mix rag=0.6,web=0.2,answer=0.2 --json out.json
+    RERANK_MODE=mmr RAG_JUDGE_FAST_PATH=true python bench_agent.py --mode sync
+Các biến môi trường trong config.py (cache, rerank, retrieval mode...) áp dụng như khi chạy server.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent import (
+    RagJudge,
+    RouteDecision,
+    build_agent,
+    get_judge_stats,
+    get_prerouter_stats,
+    get_web_cache_stats,
+    override_clients,
+)
+from bench_fakes import (
+    FakeChatModel,
+    FakeTavily,
+    HashEmbeddings,
+    Latency,
+    local_qdrant,
+    message_text,
+    percentiles,
+    synthetic_pages,
+)
+from observability import configure_logging
+from resilience import get_resilience_stats
+from vectorstore import add_document_to_vectorstore, set_embeddings, set_qdrant_clients
+
+KINDS = ("rag", "rag_web", "web", "answer", "end")
+DEFAULT_MIX = "rag=0.45,rag_web=0.15,web=0.15,answer=0.15,end=0.1"
+NODE_ORDER = ("prepare_turn", "cache_lookup", "router", "rag_lookup", "web_search", "answer")
+
+
+@dataclass
+class Case:
+    """Một query trong kịch bản + route mong muốn (router / judge giả trả lời theo kind)."""
+    kind: str
+    query: str
+
+
+@dataclass
+class Sample:
+    total_s: float
+    nodes: Dict[str, float] = field(default_factory=dict)
+    path: str = ""
+    error: Optional[str] = None
+
+
+# =====================================================================
+# KỊCH BẢN
+# =====================================================================
+
+def _parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name not in KINDS:
+            raise ValueError(f"Unknown route kind '{name}', expected one of {KINDS}.")
+        mix[name] = float(weight)
+    return mix
+
+
+def build_cases(pages: List[str], count: int, mix: Dict[str, float], seed: int = 0) -> List[Case]:
+    """count query khác nhau; query rag lấy từ câu trong tài liệu (retrieval có kết quả thật)."""
+    rng = random.Random(seed)
+    sentences = [s for page in pages for s in page.split(". ") if len(s.split()) >= 6]
+    kinds, weights = zip(*mix.items())
+    cases: Dict[str, Case] = {}
+    while len(cases) < count:
+        kind = rng.choices(kinds, weights)[0]
+        n = len(cases)
+        if kind in ("rag", "rag_web"):
+            words = rng.choice(sentences).split()
+            query = "What does the manual say about " + " ".join(words[: max(4, len(words) // 2)]).lower() + "?"
+        elif kind == "web":
+            query = f"What is the latest news about release {n} today?"
+        elif kind == "answer":
+            query = f"What can you help me with, question {n}?"
+        else:
+            query = f"Hello there {n}!"
+        cases.setdefault(query, Case(kind, query))
+    return list(cases.values())
+
+
+def install_fakes(cases: List[Case], args) -> Dict[str, object]:
+    """Thay router / judge / answer / tavily bằng bản giả theo kịch bản."""
+    by_query = {case.query: case for case in cases}
+
+    def route(messages):
+        case = by_query.get(message_text(messages[-1]))
+        kind = case.kind if case else "answer"
+        if kind == "end":
+            return RouteDecision(route="end", reply="Hi! How can I help?")
+        return RouteDecision(route="rag" if kind == "rag_web" else kind)
+
+    def judge(messages):
+        question = message_text(messages[-1]).split("\n\nRetrieved info:")[0]
+        case = by_query.get(question[len("Question: "):])
+        return RagJudge(sufficient=not (case and case.kind == "rag_web"))
+
+    def answer(messages):
+        return AIMessage(content="Synthetic answer. " * args.answer_sentences)
+
+    fakes = {
+        "router_llm": FakeChatModel(route, Latency(args.router_ms, args.jitter_ms * args.router_ms / 100, seed=1)),
+        "judge_llm": FakeChatModel(judge, Latency(args.judge_ms, args.jitter_ms * args.judge_ms / 100, seed=2)),
+        "answer_llm": FakeChatModel(answer, Latency(args.answer_ms, args.jitter_ms * args.answer_ms / 100, seed=3)),
+        "tavily": FakeTavily(Latency(args.web_ms, args.jitter_ms * args.web_ms / 100, seed=4)),
+    }
+    override_clients(**fakes)
+    return fakes
+
+
+# =====================================================================
+# CHẠY
+# =====================================================================
+
+def _agent_config(args, index: int, selected_files: List[str]) -> Dict:
+    return {
+        "configurable": {
+            "thread_id": f"bench-{index}",
+            "web_search_enabled": True,
+            "selected_files": selected_files,
+            "speculative_retrieval": args.speculative,
+            "retrieval_mode": args.retrieval_mode,
+            "use_answer_cache": args.answer_cache,
+            "use_prerouter": args.prerouter,
+        }
+    }
+
+
+def _record(sample: Sample, node: str, now: float, last: float) -> float:
+    # Graph chạy tuần tự -> thời gian node = khoảng cách giữa 2 update liên tiếp
+    sample.nodes[node] = sample.nodes.get(node, 0.0) + (now - last)
+    sample.path += ("" if not sample.path else ">") + node
+    return now
+
+
+async def _arun_one(agent, case: Case, config: Dict) -> Sample:
+    sample = Sample(total_s=0.0)
+    started = last = time.perf_counter()
+    try:
+        async for update in agent.astream({"messages": [HumanMessage(content=case.query)]}, config=config):
+            last = _record(sample, next(iter(update)), time.perf_counter(), last)
+    except Exception as e:
+        sample.error = f"{type(e).__name__}: {e}"
+    sample.total_s = time.perf_counter() - started
+    return sample
+
+
+def _run_one(agent, case: Case, config: Dict) -> Sample:
+    sample = Sample(total_s=0.0)
+    started = last = time.perf_counter()
+    try:
+        for update in agent.stream({"messages": [HumanMessage(content=case.query)]}, config=config):
+            last = _record(sample, next(iter(update)), time.perf_counter(), last)
+    except Exception as e:
+        sample.error = f"{type(e).__name__}: {e}"
+    sample.total_s = time.perf_counter() - started
+    return sample
+
+
+async def run_async(agent, cases: List[Case], args, selected_files: List[str]) -> List[Sample]:
+    samples: List[Sample] = []
+    next_index = iter(range(args.requests))
+
+    async def worker():
+        for index in next_index:
+            case = cases[index % len(cases)]
+            samples.append(await _arun_one(agent, case, _agent_config(args, index, selected_files)))
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return samples
+
+
+def run_sync(agent, cases: List[Case], args, selected_files: List[str]) -> List[Sample]:
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        return list(pool.map(
+            lambda index: _run_one(agent, cases[index % len(cases)], _agent_config(args, index, selected_files)),
+            range(args.requests),
+        ))
+
+
+# =====================================================================
+# BÁO CÁO
+# =====================================================================
+
+def summarize(samples: List[Sample], wall_s: float) -> Dict:
+    per_node: Dict[str, List[float]] = defaultdict(list)
+    for sample in samples:
+        for node, seconds in sample.nodes.items():
+            per_node[node].append(seconds * 1000)
+    ok = [s for s in samples if s.error is None]
+    totals = [s.total_s * 1000 for s in ok]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(ok) / wall_s, 2) if wall_s else 0.0,
+        "end_to_end_ms": {**percentiles(totals), "mean": statistics.mean(totals) if totals else 0.0},
+        "nodes_ms": {
+            node: {"count": len(values), **percentiles(values), "mean": statistics.mean(values)}
+            for node, values in sorted(per_node.items(), key=lambda kv: NODE_ORDER.index(kv[0]) if kv[0] in NODE_ORDER else 99)
+        },
+        "paths": dict(Counter(s.path for s in ok).most_common()),
+        "sample_errors": sorted({s.error for s in samples if s.error})[:5],
+    }
+
+
+def print_report(report: Dict):
+    print(
+        f"\nRequests: {report['requests']} ({report['errors']} errors) in {report['wall_s']:.2f}s "
+        f"-> {report['throughput_rps']:.2f} req/s"
+    )
+    header = f"{'stage':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["nodes_ms"].items()) + [("end_to_end", {"count": report["requests"] - report["errors"], **report["end_to_end_ms"]})]
+    for name, row in rows:
+        print(f"{name:<14}{row['count']:>7}{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}{row['mean']:>10.1f}")
+    print("\nPaths:")
+    for path, count in report["paths"].items():
+        print(f"  {count:>6}  {path}")
+    for key in ("fake_calls", "rag_judge", "web_cache", "resilience", "prerouter"):
+        if report.get(key):
+            print(f"{key}: {report[key]}")
+    for error in report["sample_errors"]:
+        print(f"error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the LangGraph agent (fake LLM / Tavily, local Qdrant)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=100, help="số query khác nhau (replay vòng tròn)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="tỉ lệ route: rag, rag_web, web, answer, end")
+    parser.add_argument("--mode", choices=("async", "sync"), default="async", help="astream (API) hoặc stream")
+    parser.add_argument("--router-ms", type=float, default=300)
+    parser.add_argument("--judge-ms", type=float, default=250)
+    parser.add_argument("--answer-ms", type=float, default=800)
+    parser.add_argument("--web-ms", type=float, default=600)
+    parser.add_argument("--jitter-ms", type=float, default=20, help="độ lệch chuẩn, %% của độ trễ trung bình")
+    parser.add_argument("--answer-sentences", type=int, default=40)
+    parser.add_argument("--embeddings", choices=("hash", "real"), default="hash")
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="độ trễ giả lập mỗi lần embed (hash)")
+    parser.add_argument("--qdrant-path", default=":memory:", help="thư mục Qdrant local (mặc định in-memory)")
+    parser.add_argument("--docs", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--retrieval-mode", choices=("dense", "hybrid"), default=None)
+    parser.add_argument("--speculative", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--answer-cache", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--prerouter", action=argparse.BooleanOptionalAction, default=False, help="bật pre-router embedding")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="ghi kết quả ra file JSON (so sánh giữa các lần chạy)")
+    parser.add_argument("--verbose", action="store_true", help="bật log của agent (LOG_LEVEL)")
+    args = parser.parse_args()
+
+    if args.verbose:
+        configure_logging()
+
+    if args.embeddings == "hash":
+        set_embeddings(HashEmbeddings(latency_ms=args.embed_ms))
+    set_qdrant_clients(local_qdrant(args.qdrant_path))
+
+    selected_files, all_pages = [], []
+    t0 = time.perf_counter()
+    for doc in range(args.docs):
+        pages = synthetic_pages(args.pages, seed=args.seed + doc)
+        name = f"bench_doc_{doc}.pdf"
+        add_document_to_vectorstore("\n".join(pages), name)
+        selected_files.append(name)
+        all_pages.extend(pages)
+    print(f"Indexed {args.docs} synthetic docs ({args.docs * args.pages} pages) in {time.perf_counter() - t0:.2f}s")
+
+    cases = build_cases(all_pages, args.queries, _parse_mix(args.mix), seed=args.seed)
+    fakes = install_fakes(cases, args)
+    agent = build_agent()
+    print(f"Replaying {args.requests} requests over {len(cases)} queries, concurrency={args.concurrency}, mode={args.mode}")
+
+    started = time.perf_counter()
+    if args.mode == "async":
+        samples = asyncio.run(run_async(agent, cases, args, selected_files))
+    else:
+        samples = run_sync(agent, cases, args, selected_files)
+    report = summarize(samples, time.perf_counter() - started)
+    report.update(
+        config={k: v for k, v in vars(args).items() if k not in ("json", "verbose")},
+        fake_calls={name: fake.calls for name, fake in fakes.items()},
+        rag_judge=get_judge_stats(),
+        web_cache=get_web_cache_stats(),
+        resilience=get_resilience_stats(),
+        prerouter=get_prerouter_stats(),
+    )
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# bench_embeddings.py
+"""
+So sánh các backend embedding (torch / torch-int8 / onnx / onnx-int8) trên CPU:
+- Throughput embed_documents (câu / giây) và độ trễ embed_query (p50 / p95).
+- Độ lệch so với torch fp32: cosine trung bình giữa vector cùng câu.
+- Recall@k: tập top-k của mỗi query (tìm trong chính corpus) so với top-k của torch fp32.
+
+Chạy:
+    python bench_embeddings.py --file data/some.pdf --backends torch,onnx,onnx-int8
+    python bench_embeddings.py --sentences 2000 --threads 4
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from chunking import split_sentences
+from config import EMBED_ENCODE_BATCH_SIZE, EMBED_MODEL, EMBED_THREADS
+from embedding_backends import BACKENDS, build_embeddings
+
+_WORDS = (
+    "error code device firmware update network timeout database index query server "
+    "memory cache latency throughput invoice customer contract payment warranty battery "
+    "sensor voltage module install configure restart backup report policy"
+).split()
+
+
+def _load_corpus(path: str) -> List[str]:
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        text = "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    else:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    return [s for s in split_sentences(text) if len(s.split()) >= 4]
+
+
+def _synthetic_corpus(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 30))) + f" ERR-{rng.randint(100, 999)}."
+        for _ in range(count)
+    ]
+
+
+def _queries_from(corpus: List[str], count: int, seed: int = 1) -> List[str]:
+    """Query = nửa đầu của một câu ngẫu nhiên trong corpus (giống câu hỏi ngắn về một đoạn)."""
+    rng = random.Random(seed)
+    picked = rng.sample(corpus, min(count, len(corpus)))
+    return [" ".join(s.split()[: max(3, len(s.split()) // 2)]) for s in picked]
+
+
+def _unit(vectors: List[List[float]]) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+
+def _top_k(query_vectors: np.ndarray, doc_vectors: np.ndarray, k: int) -> List[set]:
+    scores = query_vectors @ doc_vectors.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def bench_backend(backend: str, corpus: List[str], queries: List[str], threads: int, batch_size: int) -> Dict:
+    t0 = time.perf_counter()
+    embeddings = build_embeddings(backend, threads=threads, batch_size=batch_size)
+    embeddings.embed_query("warm up")
+    load_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    doc_vectors = embeddings.embed_documents(corpus)
+    doc_s = time.perf_counter() - t0
+
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        t0 = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(query))
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "docs_per_s": len(corpus) / doc_s if doc_s else 0.0,
+        "query_p50_ms": statistics.median(latencies),
+        "query_p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "doc_vectors": _unit(doc_vectors),
+        "query_vectors": _unit(query_vectors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CPU embedding backends for " + EMBED_MODEL)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--file", help="PDF / text file làm corpus (mặc định: câu tổng hợp)")
+    parser.add_argument("--sentences", type=int, default=1000, help="số câu tổng hợp nếu không có --file")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=EMBED_THREADS)
+    parser.add_argument("--batch-size", type=int, default=EMBED_ENCODE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    corpus = _load_corpus(args.file) if args.file else _synthetic_corpus(args.sentences)
+    queries = _queries_from(corpus, args.queries)
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "torch" not in backends:
+        backends.insert(0, "torch")  # torch fp32 là mốc so sánh
+    print(f"Corpus: {len(corpus)} sentences, {len(queries)} queries, threads={args.threads}, batch={args.batch_size}")
+
+    results = []
+    for backend in backends:
+        try:
+            results.append(bench_backend(backend, corpus, queries, args.threads, args.batch_size))
+        except Exception as e:
+            print(f"[{backend}] skipped: {e}")
+
+    reference = next(r for r in results if r["backend"] == "torch")
+    reference_top_k = _top_k(reference["query_vectors"], reference["doc_vectors"], args.k)
+
+    header = f"{'backend':<12}{'load s':>9}{'docs/s':>10}{'q p50 ms':>10}{'q p95 ms':>10}{'cos vs fp32':>13}{'recall@' + str(args.k):>11}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        cosine = float(np.mean(np.sum(r["doc_vectors"] * reference["doc_vectors"], axis=1)))
+        top_k = _top_k(r["query_vectors"], r["doc_vectors"], args.k)
+        recall = statistics.mean(len(a & b) / args.k for a, b in zip(top_k, reference_top_k))
+        print(
+            f"{r['backend']:<12}{r['load_s']:>9.2f}{r['docs_per_s']:>10.1f}{r['query_p50_ms']:>10.2f}"
+            f"{r['query_p95_ms']:>10.2f}{cosine:>13.4f}{recall:>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# bench_fakes.py
+"""
+Thành phần giả lập cho benchmark offline (không cần Gemini / Tavily / Qdrant server):
+- FakeChatModel: LLM có độ trễ cấu hình được, trả structured output soạn sẵn.
+- FakeTavily: web search giả (dict "results" giống TavilySearch).
+- HashEmbeddings: embedding xác định từ hash token (nhanh, không cần model).
+- local_qdrant: QdrantClient local mode (":memory:" hoặc thư mục trên đĩa).
+- Văn bản / PDF tổng hợp cho ingestion.
+"""
+import asyncio
+import math
+import random
+import shutil
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+from qdrant_client import QdrantClient
+
+from config import EMBED_DIMENSION
+from sparse import tokenize
+
+_TOPICS = {
+    "network": "router firmware wifi signal channel bandwidth packet gateway dns dhcp vlan port",
+    "battery": "battery charge cell voltage temperature capacity cycle charger discharge sensor",
+    "billing": "invoice payment contract customer refund subscription tax discount receipt plan",
+    "database": "index query table replication backup schema transaction lock latency shard",
+    "install": "install configure restart update package version driver module service setup",
+}
+_FILLER = "the a of for with when after before during each this device system user".split()
+
+
+# =====================================================================
+# ĐO THỜI GIAN
+# =====================================================================
+
+def percentiles(values: Sequence[float], points: Sequence[int] = (50, 95, 99)) -> Dict[str, float]:
+    """Percentile kiểu nearest-rank: {"p50": ..., "p95": ..., "p99": ...} (rỗng -> 0)."""
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{p}": 0.0 for p in points}
+    return {f"p{p}": ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))] for p in points}
+
+
+class Latency:
+    """Độ trễ giả lập (ms): phân phối chuẩn quanh mean_ms, cắt ở 0."""
+
+    def __init__(self, mean_ms: float, jitter_ms: float = 0.0, seed: Optional[int] = None):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.mean_ms <= 0:
+            return 0.0
+        return max(0.0, self._rng.gauss(self.mean_ms, self.jitter_ms)) / 1000
+
+
+# =====================================================================
+# LLM / TAVILY GIẢ
+# =====================================================================
+
+def message_text(message) -> str:
+    """Nội dung text của ("role", text) hoặc BaseMessage."""
+    if isinstance(message, tuple):
+        return str(message[1])
+    return str(getattr(message, "content", message))
+
+
+class FakeChatModel:
+    """
+    Thay cho Gemini (router / judge / answer): invoke / ainvoke ngủ theo latency
+    rồi trả respond(messages) -> RouteDecision / RagJudge / AIMessage tuỳ vai trò.
+    """
+
+    def __init__(self, respond: Callable[[list], object], latency: Latency):
+        self.respond = respond
+        self.latency = latency
+        self.calls = 0
+
+    def invoke(self, messages, config=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency.sample())
+        return self.respond(messages)
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        return self.respond(messages)
+
+
+class FakeTavily:
+    """Thay cho TavilySearch: trả max_results kết quả tổng hợp theo query."""
+
+    def __init__(self, latency: Latency, max_results: int = 3):
+        self.latency = latency
+        self.max_results = max_results
+        self.calls = 0
+
+    def _result(self, query: str) -> Dict:
+        return {
+            "results": [
+                {
+                    "title": f"Result {i + 1} for {query}",
+                    "content": f"Synthetic web snippet {i + 1} about {query}. " * 4,
+                    "url": f"https://example.com/{zlib.crc32(query.encode('utf-8'))}/{i}",
+                }
+                for i in range(self.max_results)
+            ]
+        }
+
+    def invoke(self, payload: Dict, config=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency.sample())
+        return self._result(payload["query"])
+
+    async def ainvoke(self, payload: Dict, config=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        return self._result(payload["query"])
+
+
+# =====================================================================
+# EMBEDDING GIẢ
+# =====================================================================
+
+class HashEmbeddings(Embeddings):
+    """
+    Vector EMBED_DIMENSION chiều từ hash token (feature hashing, tf log, chuẩn hoá L2):
+    câu chung nhiều từ -> cosine cao, đủ để chunking / retrieval chạy như thật.
+    latency_ms: thời gian giả lập cho mỗi lần gọi (mô phỏng model thật).
+    """
+
+    def __init__(self, dimension: int = EMBED_DIMENSION, latency_ms: float = 0.0):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        counts: Dict[str, int] = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            h = zlib.crc32(token.encode("utf-8"))
+            vector[h % self.dimension] += (1.0 if h & 0x80000000 else -1.0) * (1.0 + math.log(count))
+        norm = math.sqrt(sum(v * v for v in vector))
+        if norm == 0:
+            vector[0] = 1.0
+            return vector
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# =====================================================================
+# QDRANT LOCAL MODE
+# =====================================================================
+
+def local_qdrant(path: str = ":memory:", fresh: bool = True) -> QdrantClient:
+    """QdrantClient local mode (không cần server). path là thư mục -> fresh=True xoá dữ liệu cũ."""
+    if path == ":memory:":
+        return QdrantClient(":memory:")
+    if fresh:
+        shutil.rmtree(path, ignore_errors=True)
+    return QdrantClient(path=path)
+
+
+# =====================================================================
+# VĂN BẢN / PDF TỔNG HỢP
+# =====================================================================
+
+def synthetic_sentence(rng: random.Random, topic: str) -> str:
+    words = _TOPICS[topic].split()
+    body = [rng.choice(words) if rng.random() < 0.7 else rng.choice(_FILLER) for _ in range(rng.randint(8, 22))]
+    return f"{' '.join(body).capitalize()} ERR-{rng.randint(1000, 9999)}."
+
+
+def synthetic_pages(pages: int, sentences_per_page: int = 30, seed: int = 0) -> List[str]:
+    """Các trang văn bản, mỗi đoạn ~5-12 câu cùng chủ đề (semantic chunking có ranh giới rõ)."""
+    rng = random.Random(seed)
+    result = []
+    for _ in range(pages):
+        sentences: List[str] = []
+        while len(sentences) < sentences_per_page:
+            topic = rng.choice(list(_TOPICS))
+            sentences.extend(synthetic_sentence(rng, topic) for _ in range(rng.randint(5, 12)))
+        result.append(" ".join(sentences[:sentences_per_page]))
+    return result
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int = 95) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def write_pdf(path: str, pages: List[str]):
+    """
+    Ghi PDF tối giản (Helvetica, mỗi phần tử = 1 trang) để pypdf extract lại được text.
+    Đủ cho benchmark ingestion, không cần reportlab.
+    """
+    objects: List[bytes] = [b"", b""]  # 1: Catalog, 2: Pages (điền sau)
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")  # 3: Font
+    page_ids = []
+    for text in pages:
+        lines = _wrap(text)
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        data = stream.encode("latin-1", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % pid for pid in page_ids),
+        len(page_ids),
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
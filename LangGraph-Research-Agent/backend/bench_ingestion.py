@@ -0,0 +1,144 @@
+# bench_ingestion.py
+"""
+Benchmark ingestion (add_document_to_vectorstore) trên PDF tổng hợp, Qdrant local mode:
+- cold: file mới hoàn toàn (extract + chunking + embedding + upsert).
+- unchanged: upload lại y hệt (phải skip nhờ content hash).
+- modified: sửa một phần trang (incremental: chỉ ghi chunk thay đổi, xoá chunk cũ).
+Báo thời gian mỗi file (p50 / p95 / p99), trang / giây và thời gian trung bình từng giai đoạn.
+
+Chạy:
+    python bench_ingestion.py --files 5 --pages 20
+    python bench_ingestion.py --embeddings real --qdrant-path /tmp/bench_qdrant --json ingest.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from pypdf import PdfReader
+
+from bench_fakes import HashEmbeddings, local_qdrant, percentiles, synthetic_pages, synthetic_sentence, write_pdf
+from observability import configure_logging
+from vectorstore import add_document_to_vectorstore, set_embeddings, set_qdrant_clients
+
+
+def _extract(path: str) -> str:
+    # pypdf extract từng trang như jobs.py, nối lại thành text của file
+    return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+
+
+def _modify(pages: List[str], fraction: float, seed: int) -> List[str]:
+    """Chèn một câu vào đầu một phần trang -> bản sửa đổi nhỏ của cùng file."""
+    rng = random.Random(seed)
+    changed = list(pages)
+    for index in rng.sample(range(len(pages)), max(1, int(len(pages) * fraction))):
+        changed[index] = synthetic_sentence(rng, "install") + " " + changed[index]
+    return changed
+
+
+def ingest_phase(name: str, files: Dict[str, List[str]], workdir: str) -> Dict:
+    """Ghi PDF, extract và ingest từng file; trả về số liệu của phase."""
+    totals, stages = [], defaultdict(list)
+    pages = chunks = written = skipped = 0
+    started = time.perf_counter()
+    for file_name, file_pages in files.items():
+        path = os.path.join(workdir, file_name)
+        write_pdf(path, file_pages)
+
+        t0 = time.perf_counter()
+        text = _extract(path)
+        extract_s = time.perf_counter() - t0
+        result = add_document_to_vectorstore(text, file_name)
+        totals.append((time.perf_counter() - t0) * 1000)
+
+        stages["extract_s"].append(extract_s)
+        for stage, seconds in result.timings.items():
+            stages[stage].append(seconds)
+        pages += len(file_pages)
+        chunks += result.chunks
+        written += result.written
+        skipped += int(result.skipped)
+    wall_s = time.perf_counter() - started
+
+    return {
+        "phase": name,
+        "files": len(files),
+        "pages": pages,
+        "chunks": chunks,
+        "written": written,
+        "skipped": skipped,
+        "wall_s": round(wall_s, 3),
+        "pages_per_s": round(pages / wall_s, 2) if wall_s else 0.0,
+        "file_ms": {**percentiles(totals), "mean": statistics.mean(totals)},
+        "stages_mean_ms": {stage: statistics.mean(values) * 1000 for stage, values in stages.items()},
+    }
+
+
+def print_report(phases: List[Dict]):
+    header = (
+        f"{'phase':<11}{'files':>6}{'pages':>7}{'chunks':>8}{'written':>9}{'skipped':>9}"
+        f"{'pages/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for p in phases:
+        print(
+            f"{p['phase']:<11}{p['files']:>6}{p['pages']:>7}{p['chunks']:>8}{p['written']:>9}{p['skipped']:>9}"
+            f"{p['pages_per_s']:>9.1f}{p['file_ms']['p50']:>10.1f}{p['file_ms']['p95']:>10.1f}{p['file_ms']['p99']:>10.1f}"
+        )
+    for p in phases:
+        print(f"{p['phase']} stages (mean ms): " + ", ".join(f"{k}={v:.1f}" for k, v in p["stages_mean_ms"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion benchmark on synthetic PDFs (local Qdrant)")
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--sentences-per-page", type=int, default=30)
+    parser.add_argument("--modify-fraction", type=float, default=0.1, help="tỉ lệ trang bị sửa ở phase modified")
+    parser.add_argument("--embeddings", choices=("hash", "real"), default="hash")
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="độ trễ giả lập mỗi batch embed (hash)")
+    parser.add_argument("--qdrant-path", default=":memory:", help="thư mục Qdrant local (mặc định in-memory)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    parser.add_argument("--verbose", action="store_true", help="bật log ingestion (LOG_LEVEL)")
+    args = parser.parse_args()
+
+    if args.verbose:
+        configure_logging()
+
+    if args.embeddings == "hash":
+        set_embeddings(HashEmbeddings(latency_ms=args.embed_ms))
+    set_qdrant_clients(local_qdrant(args.qdrant_path))
+
+    files = {
+        f"bench_ingest_{i}.pdf": synthetic_pages(args.pages, args.sentences_per_page, seed=args.seed + i)
+        for i in range(args.files)
+    }
+    modified = {
+        name: _modify(pages, args.modify_fraction, seed=args.seed + 1000 + i)
+        for i, (name, pages) in enumerate(files.items())
+    }
+
+    with tempfile.TemporaryDirectory(prefix="bench_ingest_") as workdir:
+        phases = [
+            ingest_phase("cold", files, workdir),
+            ingest_phase("unchanged", files, workdir),
+            ingest_phase("modified", modified, workdir),
+        ]
+    print(f"Ingestion benchmark: {args.files} files x {args.pages} pages, embeddings={args.embeddings}")
+    print_report(phases)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k not in ("json", "verbose")}, "phases": phases}, f, indent=2)
+        print(f"Saved report to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# calibrate_judge.py
+"""
+Hiệu chỉnh ngưỡng fast path của RAG judge (RAG_ACCEPT_SCORE / RAG_REJECT_SCORE) trên dữ liệu thật.
+Điểm similarity phụ thuộc model embedding, mode retrieval và corpus -> không dùng ngưỡng mặc định.
+
+Input: file JSONL, mỗi dòng một câu hỏi đã gán nhãn:
+    {"query": "...", "files": ["manual.pdf"], "sufficient": true}
+    sufficient = các chunk retrieval trả về có đủ để trả lời không (người gán, hoặc lấy từ
+    judge_path llm_sufficient / llm_insufficient trong trace của /chat/).
+Với mỗi câu hỏi: retrieval như agent (cùng Qdrant, embedding, RETRIEVAL_MODE), lấy điểm các chunk rồi chọn:
+- ACCEPT nhỏ nhất sao cho trong các câu fast-accept, tỉ lệ nhãn "đủ" >= --precision.
+- REJECT lớn nhất (< ACCEPT) sao cho trong các câu fast-reject, tỉ lệ nhãn "không đủ" >= --precision.
+Câu còn lại vẫn do judge LLM quyết định. Không ngưỡng nào đạt -> giữ RAG_JUDGE_FAST_PATH=false.
+
+Chạy (server Qdrant + file đã index như khi chạy thật):
+    python calibrate_judge.py --queries labeled.jsonl --precision 0.95 --json calibration.json
+"""
+import argparse
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import RAG_ACCEPT_MIN_CHUNKS, RETRIEVAL_MODE
+from observability import configure_logging
+
+Sample = Tuple[Sequence[float], bool]
+
+
+def _precision(labels: List[bool], positive: bool) -> float:
+    return sum(1 for label in labels if label == positive) / len(labels)
+
+
+def calibrate(samples: Sequence[Sample], precision: float, min_chunks: int = 1) -> Dict[str, object]:
+    """
+    samples: (điểm các chunk của một câu hỏi, nhãn đủ / không đủ). Câu không có chunk bị bỏ qua
+    (agent không gọi judge khi retrieval rỗng). Ngưỡng không đạt precision -> None.
+    """
+    ranked = [(sorted(scores, reverse=True), label) for scores, label in samples if scores]
+    result: Dict[str, object] = {
+        "samples": len(ranked),
+        "sufficient": sum(1 for _, label in ranked if label),
+        "precision_target": precision,
+        "min_chunks": min_chunks,
+        "accept_score": None,
+        "reject_score": None,
+    }
+    if not ranked:
+        return result
+
+    # ACCEPT: fast-accept khi chunk thứ min_chunks (theo điểm) >= ngưỡng
+    accept_keys = [(scores[min_chunks - 1], label) for scores, label in ranked if len(scores) >= min_chunks]
+    for threshold in sorted({key for key, _ in accept_keys}):
+        picked = [label for key, label in accept_keys if key >= threshold]
+        if _precision(picked, True) >= precision:
+            result.update(
+                accept_score=threshold,
+                accept_coverage=round(len(picked) / len(ranked), 4),
+                accept_precision=round(_precision(picked, True), 4),
+            )
+            break
+
+    # REJECT: fast-reject khi điểm cao nhất < ngưỡng
+    upper = result["accept_score"]
+    reject_keys = [(scores[0], label) for scores, label in ranked]
+    for threshold in sorted({key for key, _ in reject_keys}, reverse=True):
+        if upper is not None and threshold > upper:
+            continue
+        picked = [label for key, label in reject_keys if key < threshold]
+        if picked and _precision(picked, False) >= precision:
+            result.update(
+                reject_score=threshold,
+                reject_coverage=round(len(picked) / len(ranked), 4),
+                reject_precision=round(_precision(picked, False), 4),
+            )
+            break
+    return result
+
+
+def load_queries(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    for number, row in enumerate(rows, start=1):
+        if not row.get("query") or not row.get("files") or not isinstance(row.get("sufficient"), bool):
+            raise ValueError(f"{path}:{number}: need 'query', 'files' and boolean 'sufficient'.")
+    return rows
+
+
+def score_queries(rows: List[Dict], mode: str) -> List[Sample]:
+    """Điểm retrieval của từng câu hỏi, đúng như rag node nhận được (trước fast judge)."""
+    from vectorstore import search_documents_with_scores
+
+    samples: List[Sample] = []
+    for row in rows:
+        scored_docs = search_documents_with_scores(row["query"], file_filters=row["files"], mode=mode)
+        samples.append(([score for _, score in scored_docs], row["sufficient"]))
+    return samples
+
+
+def _env_lines(result: Dict[str, object]) -> Optional[str]:
+    if result["accept_score"] is None and result["reject_score"] is None:
+        return None
+    lines = ["RAG_JUDGE_FAST_PATH=true", f"RAG_ACCEPT_MIN_CHUNKS={result['min_chunks']}"]
+    # Không có ngưỡng -> đặt ngoài khoảng cosine để nhánh đó không bao giờ kích hoạt
+    accept = result["accept_score"]
+    reject = result["reject_score"]
+    lines.append(f"RAG_ACCEPT_SCORE={accept:.4f}" if accept is not None else "RAG_ACCEPT_SCORE=1.01")
+    lines.append(f"RAG_REJECT_SCORE={reject:.4f}" if reject is not None else "RAG_REJECT_SCORE=-1.01")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the RAG judge fast-path thresholds")
+    parser.add_argument("--queries", required=True, help="JSONL: query, files, sufficient")
+    parser.add_argument("--precision", type=float, default=0.95, help="độ chính xác tối thiểu của mỗi nhánh fast path")
+    parser.add_argument("--min-chunks", type=int, default=RAG_ACCEPT_MIN_CHUNKS)
+    parser.add_argument("--mode", choices=("dense", "hybrid"), default=RETRIEVAL_MODE)
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    configure_logging()
+    rows = load_queries(args.queries)
+    result = calibrate(score_queries(rows, args.mode), args.precision, args.min_chunks)
+    result["mode"] = args.mode
+    print(json.dumps(result, indent=2))
+
+    env = _env_lines(result)
+    if env is None:
+        print(f"No threshold reaches precision {args.precision}; keep RAG_JUDGE_FAST_PATH=false.")
+    else:
+        print("Suggested settings:\n" + env)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump(result, out, indent=2)
+        print(f"Saved calibration to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# catalog.py
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CatalogEntry:
+    """Một file đã index."""
+    file_name: str
+    chunk_count: int
+    byte_size: int
+    ingested_at: float
+    content_hash: str
+
+
+class DocumentCatalog:
+    """
+    Danh mục file đã index, lưu trong một collection phụ nhỏ (1 point / file)
+    và cache trong RAM -> liệt kê file là O(số file), không phải O(số chunk).
+    Có thể dựng lại từ collection chính bằng một lượt scroll phân trang (rebuild).
+    """
+
+    def __init__(
+        self,
+        get_client: Callable[[], QdrantClient],
+        collection_name: str,
+        refresh_seconds: float = 30.0,
+    ):
+        # Hàm trả về client (client được tạo lần đầu dùng, không phải lúc import)
+        self._get_client = get_client
+        self.collection_name = collection_name
+        self.catalog_collection = f"{collection_name}__catalog"
+        self.refresh_seconds = refresh_seconds
+
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> QdrantClient:
+        return self._get_client()
+
+    @staticmethod
+    def _point_id(file_name: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"catalog\0{file_name}"))
+
+    def _ensure_catalog_collection(self) -> bool:
+        """Tạo collection phụ nếu chưa có. Trả về True nếu vừa tạo mới."""
+        if self.client.collection_exists(self.catalog_collection):
+            return False
+        logger.info("Creating document catalog collection: %s", self.catalog_collection)
+        # Collection chỉ dùng để lưu payload -> vector giả 1 chiều
+        self.client.create_collection(
+            collection_name=self.catalog_collection,
+            vectors_config=models.VectorParams(size=1, distance=models.Distance.DOT),
+        )
+        return True
+
+    # --- ĐỌC ---
+    def _read_catalog_collection(self) -> Dict[str, CatalogEntry]:
+        entries: Dict[str, CatalogEntry] = {}
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.catalog_collection,
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            for point in points:
+                entry = CatalogEntry(**(point.payload or {}))
+                entries[entry.file_name] = entry
+            if offset is None:
+                return entries
+
+    def load(self):
+        """Nạp toàn bộ catalog từ collection phụ vào RAM (tự rebuild nếu catalog chưa tồn tại)."""
+        if self._ensure_catalog_collection() and self.client.collection_exists(self.collection_name):
+            self.rebuild()
+            return
+
+        entries = self._read_catalog_collection()
+        with self._lock:
+            self._entries = entries
+            self._loaded_at = time.time()
+
+    def bind(self, client: QdrantClient):
+        """Chuyển sang Qdrant client khác (benchmark / local mode), bỏ cache RAM của client cũ."""
+        with self._lock:
+            self._get_client = lambda: client
+            self._entries = {}
+            self._loaded_at = None
+
+    def _maybe_refresh(self):
+        # Nhiều worker cùng ghi catalog -> định kỳ nạp lại từ Qdrant
+        if self._loaded_at is None or time.time() - self._loaded_at > self.refresh_seconds:
+            self.load()
+
+    def list_entries(self) -> List[CatalogEntry]:
+        self._maybe_refresh()
+        with self._lock:
+            return sorted(self._entries.values(), key=lambda e: e.file_name)
+
+    def list_names(self) -> List[str]:
+        return [entry.file_name for entry in self.list_entries()]
+
+    def get(self, file_name: str) -> Optional[CatalogEntry]:
+        self._maybe_refresh()
+        with self._lock:
+            return self._entries.get(file_name)
+
+    # --- GHI (gọi lúc ingestion) ---
+    def upsert(self, entry: CatalogEntry):
+        self._ensure_catalog_collection()
+        self.client.upsert(
+            collection_name=self.catalog_collection,
+            points=[
+                models.PointStruct(id=self._point_id(entry.file_name), vector=[1.0], payload=asdict(entry))
+            ],
+        )
+        with self._lock:
+            self._entries[entry.file_name] = entry
+
+    def remove(self, file_name: str):
+        self._ensure_catalog_collection()
+        self.client.delete(
+            collection_name=self.catalog_collection,
+            points_selector=models.PointIdsList(points=[self._point_id(file_name)]),
+        )
+        with self._lock:
+            self._entries.pop(file_name, None)
+
+    # --- DỰNG LẠI TỪ COLLECTION CHÍNH ---
+    def rebuild(self, page_size: int = 1000) -> List[CatalogEntry]:
+        """
+        Scroll phân trang toàn bộ collection chính (chỉ lấy metadata.source / file_hash),
+        đếm chunk theo file rồi ghi đè catalog. byte_size / ingested_at giữ lại từ catalog cũ nếu có.
+        File có chunk mang nhiều file_hash khác nhau (index ghi dở) -> content_hash rỗng:
+        lần upload sau không bị coi là "không đổi" và được index lại đầy đủ.
+        """
+        self._ensure_catalog_collection()
+        previous = self._read_catalog_collection()
+
+        counts: Dict[str, int] = {}
+        hash_counts: Dict[str, Counter] = {}
+        if self.client.collection_exists(self.collection_name):
+            offset = None
+            while True:
+                points, offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    limit=page_size,
+                    offset=offset,
+                    with_payload=["metadata.source", "metadata.file_hash"],
+                    with_vectors=False,
+                )
+                for point in points:
+                    metadata = (point.payload or {}).get("metadata", {})
+                    source = metadata.get("source") if isinstance(metadata, dict) else None
+                    if not source:
+                        continue
+                    counts[source] = counts.get(source, 0) + 1
+                    hash_counts.setdefault(source, Counter())[metadata.get("file_hash") or ""] += 1
+                if offset is None:
+                    break
+
+        hashes: Dict[str, str] = {}
+        for source, by_hash in hash_counts.items():
+            if len(by_hash) == 1:
+                hashes[source] = next(iter(by_hash))
+                continue
+            majority, majority_count = by_hash.most_common(1)[0]
+            logger.warning(
+                "Catalog rebuild: '%s' has chunks from %d file versions (majority %s: %d/%d chunks); "
+                "recorded as mixed, it will be re-indexed on next upload.",
+                source, len(by_hash), majority[:12] or "<no hash>", majority_count, counts[source],
+            )
+            hashes[source] = ""
+
+        now = time.time()
+        entries = {
+            source: CatalogEntry(
+                file_name=source,
+                chunk_count=count,
+                byte_size=previous[source].byte_size if source in previous else 0,
+                ingested_at=previous[source].ingested_at if source in previous else now,
+                content_hash=hashes.get(source, ""),
+            )
+            for source, count in counts.items()
+        }
+
+        # Ghi đè collection phụ: xoá file không còn chunk, upsert phần còn lại
+        removed = [self._point_id(name) for name in previous if name not in entries]
+        if removed:
+            self.client.delete(
+                collection_name=self.catalog_collection,
+                points_selector=models.PointIdsList(points=removed),
+            )
+        if entries:
+            self.client.upsert(
+                collection_name=self.catalog_collection,
+                points=[
+                    models.PointStruct(id=self._point_id(name), vector=[1.0], payload=asdict(entry))
+                    for name, entry in entries.items()
+                ],
+            )
+
+        with self._lock:
+            self._entries = entries
+            self._loaded_at = time.time()
+        logger.info("Document catalog rebuilt: %d files.", len(entries))
+        return sorted(entries.values(), key=lambda e: e.file_name)
@@ -0,0 +1,193 @@
+# chunking.py
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Literal, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Cùng regex tách câu với langchain_experimental SemanticChunker
+SENTENCE_SPLIT_REGEX = r"(?<=[.?!])\s+"
+
+
+@dataclass
+class EmbeddedChunk:
+    """Một chunk sau semantic chunking kèm vector đã tính sẵn."""
+    text: str
+    vector: List[float]
+    metadata: Dict = field(default_factory=dict)  # vd: {"page": 3, "page_end": 4}
+
+
+def split_sentences(text: str) -> List[str]:
+    """Tách văn bản thành câu (bỏ câu rỗng)."""
+    return [s for s in re.split(SENTENCE_SPLIT_REGEX, text) if s.strip()]
+
+
+def _combine_sentences(sentences: List[str], buffer_size: int = 1) -> List[str]:
+    """Ghép mỗi câu với buffer_size câu trước/sau (giống SemanticChunker)."""
+    combined = []
+    for i in range(len(sentences)):
+        window = sentences[max(0, i - buffer_size): i + 1 + buffer_size]
+        combined.append(" ".join(window))
+    return combined
+
+
+def _embed_in_batches(embeddings: Embeddings, texts: List[str], batch_size: int) -> np.ndarray:
+    vectors: List[List[float]] = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def semantic_chunk(
+    text: str,
+    embeddings: Embeddings,
+    batch_size: int = 64,
+    breakpoint_percentile: float = 95.0,
+    vector_mode: Literal["reuse", "reembed"] = "reuse",
+    timings: Optional[Dict[str, float]] = None,
+) -> List[EmbeddedChunk]:
+    """
+    Semantic chunking + embedding trong một lượt:
+    - Embed các câu (đã ghép buffer) theo batch để tìm breakpoint như SemanticChunker.
+    - vector_mode="reuse": vector của chunk = trung bình (chuẩn hoá) vector các câu trong chunk,
+      không phải embed lại toàn bộ văn bản.
+    - vector_mode="reembed": embed lại text từng chunk (vẫn theo batch).
+    timings (nếu truyền vào) được cộng dồn thời gian từng giai đoạn (giây).
+    """
+    return semantic_chunk_pages(
+        [(None, text)],
+        embeddings,
+        batch_size=batch_size,
+        breakpoint_percentile=breakpoint_percentile,
+        vector_mode=vector_mode,
+        timings=timings,
+    )
+
+
+def semantic_chunk_pages(
+    pages: Sequence[Tuple[Optional[int], str]],
+    embeddings: Embeddings,
+    batch_size: int = 64,
+    breakpoint_percentile: float = 95.0,
+    vector_mode: Literal["reuse", "reembed"] = "reuse",
+    timings: Optional[Dict[str, float]] = None,
+) -> List[EmbeddedChunk]:
+    """
+    Giống semantic_chunk nhưng nhận danh sách (số trang, text) của một cửa sổ trang.
+    Mỗi chunk giữ metadata "page" (trang của câu đầu) và "page_end" (trang của câu cuối).
+    """
+    return semantic_chunk_many(
+        [pages],
+        embeddings,
+        batch_size=batch_size,
+        breakpoint_percentile=breakpoint_percentile,
+        vector_mode=vector_mode,
+        timings=timings,
+    )[0]
+
+
+def semantic_chunk_many(
+    documents: Sequence[Sequence[Tuple[Optional[int], str]]],
+    embeddings: Embeddings,
+    batch_size: int = 64,
+    breakpoint_percentile: float = 95.0,
+    vector_mode: Literal["reuse", "reembed"] = "reuse",
+    timings: Optional[Dict[str, float]] = None,
+) -> List[List[EmbeddedChunk]]:
+    """
+    Semantic chunking cho nhiều tài liệu (mỗi tài liệu là danh sách (số trang, text)):
+    câu của mọi tài liệu được embed chung theo batch (một batch có thể chứa câu của nhiều file),
+    breakpoint vẫn tính riêng trong từng tài liệu. Trả về danh sách chunk theo thứ tự tài liệu.
+    """
+    timings = timings if timings is not None else {}
+
+    t0 = time.perf_counter()
+    doc_sentences: List[List[str]] = []
+    doc_pages: List[List[Optional[int]]] = []
+    for pages in documents:
+        sentences: List[str] = []
+        sentence_pages: List[Optional[int]] = []
+        for page, page_text in pages:
+            for sentence in split_sentences(page_text):
+                sentences.append(sentence)
+                sentence_pages.append(page)
+        doc_sentences.append(sentences)
+        doc_pages.append(sentence_pages)
+    timings["split_s"] = timings.get("split_s", 0.0) + time.perf_counter() - t0
+
+    combined = [text for sentences in doc_sentences for text in _combine_sentences(sentences)]
+    if not combined:
+        return [[] for _ in documents]
+
+    t0 = time.perf_counter()
+    all_vectors = _normalize(_embed_in_batches(embeddings, combined, batch_size))
+    timings["embed_s"] = timings.get("embed_s", 0.0) + time.perf_counter() - t0
+
+    # Tìm breakpoint: khoảng cách cosine giữa 2 câu liên tiếp (trong cùng tài liệu) vượt percentile
+    t0 = time.perf_counter()
+    doc_spans: List[List[Tuple[int, int]]] = []
+    doc_vectors: List[np.ndarray] = []
+    offset = 0
+    for sentences in doc_sentences:
+        sentence_vectors = all_vectors[offset:offset + len(sentences)]
+        offset += len(sentences)
+        doc_vectors.append(sentence_vectors)
+        doc_spans.append(_spans(sentence_vectors, breakpoint_percentile))
+
+    doc_chunks: List[List[Tuple[str, Dict]]] = []
+    for sentences, sentence_pages, spans in zip(doc_sentences, doc_pages, doc_spans):
+        chunks = []
+        for a, b in spans:
+            metadata = {} if sentence_pages[a] is None else {"page": sentence_pages[a], "page_end": sentence_pages[b - 1]}
+            chunks.append((" ".join(sentences[a:b]), metadata))
+        doc_chunks.append(chunks)
+    timings["chunk_s"] = timings.get("chunk_s", 0.0) + time.perf_counter() - t0
+
+    if vector_mode == "reembed":
+        t0 = time.perf_counter()
+        chunk_vectors = iter(_embed_in_batches(
+            embeddings, [text for chunks in doc_chunks for text, _ in chunks], batch_size
+        ))
+        timings["embed_s"] = timings.get("embed_s", 0.0) + time.perf_counter() - t0
+        doc_chunk_vectors = [[next(chunk_vectors) for _ in chunks] for chunks in doc_chunks]
+    else:
+        doc_chunk_vectors = [
+            _normalize(np.stack([vectors[a:b].mean(axis=0) for a, b in spans])) if spans else []
+            for vectors, spans in zip(doc_vectors, doc_spans)
+        ]
+
+    return [
+        [
+            EmbeddedChunk(text=text, vector=vector.tolist(), metadata=metadata)
+            for (text, metadata), vector in zip(chunks, vectors)
+        ]
+        for chunks, vectors in zip(doc_chunks, doc_chunk_vectors)
+    ]
+
+
+def _spans(sentence_vectors: np.ndarray, breakpoint_percentile: float) -> List[Tuple[int, int]]:
+    """Chia câu thành các đoạn [a, b) tại breakpoint (rỗng nếu không có câu)."""
+    count = len(sentence_vectors)
+    if count > 1:
+        distances = 1.0 - np.sum(sentence_vectors[:-1] * sentence_vectors[1:], axis=1)
+        threshold = np.percentile(distances, breakpoint_percentile)
+        breakpoints = [i for i, d in enumerate(distances) if d > threshold]
+    else:
+        breakpoints = []
+
+    spans = []
+    start = 0
+    for index in breakpoints:
+        spans.append((start, index + 1))
+        start = index + 1
+    if start < count:
+        spans.append((start, count))
+    return spans
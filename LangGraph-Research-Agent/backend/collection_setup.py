@@ -0,0 +1,134 @@
+# collection_setup.py
+import logging
+from typing import Dict, List
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from config import (
+    EMBED_DIMENSION,
+    QDRANT_HNSW_M,
+    QDRANT_HNSW_EF_CONSTRUCT,
+    QDRANT_ON_DISK_VECTORS,
+    QDRANT_PAYLOAD_INDEXES,
+    QDRANT_APPLY_CONFIG,
+    SPARSE_VECTOR_NAME,
+)
+from sparse import sparse_vectors_config
+
+logger = logging.getLogger(__name__)
+
+
+def parse_payload_indexes(spec: str) -> Dict[str, models.PayloadSchemaType]:
+    """
+    "metadata.source:keyword,metadata.page:integer" -> {field: PayloadSchemaType}.
+    """
+    indexes: Dict[str, models.PayloadSchemaType] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        field_name, _, schema = item.partition(":")
+        indexes[field_name.strip()] = models.PayloadSchemaType((schema or "keyword").strip().lower())
+    return indexes
+
+
+def _check_live_config(client: QdrantClient, collection_name: str) -> List[str]:
+    """So sánh config collection đang chạy với config mong muốn, trả về danh sách khác biệt."""
+    info = client.get_collection(collection_name)
+    mismatches: List[str] = []
+
+    vectors = info.config.params.vectors
+    if isinstance(vectors, dict):
+        vectors = vectors.get("")
+    if vectors is not None:
+        if vectors.size != EMBED_DIMENSION:
+            mismatches.append(f"vector size {vectors.size} != {EMBED_DIMENSION}")
+        if vectors.distance != models.Distance.COSINE:
+            mismatches.append(f"distance {vectors.distance} != Cosine")
+        if bool(vectors.on_disk) != QDRANT_ON_DISK_VECTORS:
+            mismatches.append(f"vectors on_disk={bool(vectors.on_disk)} != {QDRANT_ON_DISK_VECTORS}")
+
+    hnsw = info.config.hnsw_config
+    if hnsw.m != QDRANT_HNSW_M:
+        mismatches.append(f"hnsw m={hnsw.m} != {QDRANT_HNSW_M}")
+    if hnsw.ef_construct != QDRANT_HNSW_EF_CONSTRUCT:
+        mismatches.append(f"hnsw ef_construct={hnsw.ef_construct} != {QDRANT_HNSW_EF_CONSTRUCT}")
+
+    return mismatches
+
+
+def has_sparse_vectors(client: QdrantClient, collection_name: str) -> bool:
+    """True nếu collection có sparse vector SPARSE_VECTOR_NAME (cần cho hybrid retrieval)."""
+    sparse_vectors = client.get_collection(collection_name).config.params.sparse_vectors or {}
+    return SPARSE_VECTOR_NAME in sparse_vectors
+
+
+def ensure_collection(client: QdrantClient, collection_name: str) -> bool:
+    """
+    Đảm bảo collection tồn tại với đúng cấu hình:
+    - Tạo mới với HNSW (m, ef_construct), on-disk vectors theo config
+      và sparse vector BM25 (IDF tính phía server) cho hybrid retrieval.
+    - Tạo payload index còn thiếu (mặc định metadata.source / metadata.file_hash dạng keyword),
+      cần cho filtered search theo file.
+    - Collection đã có nhưng config khác -> cảnh báo; QDRANT_APPLY_CONFIG=true thì cập nhật luôn.
+    Trả về True nếu collection hỗ trợ hybrid (có sparse vector).
+    """
+    if not client.collection_exists(collection_name):
+        logger.info("Creating new Qdrant collection: %s", collection_name)
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(
+                size=EMBED_DIMENSION,
+                distance=models.Distance.COSINE,
+                on_disk=QDRANT_ON_DISK_VECTORS,
+            ),
+            hnsw_config=models.HnswConfigDiff(
+                m=QDRANT_HNSW_M,
+                ef_construct=QDRANT_HNSW_EF_CONSTRUCT,
+            ),
+            sparse_vectors_config=sparse_vectors_config(SPARSE_VECTOR_NAME),
+        )
+    else:
+        mismatches = _check_live_config(client, collection_name)
+        if mismatches:
+            logger.warning(
+                "Qdrant collection '%s' config differs from settings: %s", collection_name, "; ".join(mismatches)
+            )
+            if QDRANT_APPLY_CONFIG:
+                logger.info("Applying configured HNSW / on-disk settings to '%s'", collection_name)
+                client.update_collection(
+                    collection_name=collection_name,
+                    vectors_config={"": models.VectorParamsDiff(on_disk=QDRANT_ON_DISK_VECTORS)},
+                    hnsw_config=models.HnswConfigDiff(
+                        m=QDRANT_HNSW_M,
+                        ef_construct=QDRANT_HNSW_EF_CONSTRUCT,
+                    ),
+                )
+
+    # Payload index: chỉ tạo những index chưa có
+    existing = client.get_collection(collection_name).payload_schema or {}
+    for field_name, schema in parse_payload_indexes(QDRANT_PAYLOAD_INDEXES).items():
+        if field_name in existing:
+            if existing[field_name].data_type != schema:
+                logger.warning(
+                    "Payload index '%s' is %s, expected %s", field_name, existing[field_name].data_type, schema
+                )
+            continue
+        logger.info("Creating payload index '%s' (%s) on '%s'", field_name, schema.value, collection_name)
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=schema,
+            wait=True,
+        )
+
+    hybrid = has_sparse_vectors(client, collection_name)
+    if not hybrid:
+        # Không thể thêm sparse vector vào collection đã tạo -> cần tạo lại collection và ingest lại
+        logger.warning(
+            "Collection '%s' has no sparse vector '%s'. "
+            "Hybrid retrieval is disabled (dense only); recreate the collection to enable it.",
+            collection_name, SPARSE_VECTOR_NAME,
+        )
+    return hybrid
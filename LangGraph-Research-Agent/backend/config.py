@@ -8,6 +8,24 @@ load_dotenv()
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333") 
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None) 
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "user_documents")
+# --- Qdrant Collection Tuning (áp dụng lúc startup / lần ingestion đầu) ---
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "16"))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+QDRANT_ON_DISK_VECTORS = os.getenv("QDRANT_ON_DISK_VECTORS", "false").lower() == "true"
+# Danh sách "field:schema" cần payload index (filter theo file cần metadata.source)
+QDRANT_PAYLOAD_INDEXES = os.getenv(
+    "QDRANT_PAYLOAD_INDEXES", "metadata.source:keyword,metadata.file_hash:keyword"
+)
+# true: tự cập nhật HNSW / on-disk nếu collection đang chạy khác config (mặc định chỉ cảnh báo)
+QDRANT_APPLY_CONFIG = os.getenv("QDRANT_APPLY_CONFIG", "false").lower() == "true"
+# Kiểm tra / tạo collection lỗi -> chờ N giây mới thử lại (không gọi Qdrant lại mỗi request)
+QDRANT_SETUP_RETRY_SECONDS = float(os.getenv("QDRANT_SETUP_RETRY_SECONDS", "30"))
+
+# Danh mục file (collection phụ "<collection>__catalog"), nạp lại vào RAM sau mỗi N giây
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "30"))
+# gRPC transport (port 6334) giảm overhead mỗi query so với REST
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
 # SYSTEM_COLLECTION_NAME = os.getenv("SYSTEM_COLLECTION_NAME", "system_intelligence")  
 
 # --- Google Gemini Configuration ---
@@ -18,6 +36,131 @@ TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 
 # --- Embedding Model ---
 EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_DIMENSION = int(os.getenv("EMBED_DIMENSION", "384"))
+# Backend CPU: torch (fp32) | torch-int8 (dynamic quantization) | onnx | onnx-int8 (ONNX Runtime)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))  # số thread suy luận, 0 = mặc định của torch / onnxruntime
+EMBED_ENCODE_BATCH_SIZE = int(os.getenv("EMBED_ENCODE_BATCH_SIZE", "32"))  # batch mỗi lượt forward của model
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE") or None  # file .onnx trong repo model (mặc định theo backend)
+
+# --- Embedding Cache ---
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_CACHE_QUERY_SIZE = int(os.getenv("EMBED_CACHE_QUERY_SIZE", "1024"))  # số query giữ trong LRU
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".cache/embeddings.sqlite3")  # để trống = không lưu đĩa
+
+# --- Ingestion ---
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "256"))
+CHUNK_BREAKPOINT_PERCENTILE = float(os.getenv("CHUNK_BREAKPOINT_PERCENTILE", "95"))
+# "reuse": vector chunk = trung bình vector câu (không embed lại); "reembed": embed lại text chunk
+CHUNK_VECTOR_MODE = os.getenv("CHUNK_VECTOR_MODE", "reuse")
+
+# --- Background Ingestion Jobs ---
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))  # số process parse/embed
+INGEST_MAX_CONCURRENT_JOBS = int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", "2"))
+INGEST_JOB_TTL = int(os.getenv("INGEST_JOB_TTL", "3600"))  # giữ job đã xong bao lâu (giây)
+INGEST_PAGE_WINDOW = int(os.getenv("INGEST_PAGE_WINDOW", "20"))  # số trang PDF xử lý mỗi lượt
+UPLOAD_SPOOL_CHUNK_SIZE = int(os.getenv("UPLOAD_SPOOL_CHUNK_SIZE", str(1024 * 1024)))  # ghi upload ra đĩa theo khối (byte)
+
+# --- Bulk Ingestion (/upload-documents/, ingest_dir.py) ---
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "500"))  # số file tối đa mỗi request upload
+BULK_GROUP_FILES = int(os.getenv("BULK_GROUP_FILES", "32"))  # số file embed + upsert chung một lượt
+BULK_GROUP_BYTES = int(os.getenv("BULK_GROUP_BYTES", str(64 * 1024 * 1024)))  # giới hạn dung lượng mỗi lượt (RAM)
+BULK_UPSERT_BATCH_SIZE = int(os.getenv("BULK_UPSERT_BATCH_SIZE", "1024"))  # số point mỗi lần upsert (gộp nhiều file)
+
+# --- Agent ---
+# Chạy retrieval song song với router LLM khi có file được chọn (mặc định tắt, có thể bật theo request)
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+
+# --- Pre-router (phân loại route bằng embedding, bỏ qua router LLM khi đủ chắc chắn) ---
+# Mặc định tắt: exemplar mặc định có nửa tiếng Việt, cần EMBED_MODEL đa ngôn ngữ (MiniLM mặc định chỉ tiếng Anh)
+PREROUTER_ENABLED = os.getenv("PREROUTER_ENABLED", "false").lower() == "true"  # có thể đổi theo request
+PREROUTER_THRESHOLD = float(os.getenv("PREROUTER_THRESHOLD", "0.75"))  # điểm cosine tối thiểu của route thắng
+PREROUTER_MARGIN = float(os.getenv("PREROUTER_MARGIN", "0.10"))  # chênh lệch tối thiểu với route thứ hai
+PREROUTER_TOP_K = int(os.getenv("PREROUTER_TOP_K", "2"))  # điểm route = trung bình top-k exemplar gần nhất
+# Tỉ lệ query đã quyết định cục bộ vẫn gọi router LLM chạy nền để đo độ khớp (0 = tắt)
+PREROUTER_SHADOW_RATE = float(os.getenv("PREROUTER_SHADOW_RATE", "0.05"))
+PREROUTER_EXEMPLARS_PATH = os.getenv("PREROUTER_EXEMPLARS_PATH", "")  # JSON {"rag": [...], ...}, trống = mặc định
+
+# --- Conversation Memory (checkpointer SQLite, session_id = thread) ---
+CONVERSATION_MEMORY_ENABLED = os.getenv("CONVERSATION_MEMORY_ENABLED", "true").lower() == "true"
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", ".cache/conversations.sqlite3")
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "8"))  # số tin nhắn giữ lại mỗi session (gồm câu hỏi hiện tại)
+HISTORY_MESSAGE_MAX_CHARS = int(os.getenv("HISTORY_MESSAGE_MAX_CHARS", "1500"))  # cắt từng tin nhắn cũ khi đưa vào prompt
+# true: tin nhắn bị cắt khỏi lịch sử được tóm tắt dồn (thêm 1 lần gọi LLM mỗi khi cắt)
+HISTORY_SUMMARIZE = os.getenv("HISTORY_SUMMARIZE", "false").lower() == "true"
+HISTORY_SUMMARY_MAX_CHARS = int(os.getenv("HISTORY_SUMMARY_MAX_CHARS", "2000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "86400"))  # xoá session không hoạt động sau N giây
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "600"))
+
+# --- Provider Limits / Timeouts (mỗi worker) ---
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))  # số lời gọi Gemini đồng thời tối đa
+TAVILY_MAX_CONCURRENCY = int(os.getenv("TAVILY_MAX_CONCURRENCY", "4"))
+# Deadline mỗi node (giây, gồm cả thời gian chờ slot và các lần retry)
+ROUTER_TIMEOUT = float(os.getenv("ROUTER_TIMEOUT", "15"))
+JUDGE_TIMEOUT = float(os.getenv("JUDGE_TIMEOUT", "10"))
+ANSWER_TIMEOUT = float(os.getenv("ANSWER_TIMEOUT", "60"))
+WEB_TIMEOUT = float(os.getenv("WEB_TIMEOUT", "10"))
+SUMMARY_TIMEOUT = float(os.getenv("SUMMARY_TIMEOUT", "15"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))  # số lần thử tối đa với lỗi tạm thời (429 / 503 / timeout)
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.5"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "4"))
+
+# --- Batch Chat (/chat/batch) ---
+CHAT_BATCH_MAX_QUERIES = int(os.getenv("CHAT_BATCH_MAX_QUERIES", "256"))  # số query tối đa mỗi request
+CHAT_BATCH_MAX_CONCURRENCY = int(os.getenv("CHAT_BATCH_MAX_CONCURRENCY", "8"))  # số query chạy song song
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "16"))  # số lời gọi router / judge gom vào một abatch
+LLM_BATCH_MAX_WAIT_MS = float(os.getenv("LLM_BATCH_MAX_WAIT_MS", "20"))  # thời gian chờ gom tối đa
+
+# --- Retrieval / Rerank ---
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "40"))  # số ứng viên lấy từ Qdrant (over-fetch)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))  # số chunk tối đa đưa vào prompt
+RERANK_MODE = os.getenv("RERANK_MODE", "mmr")  # mmr | cross_encoder | none
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1.0 = chỉ xét độ liên quan
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.95"))  # cosine >= ngưỡng coi là trùng
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))  # ngân sách token context RAG
+
+# --- Hybrid Retrieval (dense + sparse BM25, fusion RRF trong Qdrant) ---
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")  # dense | hybrid (có thể đổi theo request)
+SPARSE_VECTOR_NAME = os.getenv("SPARSE_VECTOR_NAME", "text-sparse")
+SPARSE_BM25_K1 = float(os.getenv("SPARSE_BM25_K1", "1.2"))
+SPARSE_BM25_B = float(os.getenv("SPARSE_BM25_B", "0.75"))
+SPARSE_AVG_DOC_LEN = float(os.getenv("SPARSE_AVG_DOC_LEN", "256"))  # độ dài chunk trung bình (token) cho BM25
+
+# --- Web Search Cache (Tavily) ---
+WEB_CACHE_ENABLED = os.getenv("WEB_CACHE_ENABLED", "true").lower() == "true"
+WEB_CACHE_TTL = float(os.getenv("WEB_CACHE_TTL", "600"))  # giữ kết quả bao lâu (giây)
+WEB_CACHE_MAX_ENTRIES = int(os.getenv("WEB_CACHE_MAX_ENTRIES", "512"))
+
+# --- Answer Cache (bỏ qua toàn bộ router/rag/judge/answer cho câu hỏi lặp lại) ---
+# Mặc định tắt: khớp theo ngưỡng cosine có thể trả nhầm câu trả lời cho câu hỏi gần giống nhưng khác thực thể
+# (vd khác mã lỗi / tên sản phẩm); bật khi đã kiểm tra ngưỡng trên dữ liệu thật
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))  # số câu trả lời tối đa
+ANSWER_CACHE_POLICY = os.getenv("ANSWER_CACHE_POLICY", "lru")  # lru | lfu | fifo
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # cosine query >= ngưỡng coi là cùng câu hỏi
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # giây
+# Câu trả lời có dùng kết quả web thường nhanh cũ -> mặc định không cache
+ANSWER_CACHE_WEB = os.getenv("ANSWER_CACHE_WEB", "false").lower() == "true"
+
+# --- RAG Judge Fast Path ---
+# Điểm cosine của chunk tốt nhất: >= ACCEPT -> đủ (bỏ qua judge LLM), < REJECT -> không đủ,
+# ở giữa -> hỏi judge LLM. Mặc định tắt: ngưỡng phụ thuộc model embedding / corpus,
+# lấy từ calibrate_judge.py trên câu hỏi đã gán nhãn rồi mới bật.
+RAG_JUDGE_FAST_PATH = os.getenv("RAG_JUDGE_FAST_PATH", "false").lower() == "true"
+RAG_ACCEPT_SCORE = float(os.getenv("RAG_ACCEPT_SCORE", "0.75"))
+RAG_REJECT_SCORE = float(os.getenv("RAG_REJECT_SCORE", "0.30"))
+RAG_ACCEPT_MIN_CHUNKS = int(os.getenv("RAG_ACCEPT_MIN_CHUNKS", "1"))  # số chunk tối thiểu đạt ACCEPT
+
+# --- Startup / Readiness ---
+# true: load model, ping Qdrant, tạo client LLM ngay khi khởi động (chạy nền); /ready trả 503 tới khi xong
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "10"))  # thử lại bước lỗi (vd Qdrant chưa lên)
+
+# --- Logging / Metrics ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG để xem chi tiết từng node
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json (mỗi dòng một JSON object)
 
 # --- Paths ---
 DOC_SOURCE_DIR = os.getenv("DOC_SOURCE_DIR", "data")
\ No newline at end of file
@@ -0,0 +1,86 @@
+# document_parsers.py
+"""
+Trích text từ file tài liệu thành danh sách (số trang, text) cho semantic chunking.
+Các hàm ở top-level để chạy được trong process pool (pickle).
+- .pdf: pypdf theo từng trang (giữ số trang như /upload-document/).
+- .docx: docx2txt.
+- .txt / .md: đọc thẳng (utf-8).
+- Định dạng khác (.doc, .pptx, .html...): unstructured, gom element theo page_number nếu có.
+"""
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+Pages = List[Tuple[Optional[int], str]]
+
+PLAIN_TEXT_EXTENSIONS = {".txt", ".md"}
+UNSTRUCTURED_EXTENSIONS = {".doc", ".pptx", ".html", ".htm", ".rtf", ".odt", ".epub"}
+SUPPORTED_EXTENSIONS = {".pdf", ".docx"} | PLAIN_TEXT_EXTENSIONS | UNSTRUCTURED_EXTENSIONS
+
+
+def file_extension(filename: str) -> str:
+    return os.path.splitext(filename)[1].lower()
+
+
+def is_supported(filename: str) -> bool:
+    return file_extension(filename) in SUPPORTED_EXTENSIONS
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    """Hash nội dung file (đọc theo khối), cùng cách tính với upload."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _pdf_pages(path: str) -> Pages:
+    from pypdf import PdfReader
+
+    return [(number, page.extract_text() or "") for number, page in enumerate(PdfReader(path).pages)]
+
+
+def _docx_pages(path: str) -> Pages:
+    import docx2txt
+
+    return [(None, docx2txt.process(path) or "")]
+
+
+def _plain_pages(path: str) -> Pages:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return [(None, f.read())]
+
+
+def _unstructured_pages(path: str) -> Pages:
+    from unstructured.partition.auto import partition
+
+    pages: Dict[Optional[int], List[str]] = {}
+    for element in partition(filename=path):
+        text = getattr(element, "text", "") or ""
+        if text.strip():
+            # page_number của unstructured bắt đầu từ 1, metadata "page" của repo bắt đầu từ 0
+            page_number = getattr(element.metadata, "page_number", None)
+            pages.setdefault(page_number - 1 if page_number else None, []).append(text)
+    return [(page, "\n".join(texts)) for page, texts in pages.items()]
+
+
+def extract_pages(path: str, filename: str) -> Tuple[Pages, float]:
+    """
+    Trích text của một file theo phần mở rộng của filename (path có thể là file tạm).
+    Trả về (pages, thời gian parse tính bằng giây). Chạy trong process con.
+    """
+    t0 = time.perf_counter()
+    extension = file_extension(filename)
+    if extension == ".pdf":
+        pages = _pdf_pages(path)
+    elif extension == ".docx":
+        pages = _docx_pages(path)
+    elif extension in PLAIN_TEXT_EXTENSIONS:
+        pages = _plain_pages(path)
+    elif extension in UNSTRUCTURED_EXTENSIONS:
+        pages = _unstructured_pages(path)
+    else:
+        raise ValueError(f"Unsupported file type: {extension or filename}")
+    return [(page, text) for page, text in pages if text.strip()], time.perf_counter() - t0
@@ -0,0 +1,155 @@
+# embedding_backends.py
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    EMBED_MODEL,
+    EMBED_DIMENSION,
+    EMBED_BACKEND,
+    EMBED_THREADS,
+    EMBED_ENCODE_BATCH_SIZE,
+    EMBED_ONNX_FILE,
+)
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+# File ONNX mặc định trong repo model trên HF Hub (sentence-transformers/all-MiniLM-L6-v2 có sẵn các bản này)
+DEFAULT_ONNX_FILES = {
+    "onnx": "onnx/model.onnx",
+    "onnx-int8": "onnx/model_quint8_avx2.onnx",
+}
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """Embeddings trên một SentenceTransformer đã load sẵn (torch, torch int8 hoặc ONNX Runtime)."""
+
+    def __init__(self, model, batch_size: int):
+        self.model = model
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def cache_namespace(backend: str = EMBED_BACKEND, model_name: str = EMBED_MODEL) -> str:
+    """
+    Namespace cho embedding cache: vector int8 / ONNX lệch nhẹ so với torch fp32
+    -> mỗi backend có cache riêng (torch giữ namespace cũ để dùng lại cache đã có).
+    """
+    return model_name if backend == "torch" else f"{model_name}::{backend}"
+
+
+def _set_torch_threads(threads: int):
+    if threads > 0:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+# Số thread suy luận mặc định của process này (process con của ingestion đặt lại qua set_inference_threads)
+_inference_threads = EMBED_THREADS
+
+
+def set_inference_threads(threads: int):
+    """Đặt số thread suy luận cho các model build sau đó trong process (chia core giữa các process con)."""
+    global _inference_threads
+    _inference_threads = threads
+    _set_torch_threads(threads)
+
+
+def _require_onnx():
+    """Backend onnx cần optimum + onnxruntime (không nằm trong requirements.txt mặc định)."""
+    try:
+        import onnxruntime  # noqa: F401
+        import optimum.onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            f"EMBED_BACKEND=onnx / onnx-int8 needs optimum[onnxruntime] ({e}). "
+            "Install it with: pip install -r requirements-onnx.txt"
+        ) from e
+
+
+def _onnx_model_kwargs(backend: str, threads: int, onnx_file: Optional[str]) -> dict:
+    import onnxruntime
+
+    session_options = onnxruntime.SessionOptions()
+    if threads > 0:
+        session_options.intra_op_num_threads = threads
+    return {
+        "file_name": onnx_file or DEFAULT_ONNX_FILES[backend],
+        "provider": "CPUExecutionProvider",
+        "session_options": session_options,
+    }
+
+
+def _check_dimension(model, model_name: str):
+    dimension = model.get_sentence_embedding_dimension()
+    if dimension != EMBED_DIMENSION:
+        raise ValueError(
+            f"Embedding model '{model_name}' has dimension {dimension}, collection expects {EMBED_DIMENSION}."
+        )
+
+
+def build_embeddings(
+    backend: str = EMBED_BACKEND,
+    model_name: str = EMBED_MODEL,
+    threads: Optional[int] = None,
+    batch_size: int = EMBED_ENCODE_BATCH_SIZE,
+    onnx_file: Optional[str] = EMBED_ONNX_FILE,
+) -> Embeddings:
+    """
+    Tạo embedding model trên CPU theo backend:
+    - torch: sentence-transformers fp32 (như trước).
+    - torch-int8: dynamic int8 quantization các lớp Linear (torch.quantization.quantize_dynamic).
+    - onnx / onnx-int8: ONNX Runtime (bản int8 đã quantize sẵn trên HF Hub, chọn file bằng EMBED_ONNX_FILE).
+    Mọi backend cho vector 384 chiều đã chuẩn hoá -> dùng chung collection COSINE hiện tại.
+    threads=None: EMBED_THREADS (hoặc giá trị đặt bằng set_inference_threads trong process con).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBED_BACKEND '{backend}', expected one of {BACKENDS}.")
+    if threads is None:
+        threads = _inference_threads
+
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        _set_torch_threads(threads)
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={"batch_size": batch_size},
+        )
+
+    if backend.startswith("onnx"):
+        _require_onnx()
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch-int8":
+        import torch
+
+        _set_torch_threads(threads)
+        model = SentenceTransformer(model_name, device="cpu")
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        model = SentenceTransformer(
+            model_name,
+            device="cpu",
+            backend="onnx",
+            model_kwargs=_onnx_model_kwargs(backend, threads, onnx_file),
+        )
+
+    _check_dimension(model, model_name)
+    return SentenceTransformerEmbeddings(model, batch_size=batch_size)
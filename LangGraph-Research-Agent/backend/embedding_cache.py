@@ -0,0 +1,162 @@
+# embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+def _content_key(namespace: str, text: str) -> str:
+    """Key = sha256(model + text): đổi model thì cache cũ tự động không còn khớp."""
+    return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Bọc một Embeddings bất kỳ bằng cache theo hash nội dung:
+    - Query: LRU trong RAM (giới hạn số phần tử).
+    - Documents/chunks: SQLite trên đĩa (giữ lại giữa các lần restart).
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        namespace: str,
+        query_cache_size: int = 1024,
+        db_path: Optional[str] = None,
+    ):
+        self.base = base
+        self.namespace = namespace
+        self.query_cache_size = query_cache_size
+
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {
+            "query_hits": 0,
+            "query_misses": 0,
+            "document_hits": 0,
+            "document_misses": 0,
+        }
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    # --- Query: LRU trong RAM ---
+    def embed_query(self, text: str) -> List[float]:
+        key = _content_key(self.namespace, text)
+        with self._lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self._counters["query_hits"] += 1
+                return vector
+            self._counters["query_misses"] += 1
+
+        vector = self.base.embed_query(text)
+
+        with self._lock:
+            self._query_cache[key] = vector
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def prime_queries(self, texts: List[str]) -> int:
+        """
+        Embed trước nhiều query trong một lần gọi model (embed_documents) rồi nạp vào LRU
+        -> các embed_query sau đó đều hit. Dùng cho /chat/batch. Trả về số query đã embed.
+        (Model hiện tại không có prefix riêng cho query nên vector giống embed_query.)
+        """
+        keys = {}
+        with self._lock:
+            for text in texts:
+                key = _content_key(self.namespace, text)
+                if key not in self._query_cache and key not in keys:
+                    keys[key] = text
+        if not keys:
+            return 0
+
+        vectors = self.base.embed_documents(list(keys.values()))
+
+        with self._lock:
+            self._counters["query_misses"] += len(keys)
+            for key, vector in zip(keys, vectors):
+                self._query_cache[key] = vector
+                self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return len(keys)
+
+    # --- Documents: SQLite trên đĩa ---
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        keys = [_content_key(self.namespace, t) for t in texts]
+        found = self._load(keys)
+
+        # Chỉ embed các text chưa có trong cache (mỗi text trùng lặp chỉ embed 1 lần)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        with self._lock:
+            self._counters["document_hits"] += len(texts) - len(missing)
+            self._counters["document_misses"] += len(missing)
+
+        if missing:
+            new_vectors = self.base.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_vectors))
+            self._store(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def _load(self, keys: List[str]) -> Dict[str, List[float]]:
+        if self._db is None:
+            return {}
+
+        result: Dict[str, List[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # SQLite giới hạn số tham số mỗi câu lệnh -> chia batch
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+            for key, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                result[key] = vector.tolist()
+        return result
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        if self._db is None or not vectors:
+            return
+        rows = [(key, array("f", vector).tobytes()) for key, vector in vectors.items()]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows
+            )
+            self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Bộ đếm hit/miss + kích thước cache hiện tại."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["query_cache_size"] = len(self._query_cache)
+        return stats
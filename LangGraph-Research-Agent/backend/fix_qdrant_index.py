@@ -1,28 +1,21 @@
-from qdrant_client import QdrantClient, models
-import os
-from dotenv import load_dotenv
+import logging
 
-# Load biến môi trường (URL, API KEY)
-load_dotenv()
+from qdrant_client import QdrantClient
 
-# 1. Cấu hình Client (Sửa lại cho đúng với setup của bạn)
-qdrant_url = os.getenv("QDRANT_URL")
-qdrant_api_key = os.getenv("QDRANT_API_KEY")
+from config import QDRANT_URL, QDRANT_API_KEY, QDRANT_COLLECTION_NAME
+from collection_setup import ensure_collection
 
+# Script chạy tay: server đã tự làm việc này lúc startup (vectorstore.ensure_collection),
+# giữ lại để tạo index / kiểm tra config mà không cần bật server.
+logging.basicConfig(level=logging.INFO, format="%(message)s")  # hiện log tạo collection / index
+client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
 
-client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
-
-COLLECTION_NAME = "langgraph-rag-collection"  
-print(f"Đang tạo Index cho collection: {COLLECTION_NAME}...")
+COLLECTION_NAME = QDRANT_COLLECTION_NAME
+print(f"Đang kiểm tra collection + payload index: {COLLECTION_NAME}...")
 
 try:
-    # 3. Tạo Payload Index cho trường 'metadata.source'
-    client.create_payload_index(
-        collection_name=COLLECTION_NAME,
-        field_name="metadata.source",  # Trường bị báo lỗi
-        field_schema=models.PayloadSchemaType.KEYWORD # Loại index là KEYWORD
-    )
-    print("Đã tạo Index thành công! Hãy chạy lại chương trình chính.")
+    ensure_collection(client, COLLECTION_NAME)
+    print("Collection và payload index đã sẵn sàng.")
 except Exception as e:
     print(f" Lỗi: {e}")
-    print("Gợi ý: Kiểm tra lại xem COLLECTION_NAME có đúng không?")
\ No newline at end of file
+    print("Gợi ý: Kiểm tra lại QDRANT_URL / QDRANT_API_KEY / QDRANT_COLLECTION_NAME trong .env")
@@ -0,0 +1,95 @@
+# ingest_dir.py
+"""
+Ingest hàng loạt mọi tài liệu hỗ trợ (pdf / docx / txt / md / html / pptx...) trong một thư mục,
+mặc định DOC_SOURCE_DIR. Dùng cùng pipeline với /upload-documents/: parse trong process pool,
+embedding gộp nhiều file mỗi lượt, upsert theo batch lớn; file không đổi được bỏ qua.
+Tên file trong index là đường dẫn tương đối so với thư mục gốc.
+
+Chạy:
+    python ingest_dir.py
+    python ingest_dir.py --dir /data/customer --recursive --json ingest_report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+from typing import List, Tuple
+
+from config import DOC_SOURCE_DIR
+from document_parsers import file_sha256, is_supported
+from jobs import FileStatus, job_manager
+from observability import configure_logging
+
+
+def collect_files(root: str, recursive: bool) -> Tuple[List[FileStatus], int]:
+    """Liệt kê file hỗ trợ trong root; trả về (danh sách file, số file bị bỏ qua vì sai định dạng)."""
+    files: List[FileStatus] = []
+    ignored = 0
+    for directory, subdirs, names in os.walk(root):
+        if not recursive:
+            subdirs.clear()
+        subdirs.sort()
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            if not is_supported(name):
+                ignored += 1
+                continue
+            files.append(
+                FileStatus(
+                    filename=os.path.relpath(path, root).replace(os.sep, "/"),
+                    file_hash=file_sha256(path),
+                    byte_size=os.path.getsize(path),
+                    path=path,
+                )
+            )
+    return files, ignored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest every supported document in a directory")
+    parser.add_argument("--dir", default=DOC_SOURCE_DIR, help="thư mục tài liệu (mặc định DOC_SOURCE_DIR)")
+    parser.add_argument("--recursive", action="store_true", help="quét cả thư mục con")
+    parser.add_argument("--json", help="ghi trạng thái từng file ra file JSON")
+    args = parser.parse_args()
+
+    configure_logging()
+    if not os.path.isdir(args.dir):
+        parser.error(f"Directory not found: {args.dir}")
+
+    files, ignored = collect_files(args.dir, args.recursive)
+    print(f"Found {len(files)} supported files in {args.dir} ({ignored} ignored).")
+    if not files:
+        return
+
+    job = job_manager.create_bulk_job(files)
+    try:
+        asyncio.run(job_manager.run_bulk(job, cleanup=False))
+    finally:
+        job_manager.shutdown()
+
+    for f in job.files:
+        detail = f.error or f"{f.chunks_written} new / {f.chunks_unchanged} unchanged / {f.chunks_deleted} removed"
+        print(f"{f.status:<8} {f.filename}: {detail}")
+    print(f"Done: {job.counts()} | " + ", ".join(f"{k}={v:.1f}s" for k, v in job.timings.items()))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as out:
+            json.dump(
+                {
+                    "stage": job.stage,
+                    "counts": job.counts(),
+                    "timings": job.timings,
+                    "files": [
+                        {k: v for k, v in vars(f).items() if k not in ("path", "file_hash")}
+                        for f in job.files
+                    ],
+                },
+                out,
+                indent=2,
+                ensure_ascii=False,
+            )
+        print(f"Saved report to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,614 @@
+# jobs.py
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from config import (
+    EMBED_THREADS,
+    INGEST_WORKERS,
+    INGEST_MAX_CONCURRENT_JOBS,
+    INGEST_JOB_TTL,
+    INGEST_PAGE_WINDOW,
+    UPSERT_BATCH_SIZE,
+    BULK_GROUP_FILES,
+    BULK_GROUP_BYTES,
+    BULK_UPSERT_BATCH_SIZE,
+)
+from chunking import EmbeddedChunk
+from document_parsers import Pages, extract_pages, file_extension
+from embedding_backends import set_inference_threads
+from vectorstore import (
+    IncrementalIndexer,
+    IngestResult,
+    ensure_collection,
+    is_file_unchanged,
+    prepare_documents_chunks,
+    prepare_page_chunks,
+    upsert_points,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# =====================================================================
+# HÀM CHẠY TRONG PROCESS POOL (top-level để pickle được)
+# =====================================================================
+
+def _init_worker(threads: int):
+    """Chạy một lần khi process con khởi động: giới hạn thread suy luận để các process không tranh core."""
+    set_inference_threads(threads)
+
+
+def _worker_threads(max_workers: int) -> int:
+    """EMBED_THREADS nếu có đặt, không thì chia đều số core cho các process con."""
+    if EMBED_THREADS > 0:
+        return EMBED_THREADS
+    return max(1, (os.cpu_count() or 1) // max(1, max_workers))
+
+
+def _count_pdf_pages(path: str) -> int:
+    """Đếm số trang PDF (pypdf chỉ đọc cây trang, không extract text)."""
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _prepare_page_window(path: str, start: int, end: int) -> Tuple[List[EmbeddedChunk], Dict[str, float]]:
+    """
+    Parse các trang [start, end) rồi chunking + embedding (chạy trong process con,
+    model được load 1 lần mỗi process). Chỉ cửa sổ trang này nằm trong RAM.
+    """
+    from pypdf import PdfReader
+
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    reader = PdfReader(path)
+    pages = [(page_number, reader.pages[page_number].extract_text() or "") for page_number in range(start, end)]
+    timings["parse_s"] = time.perf_counter() - t0
+
+    chunks = prepare_page_chunks(pages, timings)
+    return chunks, timings
+
+
+# =====================================================================
+# JOB
+# =====================================================================
+
+@dataclass
+class IngestionJob:
+    """Trạng thái một job ingestion."""
+    id: str
+    filename: str
+    file_hash: str
+    stage: str = "queued"  # queued | parsing | indexing | done | failed
+    percent: float = 0.0
+    chunks: int = 0
+    chunks_written: int = 0
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
+    skipped: bool = False  # file không đổi so với bản đã index
+    pages_total: int = 0
+    pages_done: int = 0
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def update(self, stage: Optional[str] = None, percent: Optional[float] = None):
+        if stage is not None:
+            self.stage = stage
+        if percent is not None:
+            self.percent = round(percent, 1)
+        self.updated_at = time.time()
+
+
+@dataclass
+class FileStatus:
+    """Trạng thái một file trong bulk job."""
+    filename: str
+    file_hash: str = ""
+    byte_size: int = 0
+    path: Optional[str] = None  # file trên đĩa (file tạm của upload hoặc file nguồn của CLI)
+    status: str = "queued"  # queued | parsing | indexing | done | skipped | failed
+    pages: int = 0
+    chunks: int = 0
+    chunks_written: int = 0
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "skipped", "failed")
+
+    def fail(self, error: str):
+        self.status = "failed"
+        self.error = error
+
+
+@dataclass
+class BulkIngestionJob:
+    """Job ingestion nhiều file: trạng thái chung + trạng thái từng file."""
+    id: str
+    files: List[FileStatus]
+    stage: str = "queued"  # queued | running | done | failed
+    timings: Dict[str, float] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def percent(self) -> float:
+        if not self.files:
+            return 100.0
+        return round(100 * sum(f.finished for f in self.files) / len(self.files), 1)
+
+    def counts(self) -> Dict[str, int]:
+        return dict(Counter(f.status for f in self.files))
+
+    def update(self, stage: Optional[str] = None):
+        if stage is not None:
+            self.stage = stage
+        self.updated_at = time.time()
+
+
+def _group_files(files: List[FileStatus], max_files: int, max_bytes: int) -> List[List[FileStatus]]:
+    """Chia file thành các lượt (tối đa max_files file / max_bytes byte mỗi lượt, luôn ít nhất 1 file)."""
+    groups: List[List[FileStatus]] = []
+    group: List[FileStatus] = []
+    size = 0
+    for f in files:
+        if group and (len(group) >= max_files or size + f.byte_size > max_bytes):
+            groups.append(group)
+            group, size = [], 0
+        group.append(f)
+        size += f.byte_size
+    if group:
+        groups.append(group)
+    return groups
+
+
+class IngestionJobManager:
+    """
+    Hàng đợi ingestion chạy nền:
+    - Tối đa max_concurrent_jobs job chạy cùng lúc (các job khác ở trạng thái "queued").
+    - PDF được xử lý theo cửa sổ page_window trang: parse + chunking/embedding chạy trong
+      process pool (scale theo số core), upsert ngay sau mỗi cửa sổ -> RAM không tăng theo kích thước file.
+    - Mỗi job có tối đa max_workers cửa sổ đang xử lý cùng lúc.
+    - Bulk job (nhiều file): parse trong cùng process pool, chunking + embedding gộp câu của
+      nhiều file vào chung batch, upsert gộp point của cả lượt (xem run_bulk); PDF trong bulk job
+      đi qua cùng pipeline cửa sổ trang như job đơn.
+    - Hai ingestion cùng tên file (job đơn hay bulk) không bao giờ chạy xen kẽ (xem _lock_sources).
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_concurrent_jobs: int,
+        job_ttl: int,
+        page_window: int,
+        bulk_group_files: int = BULK_GROUP_FILES,
+        bulk_group_bytes: int = BULK_GROUP_BYTES,
+        bulk_upsert_batch_size: int = BULK_UPSERT_BATCH_SIZE,
+    ):
+        self.max_workers = max_workers
+        self.page_window = page_window
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.job_ttl = job_ttl
+        self.bulk_group_files = bulk_group_files
+        self.bulk_group_bytes = bulk_group_bytes
+        self.bulk_upsert_batch_size = bulk_upsert_batch_size
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._bulk_jobs: Dict[str, BulkIngestionJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # tên file -> (lock, số job đang giữ / chờ)
+        self._source_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: tránh fork process đang có thread (torch / http client)
+            # initializer: mỗi process chỉ dùng phần core của mình (mặc định torch / onnxruntime lấy hết core)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(_worker_threads(self.max_workers),),
+            )
+        return self._executor
+
+    def submit(self, path: str, filename: str, file_hash: str) -> IngestionJob:
+        """Tạo job và chạy nền. Phải gọi trong event loop (endpoint async)."""
+        self._prune()
+        self._get_semaphore()
+
+        job = IngestionJob(id=uuid.uuid4().hex, filename=filename, file_hash=file_hash)
+        self._jobs[job.id] = job
+        self._tasks[job.id] = asyncio.create_task(self._run(job, path))
+        return job
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+        return self._semaphore
+
+    @contextlib.asynccontextmanager
+    async def _lock_sources(self, filenames: Iterable[str]):
+        """
+        Khoá theo tên file: đọc existing_ids -> upsert -> finish của hai bản cùng tên chạy tuần tự,
+        bản xong sau không xoá nhầm chunk / ghi đè catalog của bản kia.
+        Lấy khoá theo thứ tự tên -> bulk job giữ nhiều khoá cùng lúc không deadlock.
+        """
+        names = sorted(set(filenames))
+        for name in names:
+            lock, users = self._source_locks.get(name, (None, 0))
+            self._source_locks[name] = (lock or asyncio.Lock(), users + 1)
+        acquired: List[asyncio.Lock] = []
+        try:
+            for name in names:
+                lock = self._source_locks[name][0]
+                await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in acquired:
+                lock.release()
+            for name in names:
+                lock, users = self._source_locks[name]
+                if users > 1:
+                    self._source_locks[name] = (lock, users - 1)
+                else:
+                    del self._source_locks[name]
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def create_bulk_job(self, files: List[FileStatus]) -> BulkIngestionJob:
+        """Đăng ký bulk job (chưa chạy). File đã ở trạng thái failed (vd sai định dạng) được giữ để báo lại."""
+        job = BulkIngestionJob(id=uuid.uuid4().hex, files=files)
+        self._bulk_jobs[job.id] = job
+        return job
+
+    def submit_bulk(self, files: List[FileStatus]) -> BulkIngestionJob:
+        """Tạo bulk job và chạy nền (file tạm được xoá khi xong). Phải gọi trong event loop."""
+        self._prune()
+        job = self.create_bulk_job(files)
+        self._tasks[job.id] = asyncio.create_task(self.run_bulk(job, cleanup=True))
+        return job
+
+    def get_bulk(self, job_id: str) -> Optional[BulkIngestionJob]:
+        return self._bulk_jobs.get(job_id)
+
+    async def _run(self, job: IngestionJob, path: str):
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._semaphore, self._lock_sources([job.filename]):
+                executor = self._get_executor()
+                started = time.perf_counter()
+
+                job.update("parsing", 1)
+                await run_in_threadpool(ensure_collection)
+
+                # File giống hệt bản đã index -> bỏ qua toàn bộ
+                if await run_in_threadpool(is_file_unchanged, job.filename, job.file_hash):
+                    logger.info("[job %s] '%s' is unchanged since last ingestion. Skipping.", job.id, job.filename)
+                    job.skipped = True
+                    job.update("done", 100)
+                    return
+
+                job.pages_total = await loop.run_in_executor(executor, _count_pdf_pages, path)
+                if job.pages_total == 0:
+                    job.update("done", 100)
+                    return
+
+                job.update("indexing", 2)
+                indexer = await run_in_threadpool(
+                    IncrementalIndexer, job.filename, job.file_hash, os.path.getsize(path)
+                )
+
+                def on_window(chunk_count: int, page_count: int):
+                    job.chunks += chunk_count
+                    job.chunks_written = indexer.written
+                    job.pages_done += page_count
+                    job.update(percent=2 + 98 * job.pages_done / job.pages_total)
+
+                result = await self._index_pdf(
+                    path, indexer, job.pages_total, job.timings, UPSERT_BATCH_SIZE, on_window
+                )
+                job.chunks = result.chunks
+                job.chunks_written = result.written
+                job.chunks_unchanged = result.unchanged
+                job.chunks_deleted = result.deleted
+
+                job.timings["total_s"] = time.perf_counter() - started
+                job.update("done", 100)
+                logger.info(
+                    "[job %s] Indexed '%s': %d new, %d unchanged, %d stale chunks removed.",
+                    job.id, job.filename, result.written, result.unchanged, result.deleted,
+                    extra={"job_id": job.id, "source": job.filename, "timings": job.timings},
+                )
+
+        except Exception as e:
+            logger.exception("[job %s] Ingestion of '%s' failed", job.id, job.filename)
+            job.error = str(e)
+            job.update("failed")
+        finally:
+            self._tasks.pop(job.id, None)
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def _index_pdf(
+        self,
+        path: str,
+        indexer: IncrementalIndexer,
+        page_total: int,
+        timings: Dict[str, float],
+        batch_size: int,
+        on_window: Callable[[int, int], None],
+    ) -> IngestResult:
+        """
+        Chunking + embedding PDF theo cửa sổ page_window trang trong process pool (tối đa max_workers
+        cửa sổ cùng lúc), upsert ngay sau mỗi cửa sổ rồi finish. on_window(số chunk, số trang) sau mỗi cửa sổ.
+        Một cửa sổ lỗi: huỷ các cửa sổ còn lại (kết quả không được ghi nữa) rồi xoá các chunk
+        đã upsert của bản file này -> không để lại index ghi dở không có catalog.
+        Gọi khi đang giữ khoá tên file (_lock_sources).
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        # future -> số trang trong cửa sổ đó
+        in_flight: Dict[asyncio.Future, int] = {}
+        try:
+            for start in range(0, page_total, self.page_window):
+                end = min(start + self.page_window, page_total)
+                future = loop.run_in_executor(executor, _prepare_page_window, path, start, end)
+                in_flight[future] = end - start
+
+                # Giới hạn số cửa sổ đang xử lý -> RAM phẳng dù PDF 5 MB hay 500 MB
+                if len(in_flight) >= self.max_workers:
+                    await self._drain(indexer, in_flight, timings, batch_size, on_window)
+
+            while in_flight:
+                await self._drain(indexer, in_flight, timings, batch_size, on_window)
+
+            # Xoá chunk cũ không còn trong bản mới
+            return await run_in_threadpool(indexer.finish)
+        except Exception:
+            for future in in_flight:
+                future.cancel()
+            await self._abort(indexer)
+            raise
+
+    async def _abort(self, indexer: IncrementalIndexer):
+        try:
+            await run_in_threadpool(indexer.abort)
+        except Exception:
+            logger.exception("Cleanup of partially indexed '%s' failed", indexer.source_filename)
+
+    async def _drain(
+        self,
+        indexer: IncrementalIndexer,
+        in_flight: Dict[asyncio.Future, int],
+        timings: Dict[str, float],
+        batch_size: int,
+        on_window: Callable[[int, int], None],
+    ):
+        """Chờ ít nhất một cửa sổ xong rồi upsert kết quả của nó."""
+        done, _ = await asyncio.wait(list(in_flight), return_when=asyncio.FIRST_COMPLETED)
+        for finished in done:
+            page_count = in_flight.pop(finished)
+            chunks, window_timings = finished.result()
+            for key, value in window_timings.items():
+                timings[key] = timings.get(key, 0.0) + value
+
+            if chunks:
+                t0 = time.perf_counter()
+                for start in range(0, len(chunks), batch_size):
+                    await run_in_threadpool(indexer.write, chunks[start:start + batch_size])
+                timings["upsert_s"] = timings.get("upsert_s", 0.0) + time.perf_counter() - t0
+            on_window(len(chunks), page_count)
+
+    # --- BULK INGESTION ---
+
+    async def run_bulk(self, job: BulkIngestionJob, cleanup: bool = False):
+        """
+        Chạy bulk job tới khi xong (endpoint chạy nền qua submit_bulk, CLI gọi trực tiếp):
+        - File không đổi (cùng hash trong catalog) -> skipped, không parse.
+        - File không phải PDF, mỗi lượt (bulk_group_files file / bulk_group_bytes byte): parse song song
+          trong process pool, chunking + embedding một lượt cho cả nhóm, upsert gộp theo
+          bulk_upsert_batch_size point. Lượt sau được parse trong lúc lượt hiện tại đang embed + upsert.
+        - PDF: từng file theo cửa sổ trang (_index_pdf) -> PDF lớn không bị parse cả file vào RAM.
+        Lỗi của một file không làm hỏng các file khác.
+        """
+        next_parse: Optional[asyncio.Future] = None
+        try:
+            async with self._get_semaphore():
+                started = time.perf_counter()
+                job.update("running")
+                await run_in_threadpool(ensure_collection)
+
+                pending: List[FileStatus] = []
+                for f in job.files:
+                    if f.finished:
+                        continue
+                    if await run_in_threadpool(is_file_unchanged, f.filename, f.file_hash):
+                        f.status = "skipped"
+                    else:
+                        pending.append(f)
+                job.update()
+
+                pdfs = [f for f in pending if file_extension(f.filename) == ".pdf"]
+                others = [f for f in pending if file_extension(f.filename) != ".pdf"]
+
+                groups = _group_files(others, self.bulk_group_files, self.bulk_group_bytes)
+                if groups:
+                    next_parse = asyncio.ensure_future(self._parse_group(job, groups[0]))
+                for index in range(len(groups)):
+                    parsed = await next_parse
+                    next_parse = None
+                    if index + 1 < len(groups):
+                        next_parse = asyncio.ensure_future(self._parse_group(job, groups[index + 1]))
+                    async with self._lock_sources(f.filename for f, _ in parsed):
+                        await run_in_threadpool(self._index_group, job, parsed)
+                    job.update()
+
+                for f in pdfs:
+                    await self._index_bulk_pdf(job, f)
+                    job.update()
+
+                job.timings["total_s"] = time.perf_counter() - started
+                job.update("done")
+                logger.info(
+                    "[bulk %s] Ingested %d files: %s", job.id, len(job.files), job.counts(),
+                    extra={"job_id": job.id, "timings": job.timings},
+                )
+
+        except Exception as e:
+            logger.exception("[bulk %s] Bulk ingestion failed", job.id)
+            for f in job.files:
+                if not f.finished:
+                    f.fail(str(e))
+            job.update("failed")
+        finally:
+            if next_parse is not None:
+                next_parse.cancel()
+            self._tasks.pop(job.id, None)
+            if cleanup:
+                for f in job.files:
+                    if f.path and os.path.exists(f.path):
+                        os.remove(f.path)
+
+    async def _index_bulk_pdf(self, job: BulkIngestionJob, f: FileStatus):
+        """Một PDF của bulk job qua pipeline cửa sổ trang; lỗi chỉ làm file này failed."""
+        try:
+            async with self._lock_sources([f.filename]):
+                f.status = "parsing"
+                loop = asyncio.get_running_loop()
+                f.pages = await loop.run_in_executor(self._get_executor(), _count_pdf_pages, f.path)
+                if not f.pages:
+                    f.fail("No extractable text.")
+                    return
+
+                f.status = "indexing"
+                indexer = await run_in_threadpool(IncrementalIndexer, f.filename, f.file_hash, f.byte_size)
+
+                def on_window(chunk_count: int, page_count: int):
+                    f.chunks += chunk_count
+                    f.chunks_written = indexer.written
+
+                result = await self._index_pdf(
+                    f.path, indexer, f.pages, job.timings, self.bulk_upsert_batch_size, on_window
+                )
+                f.chunks = result.chunks
+                f.chunks_written = result.written
+                f.chunks_unchanged = result.unchanged
+                f.chunks_deleted = result.deleted
+                f.status = "done"
+        except Exception as e:
+            logger.warning("[bulk %s] Indexing '%s' failed: %s", job.id, f.filename, e)
+            f.fail(str(e))
+
+    async def _parse_group(self, job: BulkIngestionJob, group: List[FileStatus]) -> List[Tuple[FileStatus, Pages]]:
+        """Parse các file của một lượt trong process pool; file lỗi / không có text -> failed."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        for f in group:
+            f.status = "parsing"
+        results = await asyncio.gather(
+            *(loop.run_in_executor(executor, extract_pages, f.path, f.filename) for f in group),
+            return_exceptions=True,
+        )
+
+        parsed: List[Tuple[FileStatus, Pages]] = []
+        for f, result in zip(group, results):
+            if isinstance(result, BaseException):
+                logger.warning("[bulk %s] Parsing '%s' failed: %s", job.id, f.filename, result)
+                f.fail(str(result))
+                continue
+            pages, parse_s = result
+            job.timings["parse_s"] = job.timings.get("parse_s", 0.0) + parse_s
+            if not pages:
+                f.fail("No extractable text.")
+                continue
+            f.pages = len(pages)
+            parsed.append((f, pages))
+        return parsed
+
+    def _index_group(self, job: BulkIngestionJob, parsed: List[Tuple[FileStatus, Pages]]):
+        """Chunking + embedding cả lượt, upsert gộp point của mọi file rồi hoàn tất từng file (chạy trong thread)."""
+        if not parsed:
+            return
+        files = [f for f, _ in parsed]
+        timings: Dict[str, float] = {}
+        indexers: List[IncrementalIndexer] = []
+        try:
+            for f in files:
+                f.status = "indexing"
+            documents_chunks = prepare_documents_chunks([pages for _, pages in parsed], timings)
+
+            t0 = time.perf_counter()
+            indexers = [IncrementalIndexer(f.filename, f.file_hash, f.byte_size) for f in files]
+            points = []
+            for indexer, chunks in zip(indexers, documents_chunks):
+                points.extend(indexer.stage(chunks))
+            upsert_points(points, self.bulk_upsert_batch_size)
+
+            # Chunk cũ không còn trong bản mới bị xoá, catalog cập nhật sau khi point đã được ghi
+            for f, indexer in zip(files, indexers):
+                result = indexer.finish()
+                f.chunks = result.chunks
+                f.chunks_written = result.written
+                f.chunks_unchanged = result.unchanged
+                f.chunks_deleted = result.deleted
+                f.status = "done"
+            timings["upsert_s"] = time.perf_counter() - t0
+        except Exception as e:
+            logger.exception("[bulk %s] Indexing a group of %d files failed", job.id, len(files))
+            for f, indexer in zip(files, indexers):
+                if f.finished:
+                    continue
+                try:
+                    indexer.abort()
+                except Exception:
+                    logger.exception("Cleanup of partially indexed '%s' failed", f.filename)
+            for f in files:
+                if not f.finished:
+                    f.fail(str(e))
+        finally:
+            for key, value in timings.items():
+                job.timings[key] = job.timings.get(key, 0.0) + value
+
+    def _prune(self):
+        """Xoá job đã xong quá INGEST_JOB_TTL giây."""
+        now = time.time()
+        for jobs in (self._jobs, self._bulk_jobs):
+            expired = [
+                job_id for job_id, job in jobs.items()
+                if job.stage in ("done", "failed") and now - job.updated_at > self.job_ttl
+            ]
+            for job_id in expired:
+                jobs.pop(job_id, None)
+
+    def shutdown(self):
+        for task in self._tasks.values():
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+job_manager = IngestionJobManager(
+    max_workers=INGEST_WORKERS,
+    max_concurrent_jobs=INGEST_MAX_CONCURRENT_JOBS,
+    job_ttl=INGEST_JOB_TTL,
+    page_window=INGEST_PAGE_WINDOW,
+)
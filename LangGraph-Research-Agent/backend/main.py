@@ -1,17 +1,57 @@
 # main.py
-import os
+import asyncio
+import hashlib
+import json
+import logging
 import tempfile
-from typing import List, Dict, Any
+import time
+from dataclasses import asdict
+from typing import List, Dict, Any, Literal, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request, status, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk
 
 # Import agent và các hàm từ vectorstore
-from agent import rag_agent
-from vectorstore import add_document_to_vectorstore, list_indexed_documents
+from agent import (
+    build_agent,
+    get_judge_stats,
+    get_llm_batching_stats,
+    get_prerouter_stats,
+    get_web_cache_stats,
+    rag_agent,
+)
+from resilience import get_resilience_stats
+from answer_cache import answer_cache
+from config import (
+    ANSWER_CACHE_ENABLED,
+    BULK_MAX_FILES,
+    CHAT_BATCH_MAX_CONCURRENCY,
+    CHAT_BATCH_MAX_QUERIES,
+    CONVERSATION_MEMORY_ENABLED,
+    PREROUTER_ENABLED,
+    UPLOAD_SPOOL_CHUNK_SIZE,
+    WARMUP_ON_STARTUP,
+    WARMUP_RETRY_SECONDS,
+)
+from document_parsers import file_extension, is_supported
+from jobs import BulkIngestionJob, FileStatus, IngestionJob, job_manager
+from memory import conversation_store
+from observability import HTTP_DURATION, configure_logging
+from vectorstore import (
+    alist_indexed_documents,
+    catalog,
+    get_embedding_cache_stats,
+    prime_query_embeddings,
+)
+from warmup import readiness, register_components, warm_up
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -20,6 +60,9 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# Graph dùng cho /chat/: không checkpointer cho tới khi startup mở bộ nhớ hội thoại
+chat_agent = rag_agent
+
 # --- CORS Config (QUAN TRỌNG) ---
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +72,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Metrics: thời gian xử lý mỗi request ---
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    t0 = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Path template (/jobs/{job_id}) thay vì URL thật -> số label ít; SSE chỉ tính tới lúc gửi header
+        route = request.scope.get("route")
+        HTTP_DURATION.labels(
+            method=request.method, path=getattr(route, "path", "unmatched"), status=str(status_code)
+        ).observe(time.perf_counter() - t0)
+
 # --- Pydantic Models ---
 class TraceEvent(BaseModel):
     step: int
@@ -42,60 +101,317 @@ class QueryRequest(BaseModel):
     query: str
     enable_web_search: bool = True
     selected_files: List[str] = [] # Danh sách file người dùng chọn
+    speculative_retrieval: Optional[bool] = None # None = theo config SPECULATIVE_RETRIEVAL
+    retrieval_mode: Optional[Literal["dense", "hybrid"]] = None # None = theo config RETRIEVAL_MODE
+    use_answer_cache: Optional[bool] = None # None = theo config ANSWER_CACHE_ENABLED
+    use_prerouter: Optional[bool] = None # None = theo config PREROUTER_ENABLED
 
 class AgentResponse(BaseModel):
     response: str
     trace_events: List[TraceEvent] = Field(default_factory=list)
 
-class DocumentUploadResponse(BaseModel):
-    message: str
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=CHAT_BATCH_MAX_QUERIES)
+    selected_files: List[str] = [] # Dùng chung cho mọi query
+    enable_web_search: bool = True
+    retrieval_mode: Optional[Literal["dense", "hybrid"]] = None
+    use_answer_cache: Optional[bool] = None
+    use_prerouter: Optional[bool] = None
+    max_concurrency: Optional[int] = Field(None, ge=1) # None = CHAT_BATCH_MAX_CONCURRENCY
+
+class BatchItem(BaseModel):
+    index: int
+    query: str
+    response: str = ""
+    trace_events: List[TraceEvent] = Field(default_factory=list)
+    error: Optional[str] = None # Lỗi riêng của query này (các query khác vẫn chạy)
+
+class BatchResponse(BaseModel):
+    results: List[BatchItem]
+    elapsed_ms: float
+
+class CatalogEntryResponse(BaseModel):
+    file_name: str
+    chunk_count: int
+    byte_size: int
+    ingested_at: float
+    content_hash: str
+
+class IngestionJobResponse(BaseModel):
+    job_id: str
     filename: str
-    processed_chunks: int
+    stage: str
+    percent: float
+    processed_chunks: int = 0
+    chunks_written: int = 0 # Chunk mới/đã sửa được ghi
+    chunks_unchanged: int = 0 # Chunk giữ nguyên (không embed/upsert lại)
+    chunks_deleted: int = 0 # Chunk cũ bị xoá
+    skipped: bool = False # File không đổi -> bỏ qua
+    pages_total: int = 0
+    pages_done: int = 0
+    error: Optional[str] = None
+    timings: Dict[str, float] = Field(default_factory=dict) # Thời gian từng giai đoạn ingestion (giây)
+
+    @classmethod
+    def from_job(cls, job: IngestionJob) -> "IngestionJobResponse":
+        return cls(
+            job_id=job.id,
+            filename=job.filename,
+            stage=job.stage,
+            percent=job.percent,
+            processed_chunks=job.chunks,
+            chunks_written=job.chunks_written,
+            chunks_unchanged=job.chunks_unchanged,
+            chunks_deleted=job.chunks_deleted,
+            skipped=job.skipped,
+            pages_total=job.pages_total,
+            pages_done=job.pages_done,
+            error=job.error,
+            timings=job.timings,
+        )
+
+class FileStatusResponse(BaseModel):
+    filename: str
+    status: str # queued | parsing | indexing | done | skipped | failed
+    pages: int = 0
+    chunks: int = 0
+    chunks_written: int = 0
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
+    error: Optional[str] = None
+
+class BulkIngestionJobResponse(BaseModel):
+    job_id: str
+    stage: str
+    percent: float
+    counts: Dict[str, int] = Field(default_factory=dict) # Số file theo status
+    files: List[FileStatusResponse] = Field(default_factory=list)
+    timings: Dict[str, float] = Field(default_factory=dict)
+
+    @classmethod
+    def from_job(cls, job: BulkIngestionJob) -> "BulkIngestionJobResponse":
+        return cls(
+            job_id=job.id,
+            stage=job.stage,
+            percent=job.percent,
+            counts=job.counts(),
+            files=[
+                FileStatusResponse(
+                    filename=f.filename,
+                    status=f.status,
+                    pages=f.pages,
+                    chunks=f.chunks,
+                    chunks_written=f.chunks_written,
+                    chunks_unchanged=f.chunks_unchanged,
+                    chunks_deleted=f.chunks_deleted,
+                    error=f.error,
+                )
+                for f in job.files
+            ],
+            timings=job.timings,
+        )
 
 # --- API 1: LẤY DANH SÁCH FILE ---
 @app.get("/documents/", response_model=List[str])
 async def get_documents():
     """Trả về danh sách các file đang có trong DB"""
-    docs = list_indexed_documents()
+    docs = await alist_indexed_documents()
     return docs
 
-# --- API 2: UPLOAD DOCUMENT ---
-@app.post("/upload-document/", response_model=DocumentUploadResponse, status_code=status.HTTP_200_OK)
+# --- API 1b: DANH MỤC FILE (CHI TIẾT) ---
+@app.get("/documents/catalog", response_model=List[CatalogEntryResponse])
+async def get_document_catalog():
+    """Trả về danh mục file: số chunk, dung lượng, thời điểm index, hash nội dung."""
+    entries = await run_in_threadpool(catalog.list_entries)
+    return [CatalogEntryResponse(**asdict(entry)) for entry in entries]
+
+@app.post("/documents/catalog/rebuild", response_model=List[CatalogEntryResponse])
+async def rebuild_document_catalog():
+    """Dựng lại danh mục bằng một lượt scroll phân trang toàn bộ collection."""
+    entries = await run_in_threadpool(catalog.rebuild)
+    return [CatalogEntryResponse(**asdict(entry)) for entry in entries]
+
+# --- API 2: UPLOAD DOCUMENT (CHẠY NỀN) ---
+@app.post("/upload-document/", response_model=IngestionJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(file: UploadFile = File(...)):
-    """Uploads a PDF document."""
+    """Nhận PDF, tạo job ingestion chạy nền và trả về job id ngay."""
     if not file.filename.endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="Only PDF files are supported.")
+        raise HTTPException(
+            status_code=400, detail="Only PDF files are supported. Use /upload-documents/ for other formats."
+        )
+
+    temp_file_path, file_hash, _ = await _spool_upload(file, ".pdf")
+    logger.info("Received PDF: %s", file.filename)
+
+    # Job tự xoá file tạm khi xong
+    job = job_manager.submit(temp_file_path, file.filename, file_hash)
+    return IngestionJobResponse.from_job(job)
+
+async def _spool_upload(file: UploadFile, suffix: str) -> Tuple[str, str, int]:
+    """
+    Ghi upload ra đĩa theo từng khối -> không giữ cả file trong RAM (hash tính luôn khi ghi).
+    Trả về (đường dẫn file tạm, sha256, số byte).
+    """
+    file_hash = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        while True:
+            block = await file.read(UPLOAD_SPOOL_CHUNK_SIZE)
+            if not block:
+                break
+            file_hash.update(block)
+            size += len(block)
+            tmp_file.write(block)
+    return tmp_file.name, file_hash.hexdigest(), size
+
+# --- API 2c: UPLOAD NHIỀU FILE (BULK, CHẠY NỀN) ---
+@app.post("/upload-documents/", response_model=BulkIngestionJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def upload_documents(files: List[UploadFile] = File(...)):
+    """
+    Nhận nhiều file (pdf / docx / txt / md / html / pptx...), ingest hàng loạt chạy nền.
+    File sai định dạng hoặc trùng tên được báo failed ngay, các file khác vẫn chạy.
+    Theo dõi trạng thái từng file qua /jobs/bulk/{job_id}.
+    """
+    if len(files) > BULK_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {BULK_MAX_FILES} per request).")
+
+    statuses: List[FileStatus] = []
+    seen = set()
+    for file in files:
+        if not is_supported(file.filename):
+            statuses.append(FileStatus(filename=file.filename, status="failed", error="Unsupported file type."))
+            continue
+        if file.filename in seen:
+            statuses.append(FileStatus(filename=file.filename, status="failed", error="Duplicate file name in request."))
+            continue
+        seen.add(file.filename)
+        path, file_hash, size = await _spool_upload(file, file_extension(file.filename))
+        statuses.append(FileStatus(filename=file.filename, file_hash=file_hash, byte_size=size, path=path))
+
+    logger.info("Received %d files for bulk ingestion", len(files))
+
+    # Job tự xoá các file tạm khi xong
+    job = job_manager.submit_bulk(statuses)
+    return BulkIngestionJobResponse.from_job(job)
+
+@app.get("/jobs/bulk/{job_id}", response_model=BulkIngestionJobResponse)
+async def get_bulk_job(job_id: str):
+    """Trạng thái bulk job + từng file."""
+    job = job_manager.get_bulk(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return BulkIngestionJobResponse.from_job(job)
+
+# --- API 2b: TIẾN ĐỘ JOB INGESTION ---
+@app.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_job(job_id: str):
+    """Trả về stage + percent của job ingestion."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return IngestionJobResponse.from_job(job)
+
+# --- HELPER: CONFIG & TRACE (DÙNG CHUNG CHO /chat/ VÀ /chat/stream) ---
+def _agent_config(request: QueryRequest) -> Dict[str, Any]:
+    """Cấu hình truyền xuống Agent"""
+    config = {
+        "configurable": {
+            "thread_id": request.session_id,
+            "web_search_enabled": request.enable_web_search,
+            "selected_files": request.selected_files # Truyền danh sách file
+        }
+    }
+    if request.speculative_retrieval is not None:
+        config["configurable"]["speculative_retrieval"] = request.speculative_retrieval
+    if request.retrieval_mode is not None:
+        config["configurable"]["retrieval_mode"] = request.retrieval_mode
+    if request.use_answer_cache is not None:
+        config["configurable"]["use_answer_cache"] = request.use_answer_cache
+    if request.use_prerouter is not None:
+        config["configurable"]["use_prerouter"] = request.use_prerouter
+    return config
+
+
+_DEGRADED_STEPS = {"router": "router", "rag_lookup": "judge", "web_search": "web", "answer": "answer"}
+
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        file_content = await file.read()
-        tmp_file.write(file_content)
-        temp_file_path = tmp_file.name
+def _trace_from_update(step: int, s: Dict[str, Any]) -> Tuple[TraceEvent, Optional[str]]:
+    """
+    Chuyển một update của graph thành TraceEvent.
+    Trả về kèm nội dung AIMessage mới nhất trong state (nếu có).
+    """
+    # Trace logic
+    if '__end__' in s:
+        current_node_name = '__end__'
+        node_output_state = s['__end__']
+    else:
+        current_node_name = list(s.keys())[0] 
+        node_output_state = s[current_node_name]
+
+    event_desc = f"Node: {current_node_name}"
+    event_details = {}
     
-    print(f"Received PDF: {file.filename}")
+    if current_node_name == "prepare_turn":
+        event_desc = "Prepare Turn"
+        event_details = {"trimmed_messages": len(node_output_state.get("messages") or [])}
+    elif current_node_name == "cache_lookup":
+        cache_status = node_output_state.get("answer_cache", "off")
+        event_desc = f"Answer Cache: {cache_status}"
+        event_details = {"cache": cache_status}
+        if cache_status == "hit":
+            event_details["similarity"] = round(node_output_state.get("answer_cache_similarity", 0.0), 4)
+    elif current_node_name == "router":
+        route = node_output_state.get('route')
+        event_desc = f"Router -> {route}"
+        event_details = {"decision": route}
+        if node_output_state.get("router_source"):
+            event_details["source"] = node_output_state["router_source"]
+        if node_output_state.get("router_source") == "prerouter":
+            event_desc += " (pre-router)"
+            event_details["score"] = round(node_output_state.get("router_score", 0.0), 4)
+    elif current_node_name == "rag_lookup":
+        rag_txt = node_output_state.get("rag", "")
+        event_desc = "RAG Check"
+        event_details = {"summary": rag_txt[:100]}
+        if node_output_state.get("rag_judge"):
+            event_details["judge"] = node_output_state["rag_judge"]
+            event_details["top_score"] = round(node_output_state.get("rag_top_score", 0.0), 4)
+    elif current_node_name == "web_search":
+        web_txt = node_output_state.get("web", "")
+        event_desc = "Web Search"
+        event_details = {"summary": web_txt[:100]}
+        if node_output_state.get("web_cache"):
+            event_details["cache"] = node_output_state["web_cache"]
+            if node_output_state["web_cache"] in ("hit", "coalesced"):
+                event_desc = "Web Search (cached)"
 
-    try:
-        loader = PyPDFLoader(temp_file_path)
-        documents = loader.load()
-
-        total_chunks_added = 0
-        if documents:
-            full_text_content = "\n\n".join([doc.page_content for doc in documents])
-            
-            # Gọi hàm add với filename để lưu metadata
-            total_chunks_added = add_document_to_vectorstore(full_text_content, file.filename)
-        
-        return DocumentUploadResponse(
-            message=f"PDF '{file.filename}' uploaded and indexed.",
-            filename=file.filename,
-            processed_chunks=total_chunks_added
-        )
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Failed to process PDF: {e}")
-    finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+    # Thời gian chạy của node (đo trong graph, xem agent._timed_node)
+    if node_output_state and current_node_name in (node_output_state.get("node_timings") or {}):
+        event_details["duration_ms"] = node_output_state["node_timings"][current_node_name]
+
+    # Node chạy ở chế độ degraded (provider quá deadline) -> đánh dấu trong trace
+    degraded_step = _DEGRADED_STEPS.get(current_node_name)
+    if node_output_state and degraded_step in (node_output_state.get("degraded") or []):
+        event_details["degraded"] = True
+        event_desc += " (degraded)"
+
+    event = TraceEvent(
+        step=step, node_name=current_node_name, 
+        description=event_desc, details=event_details, event_type="node"
+    )
+
+    # Chỉ lấy AIMessage node vừa thêm (tin nhắn cuối); state có cả lịch sử các lượt trước
+    message = None
+    if node_output_state and node_output_state.get("messages"):
+        last = node_output_state["messages"][-1]
+        if isinstance(last, AIMessage):
+            message = last.content
+
+    return event, message
+
+def _sse(event: str, data: Any) -> str:
+    """Đóng gói một Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 # --- API 3: CHAT ---
 @app.post("/chat/", response_model=AgentResponse)
@@ -103,65 +419,220 @@ async def chat_with_agent(request: QueryRequest):
     trace_events_for_frontend: List[TraceEvent] = []
     
     try:
-        # Cấu hình truyền xuống Agent
-        config = {
-            "configurable": {
-                "thread_id": request.session_id,
-                "web_search_enabled": request.enable_web_search,
-                "selected_files": request.selected_files # Truyền danh sách file
-            }
-        }
+        config = _agent_config(request)
         inputs = {"messages": [HumanMessage(content=request.query)]}
         final_message = ""
         
-        print(f"--- Chat Session: {request.session_id} | Files: {request.selected_files} ---")
-
-        for i, s in enumerate(rag_agent.stream(inputs, config=config)):
-            # Trace logic
-            if '__end__' in s:
-                current_node_name = '__end__'
-                node_output_state = s['__end__']
-            else:
-                current_node_name = list(s.keys())[0] 
-                node_output_state = s[current_node_name]
-
-            event_desc = f"Node: {current_node_name}"
-            event_details = {}
-            
-            if current_node_name == "router":
-                route = node_output_state.get('route')
-                event_desc = f"Router -> {route}"
-                event_details = {"decision": route}
-            elif current_node_name == "rag_lookup":
-                rag_txt = node_output_state.get("rag", "")
-                event_desc = "RAG Check"
-                event_details = {"summary": rag_txt[:100]}
-            elif current_node_name == "web_search":
-                web_txt = node_output_state.get("web", "")
-                event_desc = "Web Search"
-                event_details = {"summary": web_txt[:100]}
-
-            trace_events_for_frontend.append(TraceEvent(
-                step=i+1, node_name=current_node_name, 
-                description=event_desc, details=event_details, event_type="node"
-            ))
-
-            state_dict = s.get('__end__') or s.get(list(s.keys())[0])
-            if state_dict and "messages" in state_dict:
-                for msg in reversed(state_dict["messages"]):
-                    if isinstance(msg, AIMessage):
-                        final_message = msg.content
-                        break
+        logger.info("Chat session %s | files: %s", request.session_id, request.selected_files)
+
+        # astream: chạy các node async -> không block event loop trong lúc chờ Gemini/Tavily/Qdrant
+        async for s in chat_agent.astream(inputs, config=config):
+            event, message = _trace_from_update(len(trace_events_for_frontend) + 1, s)
+            trace_events_for_frontend.append(event)
+            if message:
+                final_message = message
+        await conversation_store.end_turn(request.session_id)
         
         if not final_message: final_message = "No response generated."
 
         return AgentResponse(response=final_message, trace_events=trace_events_for_frontend)
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Chat session %s failed", request.session_id)
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
+# --- API 3b: CHAT BATCH (OFFLINE / ĐÁNH GIÁ) ---
+def _batch_config(request: BatchQueryRequest) -> Dict[str, Any]:
+    """Config cho mỗi query trong batch: không có session, router / judge đi qua LLMBatcher."""
+    configurable = {
+        "web_search_enabled": request.enable_web_search,
+        "selected_files": request.selected_files,
+        "batch_llm": True,
+        # Query embedding đã được embed trước theo batch -> không cần retrieval song song router
+        "speculative_retrieval": False,
+    }
+    if request.retrieval_mode is not None:
+        configurable["retrieval_mode"] = request.retrieval_mode
+    if request.use_answer_cache is not None:
+        configurable["use_answer_cache"] = request.use_answer_cache
+    if request.use_prerouter is not None:
+        configurable["use_prerouter"] = request.use_prerouter
+    return {"configurable": configurable}
+
+def _uses_query_vectors(config: Dict[str, Any]) -> bool:
+    """Có bước nào dùng vector query: retrieval trên selected_files, answer cache, pre-router."""
+    configurable = config["configurable"]
+    return bool(
+        configurable["selected_files"]
+        or configurable.get("use_answer_cache", ANSWER_CACHE_ENABLED)
+        or configurable.get("use_prerouter", PREROUTER_ENABLED)
+    )
+
+@app.post("/chat/batch", response_model=BatchResponse)
+async def chat_batch(request: BatchQueryRequest):
+    """
+    Chạy nhiều query độc lập (không lưu lịch sử) trên cùng selected_files:
+    - Query embedding được tính trong một lần chạy model.
+    - Tối đa max_concurrency query chạy song song; lời gọi router / judge được gom thành abatch.
+    - Mỗi query có response / trace / error riêng, theo đúng thứ tự đầu vào.
+    """
+    started = time.perf_counter()
+    config = _batch_config(request)
+    semaphore = asyncio.Semaphore(request.max_concurrency or CHAT_BATCH_MAX_CONCURRENCY)
+
+    logger.info("Chat batch: %d queries | files: %s", len(request.queries), request.selected_files)
+    if _uses_query_vectors(config):
+        try:
+            await run_in_threadpool(prime_query_embeddings, request.queries)
+        except Exception as e:
+            # Không chặn batch: từng query sẽ tự embed khi retrieval
+            logger.warning("Priming query embeddings failed: %s", e)
+
+    async def run_one(index: int, query: str) -> BatchItem:
+        item = BatchItem(index=index, query=query)
+        async with semaphore:
+            try:
+                inputs = {"messages": [HumanMessage(content=query)]}
+                async for s in rag_agent.astream(inputs, config=config):
+                    event, message = _trace_from_update(len(item.trace_events) + 1, s)
+                    item.trace_events.append(event)
+                    if message:
+                        item.response = message
+                if not item.response: item.response = "No response generated."
+            except Exception as e:
+                logger.exception("Chat batch query %d failed", index)
+                item.error = f"Error: {e}"
+        return item
+
+    results = await asyncio.gather(*(run_one(i, q) for i, q in enumerate(request.queries)))
+    return BatchResponse(results=list(results), elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+
+# --- API 4: CHAT STREAMING (SSE) ---
+@app.post("/chat/stream")
+async def chat_with_agent_stream(request: QueryRequest):
+    """
+    Giống /chat/ nhưng trả về Server-Sent Events:
+    - event "trace": TraceEvent ngay khi mỗi node chạy xong.
+    - event "token": từng đoạn text của answer_llm khi Gemini sinh ra.
+    - event "done": câu trả lời cuối cùng + toàn bộ trace.
+    - event "error": lỗi trong lúc chạy graph.
+    """
+    config = _agent_config(request)
+    inputs = {"messages": [HumanMessage(content=request.query)]}
+
+    logger.info("Chat stream session %s | files: %s", request.session_id, request.selected_files)
+
+    async def event_stream():
+        trace_events: List[TraceEvent] = []
+        final_message = ""
+        try:
+            async for mode, chunk in chat_agent.astream(
+                inputs, config=config, stream_mode=["updates", "messages"]
+            ):
+                if mode == "messages":
+                    # Chỉ stream token của answer_llm (router/judge là structured output).
+                    # Chỉ lấy AIMessageChunk: khi node "answer" kết thúc LangGraph còn phát lại
+                    # AIMessage cuối (id mới) -> không lọc thì câu trả lời bị gửi hai lần.
+                    msg_chunk, metadata = chunk
+                    if metadata.get("langgraph_node") != "answer" or not isinstance(msg_chunk, AIMessageChunk):
+                        continue
+                    if isinstance(msg_chunk.content, str) and msg_chunk.content:
+                        yield _sse("token", {"text": msg_chunk.content})
+                    continue
+
+                event, message = _trace_from_update(len(trace_events) + 1, chunk)
+                trace_events.append(event)
+                if message:
+                    final_message = message
+                yield _sse("trace", event.model_dump())
+
+            await conversation_store.end_turn(request.session_id)
+            if not final_message: final_message = "No response generated."
+
+            done = AgentResponse(response=final_message, trace_events=trace_events)
+            yield _sse("done", done.model_dump())
+
+        except Exception as e:
+            logger.exception("Chat stream session %s failed", request.session_id)
+            yield _sse("error", {"detail": f"Error: {e}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _warm_up_until_ready():
+    """Warm-up chạy nền (không chặn startup); bước lỗi được thử lại cho tới khi ready."""
+    while True:
+        snapshot = await run_in_threadpool(warm_up)
+        if snapshot["ready"]:
+            logger.info("Worker is ready.")
+            return
+        await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+_warmup_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_warm_up():
+    """Qdrant (collection / payload index / HNSW config), embedding model, client LLM."""
+    global _warmup_task
+    if WARMUP_ON_STARTUP:
+        register_components()
+        _warmup_task = asyncio.create_task(_warm_up_until_ready())
+
+@app.on_event("startup")
+async def setup_conversation_memory():
+    """Bật checkpointer SQLite: session_id (thread_id) giữ lịch sử hội thoại giữa các lượt."""
+    global chat_agent
+    if CONVERSATION_MEMORY_ENABLED:
+        readiness.require("conversation_memory")
+        chat_agent = build_agent(checkpointer=await conversation_store.open())
+        readiness.mark("conversation_memory", "ok")
+
+@app.on_event("shutdown")
+async def shutdown_jobs():
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+    job_manager.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_conversation_memory():
+    await conversation_store.close()
+
+# --- API: XOÁ LỊCH SỬ HỘI THOẠI ---
+@app.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(session_id: str):
+    await conversation_store.delete_thread(session_id)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    """Liveness: process còn sống (không kiểm tra phụ thuộc)."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 khi warm-up xong (model đã load, Qdrant phản hồi, client LLM sẵn sàng), ngược lại 503."""
+    snapshot = readiness.snapshot()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if snapshot["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=snapshot,
+    )
+
+@app.get("/stats")
+async def get_stats():
+    """Bộ đếm nội bộ (cache hit/miss...) phục vụ tuning."""
+    return {
+        "embedding_cache": get_embedding_cache_stats(),
+        "rag_judge": get_judge_stats(),
+        "web_cache": get_web_cache_stats(),
+        "answer_cache": answer_cache.stats(),
+        "resilience": get_resilience_stats(),
+        "llm_batching": get_llm_batching_stats(),
+        "prerouter": get_prerouter_stats(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus: histogram thời gian node / LLM / embedding / Qdrant / Tavily / HTTP (theo từng worker)."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,140 @@
+# memory.py
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from config import (
+    CONVERSATION_DB_PATH,
+    SESSION_IDLE_TTL,
+    SESSION_SWEEP_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationStore:
+    """
+    Bộ nhớ hội thoại bền vững (SQLite trên đĩa) cho LangGraph checkpointer:
+    - Mỗi session_id = một thread; sau mỗi lượt chỉ giữ checkpoint mới nhất của thread
+      (lịch sử tin nhắn đã được agent cắt gọn trong state) -> DB không phình theo số lượt.
+    - Thread không hoạt động quá idle_ttl giây bị xoá định kỳ.
+    """
+
+    def __init__(self, db_path: str, idle_ttl: float, sweep_interval: float):
+        self.db_path = db_path
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.saver: Optional[AsyncSqliteSaver] = None
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def open(self) -> AsyncSqliteSaver:
+        if self.saver is not None:
+            return self.saver
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = await aiosqlite.connect(self.db_path)
+        await self._conn.execute("PRAGMA journal_mode=WAL")
+        self.saver = AsyncSqliteSaver(self._conn)
+        await self.saver.setup()
+
+        await self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_activity (thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)"
+        )
+        await self._conn.commit()
+
+        self._sweeper = asyncio.create_task(self._sweep_loop())
+        logger.info("Conversation memory: %s (idle TTL %.0fs)", self.db_path, self.idle_ttl)
+        return self.saver
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self._conn is not None:
+            await self._conn.close()
+        self._conn = None
+        self.saver = None
+
+    async def end_turn(self, thread_id: str):
+        """Gọi sau mỗi lượt chat: cập nhật thời điểm hoạt động + xoá checkpoint cũ của thread."""
+        if self.saver is None:
+            return
+        await self._conn.execute(
+            "INSERT INTO session_activity (thread_id, last_seen) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+            (thread_id, time.time()),
+        )
+        await self._conn.commit()
+        await self._prune_checkpoints(thread_id)
+
+    async def _prune_checkpoints(self, thread_id: str):
+        """
+        Chỉ giữ checkpoint mới nhất của thread. Dùng aprune("keep_latest") nếu saver có hỗ trợ;
+        AsyncSqliteSaver 3.x chưa cài -> xoá trực tiếp trên bảng checkpoints / writes của nó.
+        Chỗ duy nhất phụ thuộc schema nội bộ của langgraph-checkpoint-sqlite (đã pin major
+        trong requirements.txt, có test trong tests/test_memory.py).
+        """
+        try:
+            await self.saver.aprune([thread_id], strategy="keep_latest")
+            return
+        except NotImplementedError:
+            pass
+        latest = (
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = '' "
+            "ORDER BY checkpoint_id DESC LIMIT 1"
+        )
+        async with self.saver.lock:
+            await self._conn.execute(
+                f"DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id NOT IN ({latest})",
+                (thread_id, thread_id),
+            )
+            await self._conn.execute(
+                f"DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN ({latest})",
+                (thread_id, thread_id),
+            )
+            await self._conn.commit()
+
+    async def delete_thread(self, thread_id: str):
+        if self.saver is None:
+            return
+        await self.saver.adelete_thread(thread_id)
+        await self._conn.execute("DELETE FROM session_activity WHERE thread_id = ?", (thread_id,))
+        await self._conn.commit()
+
+    async def evict_idle(self) -> int:
+        """Xoá thread không hoạt động quá idle_ttl giây. Trả về số thread đã xoá."""
+        if self.saver is None:
+            return 0
+        cutoff = time.time() - self.idle_ttl
+        async with self._conn.execute(
+            "SELECT thread_id FROM session_activity WHERE last_seen < ?", (cutoff,)
+        ) as cursor:
+            expired = [row[0] for row in await cursor.fetchall()]
+        for thread_id in expired:
+            await self.delete_thread(thread_id)
+        if expired:
+            logger.info("Conversation memory: evicted %d idle sessions.", len(expired))
+        return len(expired)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                logger.error("Conversation memory sweep error: %s", e)
+
+
+conversation_store = ConversationStore(
+    db_path=CONVERSATION_DB_PATH,
+    idle_ttl=SESSION_IDLE_TTL,
+    sweep_interval=SESSION_SWEEP_INTERVAL,
+)
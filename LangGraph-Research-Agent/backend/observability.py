@@ -0,0 +1,143 @@
+# observability.py
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+from prometheus_client import Counter, Histogram
+
+from config import LOG_FORMAT, LOG_LEVEL
+
+# =====================================================================
+# LOGGING
+# =====================================================================
+
+# Thuộc tính chuẩn của LogRecord -> phần còn lại (truyền qua extra=...) là field có cấu trúc
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi dòng log là một JSON object: ts, level, logger, msg + các field truyền qua extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Cấu hình root logger một lần (text cho dev, json cho log collector)."""
+    handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+
+# =====================================================================
+# PROMETHEUS METRICS
+# =====================================================================
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_SIZE_BUCKETS = (256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+
+NODE_DURATION = Histogram(
+    "agent_node_duration_seconds", "Thời gian chạy mỗi node của graph", ["node"], buckets=_LATENCY_BUCKETS
+)
+NODE_ERRORS = Counter("agent_node_errors_total", "Số lần node raise exception", ["node"])
+
+PROVIDER_DURATION = Histogram(
+    "provider_call_duration_seconds",
+    "Thời gian mỗi lần gọi provider (Gemini / Tavily), theo kết quả ok / timeout / error",
+    ["provider", "op", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+PROVIDER_EVENTS = Counter(
+    "provider_events_total", "Sự kiện provider: calls / retries / timeouts / errors / failed / queue_timeout",
+    ["provider", "op", "event"],
+)
+PROMPT_CHARS = Histogram("llm_prompt_chars", "Độ dài prompt gửi LLM (ký tự)", ["op"], buckets=_SIZE_BUCKETS)
+PREROUTER_DECISIONS = Counter(
+    "prerouter_decisions_total", "Quyết định của pre-router: hit (bỏ qua router LLM) / fallback, theo route dự đoán",
+    ["outcome", "route"],
+)
+CONTEXT_CHARS = Histogram(
+    "agent_context_chars", "Độ dài context đưa vào answer (ký tự) theo nguồn rag / web", ["source"], buckets=_SIZE_BUCKETS
+)
+
+EMBED_DURATION = Histogram(
+    "embedding_duration_seconds", "Thời gian gọi embedding model (cache miss)", ["op"], buckets=_LATENCY_BUCKETS
+)
+EMBED_TEXTS = Counter("embedding_texts_total", "Số text đã embed bằng model", ["op"])
+
+QDRANT_DURATION = Histogram("qdrant_call_duration_seconds", "Thời gian gọi Qdrant", ["op"], buckets=_LATENCY_BUCKETS)
+QDRANT_ERRORS = Counter("qdrant_errors_total", "Số lời gọi Qdrant lỗi", ["op"])
+
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý HTTP request", ["method", "path", "status"], buckets=_LATENCY_BUCKETS
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, errors: Optional[Counter] = None, **labels):
+    """Đo thời gian khối lệnh vào histogram (kể cả khi lỗi; lỗi được đếm vào errors nếu có)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if errors is not None:
+            errors.labels(**labels).inc()
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - t0)
+
+
+def qdrant_call(op: str):
+    return timed(QDRANT_DURATION, QDRANT_ERRORS, op=op)
+
+
+def message_chars(messages) -> int:
+    """Tổng số ký tự của danh sách message (tuple ("role", text) hoặc BaseMessage)."""
+    total = 0
+    for message in messages:
+        content = message[1] if isinstance(message, tuple) else getattr(message, "content", message)
+        total += len(content) if isinstance(content, str) else len(str(content))
+    return total
+
+
+def observe_prompt(op: str, messages) -> int:
+    chars = message_chars(messages)
+    PROMPT_CHARS.labels(op=op).observe(chars)
+    return chars
+
+
+class InstrumentedEmbeddings(Embeddings):
+    """Bọc embedding model để đo thời gian + số text mỗi lần gọi model."""
+
+    def __init__(self, base: Embeddings):
+        self.base = base
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        EMBED_TEXTS.labels(op="documents").inc(len(texts))
+        with timed(EMBED_DURATION, op="documents"):
+            return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        EMBED_TEXTS.labels(op="query").inc()
+        with timed(EMBED_DURATION, op="query"):
+            return self.base.embed_query(text)
@@ -0,0 +1,211 @@
+# prerouter.py
+import json
+import logging
+import random
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    PREROUTER_EXEMPLARS_PATH,
+    PREROUTER_MARGIN,
+    PREROUTER_SHADOW_RATE,
+    PREROUTER_THRESHOLD,
+    PREROUTER_TOP_K,
+)
+from observability import PREROUTER_DECISIONS
+
+logger = logging.getLogger(__name__)
+
+ROUTES = ("rag", "web", "answer", "end")
+
+# Exemplar mặc định (Việt + Anh); thay bằng PREROUTER_EXEMPLARS_PATH cho dữ liệu thật
+DEFAULT_EXEMPLARS: Dict[str, List[str]] = {
+    "rag": [
+        "Tài liệu nói gì về vấn đề này?",
+        "Theo tài liệu, quy trình cài đặt gồm những bước nào?",
+        "Tóm tắt nội dung file PDF tôi đã tải lên",
+        "Trong tài liệu, mã lỗi này có nghĩa là gì?",
+        "Hướng dẫn sử dụng nói gì về cách cấu hình?",
+        "What does the document say about this topic?",
+        "Summarize the PDF I uploaded",
+        "According to the manual, how do I configure the device?",
+        "What does error code E-42 mean in the documentation?",
+        "Which section of the report describes the installation steps?",
+        "List the requirements mentioned in the document",
+        "Explain the troubleshooting procedure from the guide",
+    ],
+    "web": [
+        "Thời tiết hôm nay thế nào?",
+        "Tin tức mới nhất hôm nay",
+        "Giá vàng hôm nay bao nhiêu?",
+        "Tỷ số trận đấu tối qua",
+        "Giá bitcoin hiện tại",
+        "What's the weather like today?",
+        "Latest news today",
+        "What is the current stock price of Apple?",
+        "Live score of the football match tonight",
+        "What happened in the news this week?",
+    ],
+    "answer": [
+        "Bạn là ai?",
+        "Bạn có thể làm gì?",
+        "Bạn hoạt động như thế nào?",
+        "Tên bạn là gì?",
+        "What is your name?",
+        "What can you do?",
+        "Who are you?",
+        "How do you work?",
+        "What kind of questions can you answer?",
+    ],
+    "end": [
+        "Xin chào",
+        "Chào bạn",
+        "Cảm ơn bạn",
+        "Cảm ơn nhiều",
+        "Tạm biệt",
+        "Hello",
+        "Hi there",
+        "Good morning",
+        "Thanks!",
+        "Thank you so much",
+        "Bye, see you later",
+    ],
+}
+
+# Câu trả lời cho route "end" khi router LLM không được gọi (dùng được cho cả chào hỏi lẫn cảm ơn)
+END_REPLIES = {
+    "vi": "Rất vui được hỗ trợ bạn! Bạn cần mình giúp gì không?",
+    "en": "Happy to help! What would you like to know?",
+}
+
+
+def end_reply(query: str) -> str:
+    """Có chữ cái ngoài ASCII (dấu tiếng Việt) -> trả lời tiếng Việt."""
+    return END_REPLIES["vi" if any(ord(c) > 127 and c.isalpha() for c in query) else "en"]
+
+
+def load_exemplars(path: str = PREROUTER_EXEMPLARS_PATH) -> Dict[str, List[str]]:
+    """Exemplar từ file JSON {"rag": [...], "web": [...], ...}; không có file -> DEFAULT_EXEMPLARS."""
+    if not path:
+        return DEFAULT_EXEMPLARS
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    unknown = set(data) - set(ROUTES)
+    if unknown:
+        raise ValueError(f"Unknown routes in {path}: {sorted(unknown)}")
+    return {route: [text for text in data.get(route, []) if text.strip()] for route in ROUTES}
+
+
+@dataclass
+class PreRoute:
+    """Kết quả phân loại: route điểm cao nhất, điểm, chênh lệch với route thứ hai."""
+    route: str
+    score: float
+    margin: float
+    confident: bool
+
+
+class PreRouter:
+    """
+    Phân loại route trước router LLM bằng embedding (dùng chung model với retrieval):
+    - Điểm mỗi route = trung bình top_k cosine giữa query và exemplar của route đó.
+    - Chỉ quyết định khi route thắng nằm trong allowed, điểm >= threshold và hơn route thứ hai >= margin;
+      còn lại trả confident=False để router LLM quyết định.
+    - Ghi nhận tỉ lệ quyết định cục bộ và độ khớp với router LLM (query fallback + shadow) để chỉnh ngưỡng.
+    Vector query được embedding cache giữ lại -> retrieval sau đó không phải embed lại.
+    """
+
+    def __init__(
+        self,
+        get_embeddings: Callable[[], Embeddings],
+        exemplars: Dict[str, List[str]],
+        threshold: float = PREROUTER_THRESHOLD,
+        margin: float = PREROUTER_MARGIN,
+        top_k: int = PREROUTER_TOP_K,
+        shadow_rate: float = PREROUTER_SHADOW_RATE,
+    ):
+        self.get_embeddings = get_embeddings
+        self.exemplars = {route: texts for route, texts in exemplars.items() if texts}
+        self.threshold = threshold
+        self.margin = margin
+        self.top_k = top_k
+        self.shadow_rate = shadow_rate
+
+        self._lock = threading.Lock()
+        self._index_for: Optional[Embeddings] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._labels: Optional[np.ndarray] = None
+        self._stats: Counter = Counter()
+        self._confusion: Counter = Counter()
+
+    def _index(self, embeddings: Embeddings):
+        """Embed exemplar một lần cho mỗi embedding model (đổi model -> embed lại)."""
+        with self._lock:
+            if self._index_for is not embeddings:
+                labels = [route for route, texts in self.exemplars.items() for _ in texts]
+                texts = [text for texts in self.exemplars.values() for text in texts]
+                matrix = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                self._matrix = matrix / norms
+                self._labels = np.asarray(labels)
+                self._index_for = embeddings
+            return self._matrix, self._labels
+
+    def warm_up(self):
+        self._index(self.get_embeddings())
+
+    def classify(self, query: str, allowed: Iterable[str] = ROUTES) -> PreRoute:
+        embeddings = self.get_embeddings()
+        matrix, labels = self._index(embeddings)
+        vector = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        similarities = matrix @ (vector / norm if norm else vector)
+
+        scores = {}
+        for route in self.exemplars:
+            route_sims = np.sort(similarities[labels == route])[::-1][:self.top_k]
+            scores[route] = float(route_sims.mean())
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        route, score = ranked[0]
+        margin = score - ranked[1][1] if len(ranked) > 1 else score
+        confident = route in set(allowed) and score >= self.threshold and margin >= self.margin
+
+        outcome = "hit" if confident else "fallback"
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats[f"{outcome}s"] += 1
+            if confident:
+                self._stats[f"hit_{route}"] += 1
+        PREROUTER_DECISIONS.labels(outcome=outcome, route=route).inc()
+        logger.debug("Pre-router: %s (score=%.3f, margin=%.3f, confident=%s)", route, score, margin, confident)
+        return PreRoute(route=route, score=score, margin=margin, confident=confident)
+
+    def should_shadow(self) -> bool:
+        return self.shadow_rate > 0 and random.random() < self.shadow_rate
+
+    def record_agreement(self, prediction: PreRoute, llm_route: str, kind: str):
+        """So sánh dự đoán cục bộ với route của router LLM (kind: "fallback" | "shadow")."""
+        with self._lock:
+            self._stats[f"{kind}_compared"] += 1
+            if prediction.route == llm_route:
+                self._stats[f"{kind}_agree"] += 1
+            self._confusion[f"{prediction.route}->{llm_route}"] += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            stats: Dict[str, object] = dict(self._stats)
+            confusion = dict(self._confusion)
+        if stats.get("queries"):
+            stats["hit_rate"] = round(stats.get("hits", 0) / stats["queries"], 4)
+        for kind in ("fallback", "shadow"):
+            if stats.get(f"{kind}_compared"):
+                stats[f"{kind}_agreement"] = round(stats.get(f"{kind}_agree", 0) / stats[f"{kind}_compared"], 4)
+        # "dự đoán cục bộ->route LLM": số lần mỗi cặp, để xem route nào hay bị nhầm
+        stats["confusion"] = confusion
+        return stats
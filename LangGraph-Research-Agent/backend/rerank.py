@@ -0,0 +1,137 @@
+# rerank.py
+import logging
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config import (
+    RERANK_MODE,
+    RERANK_MODEL,
+    MMR_LAMBDA,
+    DEDUP_SIMILARITY,
+    CONTEXT_TOKEN_BUDGET,
+)
+
+logger = logging.getLogger(__name__)
+
+# (Document, điểm cosine từ Qdrant, vector dense của chunk)
+Candidate = Tuple[Document, float, Optional[List[float]]]
+
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+
+
+def get_cross_encoder():
+    """Cross-encoder dùng chung (CPU), load lần đầu gọi (hoặc lúc warm-up)."""
+    global _cross_encoder
+    if _cross_encoder is None:
+        with _cross_encoder_lock:
+            if _cross_encoder is None:
+                from sentence_transformers import CrossEncoder
+
+                logger.info("Loading cross-encoder reranker: %s", RERANK_MODEL)
+                _cross_encoder = CrossEncoder(RERANK_MODEL, device="cpu")
+    return _cross_encoder
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (~4 ký tự / token), đủ dùng cho việc cắt theo ngân sách."""
+    return len(text) // 4 + 1
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def cosine_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    return float(_normalize(np.asarray(a, dtype=np.float32)) @ _normalize(np.asarray(b, dtype=np.float32)))
+
+
+def _drop_near_duplicates(candidates: Sequence[Candidate], threshold: float) -> List[Candidate]:
+    """Giữ chunk điểm cao hơn, bỏ chunk có cosine >= threshold với một chunk đã giữ (hoặc trùng text)."""
+    kept: List[Candidate] = []
+    kept_vectors: List[np.ndarray] = []
+    seen_texts = set()
+
+    for candidate in sorted(candidates, key=lambda c: c[1], reverse=True):
+        doc, _, vector = candidate
+        text_key = " ".join(doc.page_content.split())
+        if text_key in seen_texts:
+            continue
+        if vector is not None:
+            unit = _normalize(np.asarray(vector, dtype=np.float32))
+            if kept_vectors and float(np.max(np.stack(kept_vectors) @ unit)) >= threshold:
+                continue
+            kept_vectors.append(unit)
+        seen_texts.add(text_key)
+        kept.append(candidate)
+    return kept
+
+
+def _mmr_order(query_vector: Sequence[float], candidates: List[Candidate], lambda_mult: float) -> List[Candidate]:
+    """Maximal Marginal Relevance: cân bằng độ liên quan với query và độ khác biệt giữa các chunk."""
+    if any(vector is None for _, _, vector in candidates):
+        return candidates
+
+    query = _normalize(np.asarray(query_vector, dtype=np.float32))
+    vectors = _normalize(np.asarray([vector for _, _, vector in candidates], dtype=np.float32))
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+
+    selected: List[int] = []
+    remaining = list(range(len(candidates)))
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        mmr_scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        best = remaining[int(np.argmax(mmr_scores))]
+        selected.append(best)
+        remaining.remove(best)
+    return [candidates[i] for i in selected]
+
+
+def _cross_encoder_order(query: str, candidates: List[Candidate]) -> List[Candidate]:
+    scores = get_cross_encoder().predict([(query, doc.page_content) for doc, _, _ in candidates])
+    order = np.argsort(-np.asarray(scores))
+    return [candidates[i] for i in order]
+
+
+def select_chunks(
+    query: str,
+    query_vector: Sequence[float],
+    candidates: Sequence[Candidate],
+    k: int,
+    mode: str = RERANK_MODE,
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+) -> List[Tuple[Document, float]]:
+    """
+    Từ tập over-fetch của Qdrant: bỏ near-duplicate -> rerank (mmr / cross_encoder / none)
+    -> lấy tối đa k chunk trong ngân sách token_budget (luôn giữ ít nhất 1 chunk).
+    Điểm trả về vẫn là cosine gốc từ Qdrant (dùng cho fast-path của judge).
+    """
+    if not candidates:
+        return []
+
+    ranked = _drop_near_duplicates(candidates, DEDUP_SIMILARITY)
+    if mode == "mmr":
+        ranked = _mmr_order(query_vector, ranked, MMR_LAMBDA)
+    elif mode == "cross_encoder":
+        ranked = _cross_encoder_order(query, ranked)
+
+    selected: List[Tuple[Document, float]] = []
+    used_tokens = 0
+    for doc, score, _ in ranked:
+        if len(selected) >= k:
+            break
+        tokens = estimate_tokens(doc.page_content)
+        if selected and used_tokens + tokens > token_budget:
+            continue
+        selected.append((doc, score))
+        used_tokens += tokens
+    return selected
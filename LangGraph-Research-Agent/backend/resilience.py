@@ -0,0 +1,258 @@
+# resilience.py
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+from config import (
+    GEMINI_MAX_CONCURRENCY,
+    TAVILY_MAX_CONCURRENCY,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+)
+from observability import PROVIDER_DURATION, PROVIDER_EVENTS
+
+T = TypeVar("T")
+
+# HTTP status của lỗi tạm thời (timeout / rate limit / quá tải) -> đáng thử lại
+_TRANSIENT_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+def _transient_types() -> Tuple[Type[BaseException], ...]:
+    """Exception mạng / quá tải của các client mà provider dùng (client nào chưa cài thì bỏ qua)."""
+    types = [TimeoutError, asyncio.TimeoutError, ConnectionError]
+    try:
+        from google.api_core import exceptions as google_exceptions
+
+        types += [
+            google_exceptions.TooManyRequests,
+            google_exceptions.ResourceExhausted,
+            google_exceptions.InternalServerError,
+            google_exceptions.BadGateway,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.GatewayTimeout,
+            google_exceptions.DeadlineExceeded,
+        ]
+    except ImportError:
+        pass
+    try:
+        import httpx
+
+        types += [httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError]
+    except ImportError:
+        pass
+    try:
+        import requests
+
+        types += [requests.exceptions.ConnectionError, requests.exceptions.Timeout]
+    except ImportError:
+        pass
+    try:
+        import aiohttp
+
+        types += [aiohttp.ClientConnectionError, aiohttp.ServerTimeoutError]
+    except ImportError:
+        pass
+    return tuple(types)
+
+
+_TRANSIENT_TYPES = _transient_types()
+
+
+class ProviderError(Exception):
+    """Provider không trả lời trong deadline hoặc hết lượt retry -> node chuyển sang chế độ degraded."""
+
+    def __init__(self, provider: str, op: str, reason: str):
+        super().__init__(f"{provider}.{op}: {reason}")
+        self.provider = provider
+        self.op = op
+        self.reason = reason
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """
+    HTTP status của lỗi: response.status_code (httpx / requests), status (aiohttp),
+    code (google.api_core / google-genai).
+    """
+    response = getattr(exc, "response", None)
+    for value in (
+        getattr(response, "status_code", None),
+        getattr(exc, "status_code", None),
+        getattr(exc, "status", None),
+        getattr(exc, "code", None),
+    ):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    return None
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Phân loại theo kiểu exception / HTTP status, không dò chuỗi trong message."""
+    if isinstance(exc, _TRANSIENT_TYPES):
+        return True
+    return _status_code(exc) in _TRANSIENT_STATUS
+
+
+class Provider:
+    """
+    Giới hạn gọi một provider bên ngoài (Gemini, Tavily...):
+    - Semaphore: tối đa max_concurrency lời gọi đồng thời mỗi worker (chờ slot cũng tính vào deadline).
+    - Deadline cho cả node (gồm mọi lần thử), mỗi lần thử bị cắt theo thời gian còn lại.
+    - Lỗi tạm thời -> thử lại tối đa max_attempts lần, backoff mũ có jitter (full jitter).
+    Hết deadline / hết lượt thử -> ProviderError; lỗi không tạm thời được raise nguyên vẹn.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        backoff_base: float = RETRY_BACKOFF_BASE,
+        backoff_max: float = RETRY_BACKOFF_MAX,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+        self._sync_semaphore = threading.BoundedSemaphore(max_concurrency)
+        # Bản sync: chạy lời gọi trong thread riêng để có thể bỏ chờ khi quá deadline
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats: Counter = Counter()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, op: str, event: str):
+        with self._stats_lock:
+            self._stats[f"{op}.{event}"] += 1
+        PROVIDER_EVENTS.labels(provider=self.name, op=op, event=event).inc()
+
+    def _observe(self, op: str, outcome: str, started: float):
+        PROVIDER_DURATION.labels(provider=self.name, op=op, outcome=outcome).observe(time.perf_counter() - started)
+
+    def _backoff(self, attempt: int, remaining: float) -> float:
+        return min(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)), max(remaining, 0.0))
+
+    def _attempts(self, retries: Optional[int]) -> int:
+        return max(1, self.max_attempts if retries is None else retries + 1)
+
+    # --- ASYNC ---
+    async def arun(
+        self,
+        op: str,
+        call: Callable[[], Awaitable[T]],
+        deadline: float,
+        retries: Optional[int] = None,
+    ) -> T:
+        """call: hàm tạo coroutine mới cho mỗi lần thử."""
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        expires_at = time.monotonic() + deadline
+        last_error = "deadline exceeded"
+        attempts = self._attempts(retries)
+        for attempt in range(attempts):
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._async_semaphore.acquire(), remaining)
+            except asyncio.TimeoutError:
+                self._count(op, "queue_timeout")
+                last_error = "timed out waiting for a concurrency slot"
+                break
+            started = time.perf_counter()
+            try:
+                self._count(op, "calls")
+                result = await asyncio.wait_for(call(), max(expires_at - time.monotonic(), 0.001))
+                self._observe(op, "ok", started)
+                return result
+            except Exception as e:
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                self._observe(op, "timeout" if timed_out else "error", started)
+                if not _is_transient(e):
+                    raise
+                self._count(op, "timeouts" if timed_out else "errors")
+                last_error = f"{type(e).__name__}: {e}"
+            finally:
+                self._async_semaphore.release()
+
+            if attempt + 1 < attempts:
+                self._count(op, "retries")
+                await asyncio.sleep(self._backoff(attempt, expires_at - time.monotonic()))
+
+        self._count(op, "failed")
+        raise ProviderError(self.name, op, last_error)
+
+    # --- SYNC ---
+    def run(
+        self,
+        op: str,
+        call: Callable[[], T],
+        deadline: float,
+        retries: Optional[int] = None,
+    ) -> T:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=self.name)
+
+        expires_at = time.monotonic() + deadline
+        last_error = "deadline exceeded"
+        attempts = self._attempts(retries)
+        for attempt in range(attempts):
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self._sync_semaphore.acquire(timeout=remaining):
+                self._count(op, "queue_timeout")
+                last_error = "timed out waiting for a concurrency slot"
+                break
+            started = time.perf_counter()
+            try:
+                self._count(op, "calls")
+                future = self._executor.submit(call)
+            except BaseException:
+                self._sync_semaphore.release()
+                raise
+            # Trả slot khi lời gọi thật sự kết thúc: lời gọi treo quá deadline vẫn chiếm một thread
+            # của executor -> request sau chờ slot (có deadline) thay vì xếp hàng ngầm trong executor
+            future.add_done_callback(lambda _: self._sync_semaphore.release())
+            try:
+                result = future.result(timeout=max(expires_at - time.monotonic(), 0.001))
+                self._observe(op, "ok", started)
+                return result
+            except FutureTimeoutError:
+                # Lời gọi treo vẫn chạy nền nhưng request không phải chờ nữa
+                self._observe(op, "timeout", started)
+                self._count(op, "timeouts")
+                last_error = "attempt timed out"
+            except Exception as e:
+                self._observe(op, "error", started)
+                if not _is_transient(e):
+                    raise
+                self._count(op, "errors")
+                last_error = f"{type(e).__name__}: {e}"
+
+            if attempt + 1 < attempts:
+                self._count(op, "retries")
+                time.sleep(self._backoff(attempt, expires_at - time.monotonic()))
+
+        self._count(op, "failed")
+        raise ProviderError(self.name, op, last_error)
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+gemini = Provider("gemini", max_concurrency=GEMINI_MAX_CONCURRENCY)
+tavily_provider = Provider("tavily", max_concurrency=TAVILY_MAX_CONCURRENCY)
+
+
+def get_resilience_stats() -> Dict[str, Dict[str, int]]:
+    return {provider.name: provider.stats() for provider in (gemini, tavily_provider)}
@@ -0,0 +1,54 @@
+# sparse.py
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List
+
+from qdrant_client.http import models
+
+from config import SPARSE_BM25_K1, SPARSE_BM25_B, SPARSE_AVG_DOC_LEN
+
+# Giữ nguyên mã lỗi / mã linh kiện / số phiên bản như "ERR-1042", "v2.3.1", "A7_X" thành 1 token
+TOKEN_REGEX = re.compile(r"\w[\w\-\.]*\w|\w", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_REGEX.findall(text.lower())
+
+
+def _token_index(token: str) -> int:
+    # Hash ổn định (crc32) -> chỉ số uint32 của sparse vector, không cần lưu vocabulary
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def _to_sparse(weights: Dict[int, float]) -> models.SparseVector:
+    indices, values = zip(*sorted(weights.items())) if weights else ((), ())
+    return models.SparseVector(indices=list(indices), values=list(values))
+
+
+def encode_document(text: str) -> models.SparseVector:
+    """
+    Vector BM25 phía document: trọng số = TF đã bão hoà theo độ dài chunk.
+    IDF do Qdrant tính phía server (sparse vector config với modifier=IDF).
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return _to_sparse({})
+
+    length_norm = 1 - SPARSE_BM25_B + SPARSE_BM25_B * len(tokens) / SPARSE_AVG_DOC_LEN
+    weights: Dict[int, float] = {}
+    for token, tf in Counter(tokens).items():
+        index = _token_index(token)
+        weight = tf * (SPARSE_BM25_K1 + 1) / (tf + SPARSE_BM25_K1 * length_norm)
+        weights[index] = weights.get(index, 0.0) + weight
+    return _to_sparse(weights)
+
+
+def encode_query(text: str) -> models.SparseVector:
+    """Vector phía query: mỗi token xuất hiện có trọng số 1 (IDF áp dụng ở server)."""
+    return _to_sparse({_token_index(token): 1.0 for token in set(tokenize(text))})
+
+
+def sparse_vectors_config(vector_name: str) -> Dict[str, models.SparseVectorParams]:
+    return {vector_name: models.SparseVectorParams(modifier=models.Modifier.IDF)}
+
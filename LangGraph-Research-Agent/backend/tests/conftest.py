@@ -0,0 +1,41 @@
+# conftest.py
+"""
+Cấu hình chung cho test: chạy offline hoàn toàn bằng các thành phần giả của bench_fakes
+(HashEmbeddings, Qdrant local mode ":memory:", FakeChatModel) - không cần Gemini / Tavily / Qdrant server.
+Chạy từ thư mục backend: python -m pytest -q tests
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Đặt trước khi import config: không ghi cache ra đĩa, không warm-up, không cần API key thật
+os.environ.update(
+    {
+        "GOOGLE_API_KEY": "test",
+        "TAVILY_API_KEY": "test",
+        "EMBED_CACHE_ENABLED": "false",
+        "CONVERSATION_MEMORY_ENABLED": "false",
+        "WARMUP_ON_STARTUP": "false",
+        "WEB_CACHE_ENABLED": "false",
+    }
+)
+
+import pytest  # noqa: E402
+
+from bench_fakes import HashEmbeddings, local_qdrant  # noqa: E402
+
+
+@pytest.fixture
+def qdrant():
+    """Qdrant ":memory:" + HashEmbeddings mới cho mỗi test; answer cache được xoá trước khi chạy."""
+    from answer_cache import answer_cache
+    from vectorstore import set_embeddings, set_qdrant_clients
+
+    client = local_qdrant()
+    set_qdrant_clients(client)
+    set_embeddings(HashEmbeddings())
+    answer_cache.clear()
+    yield client
+    client.close()
@@ -0,0 +1,67 @@
+# test_answer_cache.py
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent
+from agent import RagJudge, RouteDecision, build_agent, override_clients
+from answer_cache import AnswerCache, answer_cache
+from bench_fakes import FakeChatModel, Latency, synthetic_pages
+from vectorstore import add_document_to_vectorstore
+
+PAGES = synthetic_pages(2, seed=4)
+QUERY = PAGES[0].split(". ")[0]
+
+
+@pytest.fixture
+def chat(qdrant, monkeypatch):
+    """Agent đọc manual.txt, answer LLM giả đếm số lần gọi."""
+    monkeypatch.setattr(agent, "RAG_JUDGE_FAST_PATH", False)
+    answer_llm = FakeChatModel(lambda messages: AIMessage(content=f"answer {answer_llm.calls}"), Latency(0))
+    override_clients(
+        router_llm=FakeChatModel(lambda messages: RouteDecision(route="rag"), Latency(0)),
+        judge_llm=FakeChatModel(lambda messages: RagJudge(sufficient=True), Latency(0)),
+        answer_llm=answer_llm,
+    )
+    add_document_to_vectorstore("\n".join(PAGES), "manual.txt")
+    graph = build_agent()
+    config = {
+        "configurable": {"selected_files": ["manual.txt"], "web_search_enabled": False, "use_answer_cache": True}
+    }
+
+    def ask():
+        state = graph.invoke({"messages": [HumanMessage(content=QUERY)]}, config)
+        return state["answer_cache"], state["messages"][-1].content
+
+    return ask, answer_llm
+
+
+def test_repeated_question_is_served_from_cache(chat):
+    ask, answer_llm = chat
+
+    assert ask() == ("miss", "answer 1")
+    assert ask() == ("hit", "answer 1")
+    assert answer_llm.calls == 1
+
+
+def test_reindex_invalidates_cached_answers(chat):
+    ask, answer_llm = chat
+    ask()
+
+    # Upload lại cùng nội dung: index không đổi -> cache vẫn dùng được
+    add_document_to_vectorstore("\n".join(PAGES), "manual.txt")
+    assert ask() == ("hit", "answer 1")
+
+    add_document_to_vectorstore("\n".join(PAGES + synthetic_pages(1, seed=8)), "manual.txt")
+    assert answer_cache.stats()["entries"] == 0
+    assert ask() == ("miss", "answer 2")
+    assert answer_llm.calls == 2
+
+
+def test_invalidate_file_only_drops_entries_using_that_file():
+    cache = AnswerCache(max_entries=10, similarity_threshold=0.95, ttl_seconds=60)
+    cache.store("q1", [1.0, 0.0], "a1", scope="s1", files=["a.txt", "b.txt"])
+    cache.store("q2", [0.0, 1.0], "a2", scope="s2", files=["b.txt"])
+
+    assert cache.invalidate_file("a.txt") == 1
+    assert cache.lookup("q1", [1.0, 0.0], "s1") is None
+    assert cache.lookup("q2", [0.0, 1.0], "s2") == ("a2", 1.0)
@@ -0,0 +1,59 @@
+# test_catalog.py
+from bench_fakes import synthetic_pages
+from vectorstore import (
+    IncrementalIndexer,
+    add_document_to_vectorstore,
+    catalog,
+    content_hash,
+    delete_file_version,
+    is_file_unchanged,
+    list_point_ids,
+    prepare_document_chunks,
+)
+
+A_TEXT = "\n".join(synthetic_pages(2, seed=1))
+B_TEXT = "\n".join(synthetic_pages(2, seed=2))
+
+
+def _crash_midway(source: str, text: str):
+    """Ghi một phần chunk của bản mới rồi dừng (không finish / abort) như worker bị kill."""
+    indexer = IncrementalIndexer(source, content_hash(text))
+    indexer.write(prepare_document_chunks(text)[:2])
+
+
+def test_rebuild_keeps_single_version_hash_and_byte_size(qdrant):
+    add_document_to_vectorstore(A_TEXT, "a.txt", file_hash="a-v1", byte_size=123)
+
+    entries = {entry.file_name: entry for entry in catalog.rebuild()}
+
+    assert entries["a.txt"].content_hash == "a-v1"
+    assert entries["a.txt"].chunk_count == len(list_point_ids("a.txt"))
+    assert entries["a.txt"].byte_size == 123
+    assert is_file_unchanged("a.txt", "a-v1")
+
+
+def test_rebuild_records_mixed_versions_without_hash(qdrant):
+    add_document_to_vectorstore(A_TEXT, "a.txt")
+    add_document_to_vectorstore(B_TEXT, "b.txt")
+    _crash_midway("b.txt", "\n".join(synthetic_pages(2, seed=7)))
+
+    entries = {entry.file_name: entry for entry in catalog.rebuild()}
+
+    assert entries["a.txt"].content_hash == content_hash(A_TEXT)
+    assert entries["b.txt"].content_hash == ""
+    assert entries["b.txt"].chunk_count == len(list_point_ids("b.txt"))
+    # Bản cũ upload lại không bị coi là "không đổi": index lại, xoá chunk ghi dở
+    assert not is_file_unchanged("b.txt", content_hash(B_TEXT))
+    result = add_document_to_vectorstore(B_TEXT, "b.txt")
+    assert not result.skipped and result.deleted > 0
+    assert catalog.get("b.txt").content_hash == content_hash(B_TEXT)
+
+
+def test_rebuild_drops_files_without_chunks(qdrant):
+    add_document_to_vectorstore(A_TEXT, "a.txt")
+    add_document_to_vectorstore(B_TEXT, "b.txt")
+    delete_file_version("b.txt", content_hash(B_TEXT))
+
+    assert [entry.file_name for entry in catalog.rebuild()] == ["a.txt"]
+    catalog.load()
+    assert catalog.get("b.txt") is None
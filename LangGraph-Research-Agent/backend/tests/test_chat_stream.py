@@ -0,0 +1,52 @@
+# test_chat_stream.py
+import asyncio
+import json
+from typing import List, Tuple
+
+import httpx
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from agent import RouteDecision, override_clients
+from bench_fakes import FakeChatModel, FakeTavily, Latency
+
+ANSWER = "Hello world from the model"
+
+
+def _parse_sse(body: str) -> List[Tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def _stream(query: str) -> List[Tuple[str, dict]]:
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/chat/stream",
+            json={"query": query, "session_id": "stream-test", "enable_web_search": True},
+        )
+    assert response.status_code == 200
+    return _parse_sse(response.text)
+
+
+def test_stream_sends_each_answer_token_once(qdrant):
+    override_clients(
+        router_llm=FakeChatModel(lambda messages: RouteDecision(route="answer"), Latency(0)),
+        answer_llm=GenericFakeChatModel(messages=iter([AIMessage(content=ANSWER)])),
+        tavily=FakeTavily(Latency(0)),
+    )
+
+    events = asyncio.run(_stream("What can you do?"))
+    kinds = [kind for kind, _ in events]
+
+    assert kinds[-1] == "done"
+    assert "error" not in kinds
+    assert "trace" in kinds
+    tokens = [data["text"] for kind, data in events if kind == "token"]
+    assert len(tokens) > 1  # stream từng đoạn, không phải một khối
+    assert "".join(tokens) == events[-1][1]["response"] == ANSWER
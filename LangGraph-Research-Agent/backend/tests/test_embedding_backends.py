@@ -0,0 +1,14 @@
+# test_embedding_backends.py
+import sys
+
+import pytest
+
+from embedding_backends import build_embeddings
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx-int8"])
+def test_onnx_backend_without_optimum_explains_how_to_install(backend, monkeypatch):
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+
+    with pytest.raises(ImportError, match="requirements-onnx.txt"):
+        build_embeddings(backend=backend)
@@ -0,0 +1,101 @@
+# test_fast_judge.py
+import pytest
+from langchain_core.messages import HumanMessage
+
+import agent
+from agent import RagJudge, override_clients
+from bench_fakes import FakeChatModel, Latency, synthetic_pages
+from calibrate_judge import calibrate
+from vectorstore import add_document_to_vectorstore
+
+
+def _thresholds(monkeypatch, accept: float, reject: float, min_chunks: int = 1, enabled: bool = True):
+    monkeypatch.setattr(agent, "RAG_JUDGE_FAST_PATH", enabled)
+    monkeypatch.setattr(agent, "RAG_ACCEPT_SCORE", accept)
+    monkeypatch.setattr(agent, "RAG_REJECT_SCORE", reject)
+    monkeypatch.setattr(agent, "RAG_ACCEPT_MIN_CHUNKS", min_chunks)
+
+
+@pytest.mark.parametrize(
+    "scores, expected",
+    [
+        ([0.9, 0.1], True),  # chunk tốt nhất >= ACCEPT
+        ([0.25, 0.1], False),  # mọi chunk < REJECT
+        ([0.5, 0.4], None),  # ở giữa -> judge LLM
+        ([], None),
+    ],
+)
+def test_fast_judge_branches(monkeypatch, scores, expected):
+    _thresholds(monkeypatch, accept=0.8, reject=0.3)
+    assert agent._fast_judge(scores) is expected
+
+
+def test_fast_judge_requires_min_chunks(monkeypatch):
+    _thresholds(monkeypatch, accept=0.8, reject=0.3, min_chunks=2)
+    assert agent._fast_judge([0.9, 0.5]) is None
+    assert agent._fast_judge([0.9, 0.85]) is True
+
+
+def test_fast_judge_disabled_always_defers(monkeypatch):
+    _thresholds(monkeypatch, accept=0.8, reject=0.3, enabled=False)
+    assert agent._fast_judge([0.99]) is None
+    assert agent._fast_judge([0.01]) is None
+
+
+@pytest.fixture
+def indexed(qdrant):
+    pages = synthetic_pages(2, seed=1)
+    add_document_to_vectorstore("\n".join(pages), "manual.txt")
+    judge = FakeChatModel(lambda messages: RagJudge(sufficient=True), Latency(0))
+    override_clients(judge_llm=judge)
+    state = {"messages": [HumanMessage(content=pages[0].split(". ")[0])]}
+    config = {"configurable": {"selected_files": ["manual.txt"], "web_search_enabled": True}}
+    return state, config, judge
+
+
+@pytest.mark.parametrize(
+    "accept, reject, judge_path, route, judge_calls",
+    [
+        (-1.0, -2.0, "fast_accept", "answer", 0),
+        (2.0, 2.0, "fast_reject", "web", 0),
+        (2.0, -1.0, "llm_sufficient", "answer", 1),
+    ],
+)
+def test_rag_node_uses_judge_llm_only_when_uncertain(monkeypatch, indexed, accept, reject, judge_path, route, judge_calls):
+    state, config, judge = indexed
+    _thresholds(monkeypatch, accept=accept, reject=reject)
+
+    out = agent.rag_node(state, config)
+
+    assert out["rag_judge"] == judge_path
+    assert out["route"] == route
+    assert judge.calls == judge_calls
+    # fast_reject: chunk không liên quan không được đưa vào prompt answer
+    assert bool(out["rag"]) == (judge_path != "fast_reject")
+
+
+def test_calibrate_picks_thresholds_meeting_precision():
+    samples = [
+        ([0.9, 0.2], True),
+        ([0.85], True),
+        ([0.8], False),
+        ([0.7], True),
+        ([0.4], False),
+        ([0.2], False),
+        ([0.1], False),
+        ([], True),  # retrieval rỗng: agent không gọi judge -> bỏ qua
+    ]
+    result = calibrate(samples, precision=1.0)
+
+    assert result["samples"] == 7
+    assert result["accept_score"] == 0.85
+    assert result["accept_precision"] == 1.0
+    assert result["reject_score"] == 0.7
+    assert result["reject_coverage"] == round(3 / 7, 4)
+
+
+def test_calibrate_without_separable_scores_keeps_fast_path_off():
+    samples = [([0.5], True), ([0.5], False), ([0.6], False), ([0.4], True)]
+    result = calibrate(samples, precision=0.95)
+    assert result["accept_score"] is None
+    assert result["reject_score"] is None
@@ -0,0 +1,73 @@
+# test_ingestion.py
+from bench_fakes import synthetic_pages
+from config import QDRANT_COLLECTION_NAME
+from vectorstore import (
+    IncrementalIndexer,
+    add_document_to_vectorstore,
+    catalog,
+    chunk_point_id,
+    content_hash,
+    list_point_ids,
+    prepare_document_chunks,
+)
+
+PAGES = synthetic_pages(4, seed=3)
+
+
+def _expected_ids(source: str, text: str):
+    return {chunk_point_id(source, content_hash(chunk.text)) for chunk in prepare_document_chunks(text)}
+
+
+def test_reindex_same_content_is_skipped(qdrant):
+    text = "\n".join(PAGES)
+    first = add_document_to_vectorstore(text, "manual.txt")
+    ids = list_point_ids("manual.txt")
+
+    second = add_document_to_vectorstore(text, "manual.txt")
+
+    assert first.written == first.chunks == len(ids) > 0
+    assert second.skipped and second.written == 0
+    assert list_point_ids("manual.txt") == ids == _expected_ids("manual.txt", text)
+
+
+def test_modified_content_writes_new_chunks_and_removes_stale_ones(qdrant):
+    old_text = "\n".join(PAGES)
+    new_text = "\n".join(PAGES[:3] + synthetic_pages(1, seed=99))
+    add_document_to_vectorstore(old_text, "manual.txt")
+    old_ids = list_point_ids("manual.txt")
+
+    result = add_document_to_vectorstore(new_text, "manual.txt")
+    new_ids = _expected_ids("manual.txt", new_text)
+
+    assert list_point_ids("manual.txt") == new_ids
+    assert result.unchanged == len(old_ids & new_ids) > 0
+    assert result.written == len(new_ids - old_ids) > 0
+    assert result.deleted == len(old_ids - new_ids) > 0
+    entry = catalog.get("manual.txt")
+    assert entry.content_hash == content_hash(new_text) and entry.chunk_count == len(new_ids)
+    # Chunk giữ nguyên được gắn hash của bản mới
+    points, _ = qdrant.scroll(QDRANT_COLLECTION_NAME, limit=1000, with_payload=True)
+    assert {p.payload["metadata"]["file_hash"] for p in points} == {content_hash(new_text)}
+
+
+def test_other_files_are_not_touched(qdrant):
+    add_document_to_vectorstore("\n".join(PAGES), "a.txt")
+    add_document_to_vectorstore("\n".join(synthetic_pages(2, seed=5)), "b.txt")
+    b_ids = list_point_ids("b.txt")
+
+    add_document_to_vectorstore("\n".join(PAGES[:2]), "a.txt")
+
+    assert list_point_ids("b.txt") == b_ids
+
+
+def test_abort_keeps_previous_version(qdrant):
+    old_text = "\n".join(PAGES)
+    add_document_to_vectorstore(old_text, "manual.txt")
+    old_ids = list_point_ids("manual.txt")
+
+    indexer = IncrementalIndexer("manual.txt", content_hash("partial"))
+    indexer.write(prepare_document_chunks("\n".join(synthetic_pages(1, seed=42))))
+    indexer.abort()
+
+    assert list_point_ids("manual.txt") == old_ids
+    assert catalog.get("manual.txt").content_hash == content_hash(old_text)
@@ -0,0 +1,127 @@
+# test_jobs.py
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import jobs
+from bench_fakes import synthetic_pages, write_pdf
+from jobs import FileStatus, IngestionJob, IngestionJobManager
+from vectorstore import catalog, list_point_ids
+
+PAGES = synthetic_pages(4, seed=6)
+
+
+@pytest.fixture
+def manager(qdrant):
+    """Process pool thay bằng thread pool: cửa sổ trang chạy cùng process với Qdrant ":memory:"."""
+    manager = IngestionJobManager(max_workers=2, max_concurrent_jobs=1, job_ttl=60, page_window=1)
+    manager._executor = ThreadPoolExecutor(max_workers=2)
+    yield manager
+    manager.shutdown()
+
+
+def _fail_window(monkeypatch, page: int = 2):
+    """Cửa sổ chứa trang page lỗi (các cửa sổ trước đó vẫn được upsert)."""
+    prepare = jobs._prepare_page_window
+
+    def prepare_or_fail(path, start, end):
+        if start <= page < end:
+            raise RuntimeError("worker crashed")
+        return prepare(path, start, end)
+
+    monkeypatch.setattr(jobs, "_prepare_page_window", prepare_or_fail)
+
+
+def _pdf(tmp_path, name: str, pages=PAGES) -> str:
+    path = str(tmp_path / name)
+    write_pdf(path, pages)
+    return path
+
+
+def _run_job(manager: IngestionJobManager, path: str, filename: str, file_hash: str) -> IngestionJob:
+    async def run():
+        manager._get_semaphore()
+        job = IngestionJob(id="job", filename=filename, file_hash=file_hash)
+        await manager._run(job, path)
+        return job
+
+    return asyncio.run(run())
+
+
+def test_pdf_job_indexes_all_windows(manager, tmp_path):
+    job = _run_job(manager, _pdf(tmp_path, "a.pdf"), "a.pdf", "v1")
+
+    assert job.stage == "done" and job.pages_done == len(PAGES)
+    assert job.chunks == len(list_point_ids("a.pdf")) > 0
+    assert catalog.get("a.pdf").content_hash == "v1"
+
+
+def test_failed_window_removes_partial_chunks(manager, tmp_path, monkeypatch):
+    _fail_window(monkeypatch)
+    path = _pdf(tmp_path, "a.pdf")
+    job = _run_job(manager, path, "a.pdf", "v1")
+
+    assert job.stage == "failed" and "worker crashed" in job.error
+    assert list_point_ids("a.pdf") == set()
+    assert catalog.get("a.pdf") is None
+    assert not os.path.exists(path)  # file tạm vẫn được xoá
+
+
+def test_failed_reindex_keeps_previous_version(manager, tmp_path, monkeypatch):
+    _run_job(manager, _pdf(tmp_path, "a.pdf"), "a.pdf", "v1")
+    old_ids = list_point_ids("a.pdf")
+
+    _fail_window(monkeypatch)
+    new_pages = synthetic_pages(4, seed=60)
+    job = _run_job(manager, _pdf(tmp_path, "a-v2.pdf", new_pages), "a.pdf", "v2")
+
+    assert job.stage == "failed"
+    assert list_point_ids("a.pdf") == old_ids
+    assert catalog.get("a.pdf").content_hash == "v1"
+
+
+def test_bulk_failure_only_affects_failed_files(manager, tmp_path, monkeypatch):
+    _fail_window(monkeypatch)
+    text_path = str(tmp_path / "notes.txt")
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(synthetic_pages(2, seed=9)))
+    files = [
+        FileStatus(filename="bad.pdf", file_hash="b1", byte_size=1, path=_pdf(tmp_path, "bad.pdf")),
+        FileStatus(filename="notes.txt", file_hash="n1", byte_size=1, path=text_path),
+    ]
+    job = manager.create_bulk_job(files)
+
+    asyncio.run(manager.run_bulk(job, cleanup=True))
+
+    bad, notes = job.files
+    assert job.stage == "done"
+    assert bad.status == "failed" and "worker crashed" in bad.error
+    assert list_point_ids("bad.pdf") == set() and catalog.get("bad.pdf") is None
+    assert notes.status == "done" and catalog.get("notes.txt").content_hash == "n1"
+    assert not os.path.exists(text_path)
+
+
+def test_bulk_group_upsert_failure_aborts_every_file_of_the_group(manager, tmp_path, monkeypatch):
+    paths = []
+    for name, seed in (("a.txt", 1), ("b.txt", 2)):
+        paths.append(str(tmp_path / name))
+        with open(paths[-1], "w", encoding="utf-8") as f:
+            f.write("\n".join(synthetic_pages(2, seed=seed)))
+    upsert = jobs.upsert_points
+
+    def upsert_then_fail(points, batch_size):
+        upsert(points[: len(points) // 2], batch_size)  # ghi được một phần rồi mất kết nối
+        raise ConnectionError("qdrant went away")
+
+    monkeypatch.setattr(jobs, "upsert_points", upsert_then_fail)
+    files = [FileStatus(filename=os.path.basename(p), file_hash="v1", byte_size=1, path=p) for p in paths]
+    job = manager.create_bulk_job(files)
+
+    asyncio.run(manager.run_bulk(job))
+
+    for f in job.files:
+        assert f.status == "failed" and "qdrant went away" in f.error
+        assert list_point_ids(f.filename) == set()
+        assert catalog.get(f.filename) is None
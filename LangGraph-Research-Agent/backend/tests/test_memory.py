@@ -0,0 +1,95 @@
+# test_memory.py
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent
+import memory
+from agent import RouteDecision, build_agent, override_clients
+from bench_fakes import FakeChatModel, Latency
+from memory import ConversationStore
+
+
+@pytest.fixture
+def store(tmp_path, qdrant, monkeypatch):
+    monkeypatch.setattr(agent, "HISTORY_MAX_MESSAGES", 4)
+    override_clients(
+        router_llm=FakeChatModel(lambda messages: RouteDecision(route="answer"), Latency(0)),
+        answer_llm=FakeChatModel(lambda messages: AIMessage(content="answer"), Latency(0)),
+    )
+    return ConversationStore(str(tmp_path / "conversations.sqlite3"), idle_ttl=60, sweep_interval=3600)
+
+
+async def _turns(store: ConversationStore, thread_id: str, count: int):
+    graph = build_agent(checkpointer=store.saver)
+    config = {"configurable": {"thread_id": thread_id, "web_search_enabled": False, "selected_files": []}}
+    for i in range(count):
+        await graph.ainvoke({"messages": [HumanMessage(content=f"question {i}")]}, config)
+        await store.end_turn(thread_id)
+    return config
+
+
+async def _checkpoints(store: ConversationStore, config) -> int:
+    return len([c async for c in store.saver.alist(config)])
+
+
+def test_history_is_trimmed_and_old_checkpoints_pruned(store):
+    async def run():
+        await store.open()
+        try:
+            config = await _turns(store, "s1", 5)
+            state = (await store.saver.aget_tuple(config)).checkpoint["channel_values"]
+            return state["messages"], await _checkpoints(store, config)
+        finally:
+            await store.close()
+
+    messages, checkpoints = asyncio.run(run())
+
+    assert len(messages) <= 4
+    assert isinstance(messages[0], HumanMessage)
+    assert [m.content for m in messages if isinstance(m, HumanMessage)][-1] == "question 4"
+    assert checkpoints == 1
+
+
+def test_delete_thread_only_removes_that_session(store):
+    async def run():
+        await store.open()
+        try:
+            deleted = await _turns(store, "s1", 2)
+            kept = await _turns(store, "s2", 1)
+            await store.delete_thread("s1")
+            return (
+                await store.saver.aget_tuple(deleted),
+                await _checkpoints(store, kept),
+                await store.evict_idle(),
+            )
+        finally:
+            await store.close()
+
+    deleted_tuple, kept_checkpoints, evicted = asyncio.run(run())
+
+    assert deleted_tuple is None
+    assert kept_checkpoints == 1
+    assert evicted == 0  # session_activity của s1 cũng đã xoá, s2 còn mới
+
+
+def test_evict_idle_removes_only_expired_sessions(store, monkeypatch):
+    async def run():
+        await store.open()
+        try:
+            real_time = memory.time.time
+            monkeypatch.setattr(memory.time, "time", lambda: real_time() - 120)
+            idle = await _turns(store, "idle", 1)
+            monkeypatch.setattr(memory.time, "time", real_time)
+            active = await _turns(store, "active", 1)
+            evicted = await store.evict_idle()
+            return evicted, await store.saver.aget_tuple(idle), await store.saver.aget_tuple(active)
+        finally:
+            await store.close()
+
+    evicted, idle_tuple, active_tuple = asyncio.run(run())
+
+    assert evicted == 1
+    assert idle_tuple is None
+    assert active_tuple is not None
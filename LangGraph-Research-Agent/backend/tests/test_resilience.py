@@ -0,0 +1,110 @@
+# test_resilience.py
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from resilience import Provider, ProviderError, _is_transient
+
+
+def _http_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://api.example.com")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+@pytest.mark.parametrize(
+    "exc, transient",
+    [
+        (_http_error(503), True),
+        (_http_error(429), True),
+        (_http_error(404), False),
+        (_http_error(400), False),
+        (httpx.ConnectTimeout("timeout"), True),
+        (ConnectionError("reset"), True),
+        (TimeoutError(), True),
+        # Không dò chuỗi: số trong message không làm lỗi thành "tạm thời"
+        (ValueError("invalid field at position 500"), False),
+        (KeyError("429"), False),
+    ],
+)
+def test_is_transient_by_type_and_status(exc, transient):
+    assert _is_transient(exc) is transient
+
+
+def test_is_transient_reads_gemini_error_code():
+    errors = pytest.importorskip("google.genai.errors")
+
+    assert _is_transient(errors.ClientError(429, {"error": {"message": "quota"}}))
+    assert _is_transient(errors.ServerError(503, {"error": {"message": "overloaded"}}))
+    assert not _is_transient(errors.ClientError(400, {"error": {"message": "bad request"}}))
+
+
+class _Flaky:
+    """Raise lần lượt các lỗi trong errors rồi trả "ok"."""
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def _provider(max_attempts: int = 3, max_concurrency: int = 2) -> Provider:
+    return Provider("test", max_concurrency=max_concurrency, max_attempts=max_attempts, backoff_base=0.0)
+
+
+def test_run_retries_transient_errors():
+    call = _Flaky(_http_error(503), ConnectionError("reset"))
+
+    assert _provider().run("op", call, deadline=5) == "ok"
+    assert call.calls == 3
+
+
+def test_run_raises_non_transient_error_without_retry():
+    call = _Flaky(_http_error(404))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _provider().run("op", call, deadline=5)
+    assert call.calls == 1
+
+
+def test_run_gives_up_after_max_attempts():
+    call = _Flaky(*[_http_error(503)] * 5)
+
+    with pytest.raises(ProviderError, match="HTTPStatusError"):
+        _provider(max_attempts=2).run("op", call, deadline=5)
+    assert call.calls == 2
+
+
+def test_arun_classifies_like_run():
+    async def run(call):
+        async def attempt():
+            return call()
+
+        return await _provider().arun("op", attempt, deadline=5)
+
+    retried = _Flaky(_http_error(502))
+    assert asyncio.run(run(retried)) == "ok" and retried.calls == 2
+
+    rejected = _Flaky(ValueError("status 500"))
+    with pytest.raises(ValueError):
+        asyncio.run(run(rejected))
+    assert rejected.calls == 1
+
+
+def test_sync_slot_is_held_until_hung_call_finishes():
+    provider = _provider(max_attempts=1, max_concurrency=1)
+
+    with pytest.raises(ProviderError, match="attempt timed out"):
+        provider.run("op", lambda: time.sleep(0.3), deadline=0.05)
+    # Lời gọi treo vẫn chiếm slot -> request sau chờ slot và hết deadline
+    with pytest.raises(ProviderError, match="concurrency slot"):
+        provider.run("op", lambda: "ok", deadline=0.05)
+
+    time.sleep(0.35)
+    assert provider.run("op", lambda: "ok", deadline=1) == "ok"
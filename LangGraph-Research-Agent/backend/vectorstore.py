@@ -1,145 +1,647 @@
 # vectorstore.py
+import asyncio
+import hashlib
+import logging
 import os
-from typing import List, Optional
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http import models # Import models để tạo Filter
-from langchain_experimental.text_splitter import SemanticChunker
 
 from config import (
     QDRANT_URL, 
     QDRANT_API_KEY, 
     QDRANT_COLLECTION_NAME, 
-    EMBED_MODEL
+    QDRANT_PREFER_GRPC,
+    QDRANT_GRPC_PORT,
+    QDRANT_SETUP_RETRY_SECONDS,
+    CATALOG_REFRESH_SECONDS,
+    EMBED_MODEL,
+    EMBED_BACKEND,
+    EMBED_CACHE_ENABLED,
+    EMBED_CACHE_QUERY_SIZE,
+    EMBED_CACHE_PATH,
+    EMBED_BATCH_SIZE,
+    UPSERT_BATCH_SIZE,
+    CHUNK_BREAKPOINT_PERCENTILE,
+    CHUNK_VECTOR_MODE,
+    RETRIEVAL_FETCH_K,
+    RETRIEVAL_TOP_K,
+    RETRIEVAL_MODE,
+    SPARSE_VECTOR_NAME,
 )
+from answer_cache import answer_cache
+from catalog import CatalogEntry, DocumentCatalog
+from collection_setup import ensure_collection as setup_collection
+from chunking import EmbeddedChunk, semantic_chunk, semantic_chunk_many, semantic_chunk_pages
+from embedding_backends import build_embeddings, cache_namespace
+from embedding_cache import CachedEmbeddings
+from observability import InstrumentedEmbeddings, qdrant_call
+from rerank import cosine_similarity, select_chunks
+from sparse import encode_document, encode_query
 
-# 1. Initialize Embedding Model
-embeddings = HuggingFaceEmbeddings(model_name=EMBED_MODEL)
+logger = logging.getLogger(__name__)
 
-# 2. Initialize Qdrant Client
-client = QdrantClient(
-    url=QDRANT_URL,
-    api_key=QDRANT_API_KEY
-)
+# 1. Embedding Model: load lần đầu dùng (hoặc lúc warm-up), không load lúc import
+#    (bọc cache: LRU cho query, SQLite cho chunk)
+_embeddings: Optional[Embeddings] = None
+_embeddings_lock = threading.Lock()
+
+def _build_embeddings() -> Embeddings:
+    # Đo thời gian ở lớp model (bên dưới cache) -> metric phản ánh đúng số lần / thời gian chạy model
+    embeddings = InstrumentedEmbeddings(build_embeddings(EMBED_BACKEND))
+    if EMBED_CACHE_ENABLED:
+        embeddings = CachedEmbeddings(
+            embeddings,
+            namespace=cache_namespace(EMBED_BACKEND),
+            query_cache_size=EMBED_CACHE_QUERY_SIZE,
+            db_path=EMBED_CACHE_PATH or None,
+        )
+    return embeddings
+
+def get_embeddings() -> Embeddings:
+    """Embedding model dùng chung (thread-safe, khởi tạo lần đầu gọi)."""
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                logger.info("Loading embedding model: %s (backend: %s)", EMBED_MODEL, EMBED_BACKEND)
+                _embeddings = _build_embeddings()
+    return _embeddings
+
+def set_embeddings(embeddings: Embeddings):
+    """Thay embedding model (benchmark / chạy offline)."""
+    global _embeddings
+    with _embeddings_lock:
+        _embeddings = embeddings
+
+def embeddings_loaded() -> bool:
+    return _embeddings is not None
+
+# 2. Qdrant Client sync + async (dùng chung cho cả app, giữ connection keep-alive):
+#    tạo lần đầu dùng (hoặc lúc warm-up), không tạo lúc import
+_client: Optional[QdrantClient] = None
+_async_client: Optional[AsyncQdrantClient] = None
+_clients_lock = threading.Lock()
+
+def get_client() -> QdrantClient:
+    """Qdrant client sync dùng chung (thread-safe, khởi tạo lần đầu gọi)."""
+    global _client
+    if _client is None:
+        with _clients_lock:
+            if _client is None:
+                _client = QdrantClient(
+                    url=QDRANT_URL,
+                    api_key=QDRANT_API_KEY,
+                    prefer_grpc=QDRANT_PREFER_GRPC,
+                    grpc_port=QDRANT_GRPC_PORT,
+                )
+    return _client
+
+def get_async_client() -> AsyncQdrantClient:
+    """Async client cho các endpoint async (không block event loop), khởi tạo lần đầu gọi."""
+    global _async_client
+    if _async_client is None:
+        with _clients_lock:
+            if _async_client is None:
+                _async_client = AsyncQdrantClient(
+                    url=QDRANT_URL,
+                    api_key=QDRANT_API_KEY,
+                    prefer_grpc=QDRANT_PREFER_GRPC,
+                    grpc_port=QDRANT_GRPC_PORT,
+                )
+    return _async_client
+
+# 3. Danh mục file đã index (collection phụ + cache RAM), lấy client qua get_client
+catalog = DocumentCatalog(get_client, QDRANT_COLLECTION_NAME, refresh_seconds=CATALOG_REFRESH_SECONDS)
+
+class _ThreadedAsyncClient:
+    """Bản async tối thiểu trên client sync: mỗi lời gọi chạy trong threadpool (Qdrant local mode)."""
+
+    def __init__(self, sync_client: QdrantClient):
+        self._client = sync_client
 
-# --- HÀM LẤY RETRIEVER (HỖ TRỢ LỌC FILE) ---
-def get_retriever(file_filters: Optional[List[str]] = None):
+    def __getattr__(self, name: str):
+        method = getattr(self._client, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        return call
+
+def set_qdrant_clients(sync_client: QdrantClient, aclient: Optional[AsyncQdrantClient] = None):
     """
-    Trả về retriever. Nếu có danh sách file_filters, sẽ tạo bộ lọc metadata.
+    Thay Qdrant client (benchmark với QdrantClient(":memory:") / QdrantClient(path=...)).
+    aclient=None -> search async chạy client sync trong thread (local mode không chia sẻ dữ liệu giữa 2 client).
     """
-    search_kwargs = {"k": 20}
-    
-    # Nếu người dùng chọn file cụ thể để chat
-    if file_filters and len(file_filters) > 0:
-        print(f"DEBUG: Đang tạo bộ lọc cho các file: {file_filters}")
-        
-        # Tạo bộ lọc Qdrant: metadata.source PHẢI nằm trong danh sách file_filters
-        qdrant_filter = models.Filter(
-            must=[
-                models.FieldCondition(
-                    key="metadata.source", 
-                    match=models.MatchAny(any=file_filters)
+    global _client, _async_client
+    with _clients_lock:
+        _client = sync_client
+        _async_client = aclient or _ThreadedAsyncClient(sync_client)
+    catalog.bind(sync_client)
+    _ensured_collections.clear()
+    _hybrid_collections.clear()
+    _collection_failures.clear()
+
+def _build_source_filter(file_filters: Optional[List[str]] = None) -> Optional[models.Filter]:
+    """
+    Tạo bộ lọc Qdrant: metadata.source PHẢI nằm trong danh sách file_filters.
+    """
+    if not file_filters:
+        return None
+
+    logger.debug("Đang tạo bộ lọc cho các file: %s", file_filters)
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="metadata.source", 
+                match=models.MatchAny(any=file_filters)
+            )
+        ]
+    )
+
+def _point_to_document(point) -> Document:
+    """Chuyển point Qdrant (payload theo format của langchain_qdrant) thành Document."""
+    payload = point.payload or {}
+    metadata = payload.get("metadata") or {}
+    return Document(page_content=payload.get("page_content", ""), metadata=metadata)
+
+# --- HÀM TẠO COLLECTION NẾU CHƯA CÓ ---
+_ensured_collections: Set[str] = set()
+_hybrid_collections: Set[str] = set()  # collection có sparse vector (hỗ trợ hybrid)
+_collection_failures: Dict[str, float] = {}  # collection -> thời điểm (monotonic) lần kiểm tra lỗi gần nhất
+
+def ensure_collection(collection_name: str = QDRANT_COLLECTION_NAME, force: bool = False):
+    """
+    Tạo collection + payload index + HNSW/on-disk theo config (mỗi process chỉ chạy 1 lần).
+    Lỗi -> không thử lại trong QDRANT_SETUP_RETRY_SECONDS giây (trừ khi force).
+    """
+    if collection_name in _ensured_collections and not force:
+        return
+    failed_at = _collection_failures.get(collection_name)
+    if failed_at is not None and not force and time.monotonic() - failed_at < QDRANT_SETUP_RETRY_SECONDS:
+        return
+    try:
+        if setup_collection(get_client(), collection_name):
+            _hybrid_collections.add(collection_name)
+        else:
+            _hybrid_collections.discard(collection_name)
+        _ensured_collections.add(collection_name)
+        _collection_failures.pop(collection_name, None)
+    except Exception as e:
+        _collection_failures[collection_name] = time.monotonic()
+        logger.error("Check collection error (retry in %.0fs): %s", QDRANT_SETUP_RETRY_SECONDS, e)
+
+def hybrid_enabled(collection_name: str = QDRANT_COLLECTION_NAME) -> bool:
+    """True nếu collection có sparse vector -> ingestion ghi kèm sparse, search được dùng mode hybrid."""
+    ensure_collection(collection_name)
+    return collection_name in _hybrid_collections
+
+# --- HÀM TÌM KIẾM: OVER-FETCH + RERANK + NGÂN SÁCH TOKEN ---
+def _dense_vector(point) -> Optional[List[float]]:
+    vector = point.vector
+    if isinstance(vector, dict):
+        vector = vector.get("")
+    return vector
+
+def _select(query: str, query_vector: List[float], points, k: int, mode: str) -> List[Tuple[Document, float]]:
+    candidates = []
+    for point in points:
+        vector = _dense_vector(point)
+        score = point.score
+        if mode == "hybrid" and vector is not None:
+            # Điểm RRF chỉ phản ánh thứ hạng -> tính lại cosine để fast-path judge dùng cùng thang điểm
+            score = cosine_similarity(query_vector, vector)
+        candidates.append((_point_to_document(point), score, vector))
+    return select_chunks(query, query_vector, candidates, k)
+
+def _resolve_mode(mode: Optional[str]) -> str:
+    mode = mode or RETRIEVAL_MODE
+    if mode == "hybrid" and not hybrid_enabled():
+        return "dense"
+    return mode
+
+async def _aresolve_mode(mode: Optional[str]) -> str:
+    """
+    Bản async của _resolve_mode: collection thường đã được kiểm tra lúc warm-up;
+    nếu chưa (hoặc lần trước lỗi) thì gọi Qdrant sync trong thread, không chặn event loop.
+    """
+    if (mode or RETRIEVAL_MODE) == "hybrid" and QDRANT_COLLECTION_NAME not in _ensured_collections:
+        return await asyncio.to_thread(_resolve_mode, mode)
+    return _resolve_mode(mode)
+
+def _query_kwargs(query: str, query_vector: List[float], file_filters: Optional[List[str]], k: int, mode: str) -> Dict:
+    """
+    Tham số query_points cho mode dense hoặc hybrid.
+    Hybrid: prefetch dense + sparse (cùng bộ lọc file), gộp bằng Reciprocal Rank Fusion ngay trong Qdrant.
+    """
+    source_filter = _build_source_filter(file_filters)
+    limit = max(k, RETRIEVAL_FETCH_K)
+    kwargs = dict(collection_name=QDRANT_COLLECTION_NAME, limit=limit, with_payload=True, with_vectors=True)
+    if mode == "hybrid":
+        kwargs["prefetch"] = [
+            models.Prefetch(query=query_vector, filter=source_filter, limit=limit),
+            models.Prefetch(query=encode_query(query), using=SPARSE_VECTOR_NAME, filter=source_filter, limit=limit),
+        ]
+        kwargs["query"] = models.FusionQuery(fusion=models.Fusion.RRF)
+    else:
+        kwargs["query"] = query_vector
+        kwargs["query_filter"] = source_filter
+    return kwargs
+
+def search_documents_with_scores(
+    query: str,
+    file_filters: Optional[List[str]] = None,
+    k: int = RETRIEVAL_TOP_K,
+    mode: Optional[str] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Lấy RETRIEVAL_FETCH_K ứng viên từ Qdrant (bộ lọc metadata.source truyền theo request),
+    bỏ near-duplicate, rerank và cắt theo CONTEXT_TOKEN_BUDGET.
+    mode: "dense" | "hybrid" (mặc định RETRIEVAL_MODE; collection chưa có sparse vector -> dense).
+    Trả về (Document, cosine similarity) theo thứ tự sau rerank.
+    """
+    mode = _resolve_mode(mode)
+    query_vector = get_embeddings().embed_query(query)
+    with qdrant_call("query_points"):
+        response = get_client().query_points(**_query_kwargs(query, query_vector, file_filters, k, mode))
+    return _select(query, query_vector, response.points, k, mode)
+
+# --- HÀM TÌM KIẾM ASYNC (DÙNG CHO ENDPOINT ASYNC) ---
+async def asearch_documents_with_scores(
+    query: str,
+    file_filters: Optional[List[str]] = None,
+    k: int = RETRIEVAL_TOP_K,
+    mode: Optional[str] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Bản async: embed query trong threadpool, search bằng AsyncQdrantClient,
+    rerank (CPU) trong thread riêng.
+    """
+    mode = await _aresolve_mode(mode)
+    query_vector = await get_embeddings().aembed_query(query)
+
+    with qdrant_call("query_points"):
+        response = await get_async_client().query_points(**_query_kwargs(query, query_vector, file_filters, k, mode))
+    return await asyncio.to_thread(_select, query, query_vector, response.points, k, mode)
+
+# --- KẾT QUẢ INGESTION ---
+@dataclass
+class IngestResult:
+    """Số chunk của file + số chunk ghi mới / giữ nguyên / xoá + thời gian từng giai đoạn (giây)."""
+    chunks: int
+    timings: Dict[str, float] = field(default_factory=dict)
+    written: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    skipped: bool = False  # True nếu file không đổi so với bản đã index
+
+# --- ID CHUNK XÁC ĐỊNH (IDEMPOTENT RE-INDEX) ---
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_point_id(source_filename: str, chunk_hash: str) -> str:
+    """ID point = uuid5(tên file + hash nội dung chunk): upload lại cùng nội dung -> cùng ID."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_filename}\0{chunk_hash}"))
+
+def is_file_unchanged(source_filename: str, file_hash: str) -> bool:
+    """True nếu file đã được index đầy đủ với đúng file_hash này."""
+    try:
+        # Catalog là nguồn chính; dữ liệu cũ chưa có catalog thì kiểm tra trực tiếp trên collection
+        entry = catalog.get(source_filename)
+        if entry is not None and entry.content_hash:
+            return entry.content_hash == file_hash and entry.chunk_count > 0
+
+        source_filter = _build_source_filter([source_filename])
+        with qdrant_call("count"):
+            total = get_client().count(QDRANT_COLLECTION_NAME, count_filter=source_filter, exact=True).count
+        if total == 0:
+            return False
+        with qdrant_call("count"):
+            same_hash = get_client().count(
+                QDRANT_COLLECTION_NAME,
+                count_filter=models.Filter(
+                    must=source_filter.must + [
+                        models.FieldCondition(key="metadata.file_hash", match=models.MatchValue(value=file_hash))
+                    ]
+                ),
+                exact=True,
+            ).count
+        return same_hash == total
+    except Exception as e:
+        logger.error("Check file hash error: %s", e)
+        return False
+
+def list_point_ids(source_filename: str, page_size: int = 1000) -> Set[str]:
+    """Scroll (phân trang) toàn bộ ID point của một file, không lấy payload/vector."""
+    ids: Set[str] = set()
+    offset = None
+    while True:
+        with qdrant_call("scroll"):
+            points, offset = get_client().scroll(
+                collection_name=QDRANT_COLLECTION_NAME,
+                scroll_filter=_build_source_filter([source_filename]),
+                limit=page_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
+            )
+        ids.update(str(point.id) for point in points)
+        if offset is None:
+            return ids
+
+# --- HÀM UPSERT CHUNK ĐÃ CÓ VECTOR ---
+def build_points(
+    chunks: List[EmbeddedChunk],
+    metadata: Dict,
+    existing_ids: Optional[Set[str]] = None,
+) -> Tuple[List[str], List[models.PointStruct]]:
+    """
+    Tạo point (kèm vector tính sẵn) cho các chunk, ID xác định theo nội dung.
+    Chunk có ID nằm trong existing_ids (đã có sẵn, nội dung không đổi) thì không tạo point.
+    Payload giữ format của langchain_qdrant: {"page_content": ..., "metadata": {...}}.
+    Collection hỗ trợ hybrid -> kèm sparse vector BM25 của text chunk.
+    Trả về (ID của tất cả chunk kể cả chunk bỏ qua, point cần ghi).
+    """
+    existing_ids = existing_ids or set()
+    with_sparse = hybrid_enabled()
+    source_filename = metadata["source"]
+    ids: List[str] = []
+    points: List[models.PointStruct] = []
+
+    for chunk in chunks:
+        chunk_hash = content_hash(chunk.text)
+        point_id = chunk_point_id(source_filename, chunk_hash)
+        ids.append(point_id)
+        if point_id in existing_ids:
+            continue
+        points.append(
+            models.PointStruct(
+                id=point_id,
+                vector=(
+                    {"": chunk.vector, SPARSE_VECTOR_NAME: encode_document(chunk.text)}
+                    if with_sparse else chunk.vector
+                ),
+                payload={
+                    "page_content": chunk.text,
+                    "metadata": {**metadata, **chunk.metadata, "chunk_hash": chunk_hash},
+                },
+            )
+        )
+    return ids, points
+
+def upsert_points(points: List[models.PointStruct], batch_size: int = UPSERT_BATCH_SIZE):
+    """Ghi point vào Qdrant theo batch (point có thể thuộc nhiều file)."""
+    for start in range(0, len(points), batch_size):
+        with qdrant_call("upsert"):
+            get_client().upsert(collection_name=QDRANT_COLLECTION_NAME, points=points[start:start + batch_size])
+
+def upsert_chunks(
+    chunks: List[EmbeddedChunk],
+    metadata: Dict,
+    existing_ids: Optional[Set[str]] = None,
+    batch_size: int = UPSERT_BATCH_SIZE,
+) -> List[str]:
+    """Ghi chunk của một file vào Qdrant (xem build_points). Trả về ID của tất cả chunk."""
+    ids, points = build_points(chunks, metadata, existing_ids)
+    upsert_points(points, batch_size)
+    return ids
+
+class IncrementalIndexer:
+    """
+    Re-index một file theo kiểu incremental:
+    - Chunk đã tồn tại (cùng ID) -> không upsert lại, chỉ cập nhật metadata.file_hash.
+    - Chunk mới -> upsert.
+    - Chunk cũ không còn trong bản mới -> xoá khi finish().
+    Embedding của câu/chunk không đổi được lấy từ embedding cache nên cũng không phải tính lại.
+    """
+
+    def __init__(self, source_filename: str, file_hash: str, byte_size: int = 0):
+        self.source_filename = source_filename
+        self.file_hash = file_hash
+        self.byte_size = byte_size
+        self.existing_ids = list_point_ids(source_filename)
+        self.seen_ids: Set[str] = set()
+        self.written = 0
+
+    def stage(self, chunks: List[EmbeddedChunk]) -> List[models.PointStruct]:
+        """Ghi nhận chunk của bản mới, trả về point cần upsert (để gom upsert nhiều file một lượt)."""
+        metadata = {"source": self.source_filename, "file_hash": self.file_hash}
+        ids, points = build_points(chunks, metadata, existing_ids=self.existing_ids | self.seen_ids)
+        new_ids = [point_id for point_id in ids if point_id not in self.existing_ids and point_id not in self.seen_ids]
+        self.written += len(set(new_ids))
+        self.seen_ids.update(ids)
+        return points
+
+    def write(self, chunks: List[EmbeddedChunk]):
+        upsert_points(self.stage(chunks))
+
+    def abort(self):
+        """
+        Ingestion lỗi giữa chừng (chưa finish): xoá các point đã ghi cho bản file này.
+        Bản cũ + catalog giữ nguyên -> lần upload lại không dựa trên index ghi dở.
+        """
+        delete_file_version(self.source_filename, self.file_hash)
+        logger.warning("Removed partially written chunks of '%s' (hash %s).", self.source_filename, self.file_hash[:12])
+
+    def finish(self) -> IngestResult:
+        unchanged_ids = list(self.existing_ids & self.seen_ids)
+        stale_ids = list(self.existing_ids - self.seen_ids)
+
+        # Đánh dấu chunk giữ nguyên thuộc bản file mới
+        for start in range(0, len(unchanged_ids), UPSERT_BATCH_SIZE):
+            with qdrant_call("set_payload"):
+                get_client().set_payload(
+                    collection_name=QDRANT_COLLECTION_NAME,
+                    payload={"file_hash": self.file_hash},
+                    points=unchanged_ids[start:start + UPSERT_BATCH_SIZE],
+                    key="metadata",
+                )
+        delete_points(stale_ids)
+
+        # Cập nhật danh mục file
+        catalog.upsert(
+            CatalogEntry(
+                file_name=self.source_filename,
+                chunk_count=len(self.seen_ids),
+                byte_size=self.byte_size,
+                ingested_at=time.time(),
+                content_hash=self.file_hash,
+            )
+        )
+        # Câu trả lời đã cache dựa trên bản cũ của file không còn đúng
+        answer_cache.invalidate_file(self.source_filename)
+
+        return IngestResult(
+            chunks=len(self.seen_ids),
+            written=self.written,
+            unchanged=len(unchanged_ids),
+            deleted=len(stale_ids),
+        )
+
+def delete_file_version(source_filename: str, file_hash: str):
+    """Xoá mọi point của source_filename mang metadata.file_hash = file_hash."""
+    with qdrant_call("delete"):
+        get_client().delete(
+            collection_name=QDRANT_COLLECTION_NAME,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source_filename)),
+                        models.FieldCondition(key="metadata.file_hash", match=models.MatchValue(value=file_hash)),
+                    ]
                 )
-            ]
+            ),
         )
-        search_kwargs["filter"] = qdrant_filter
 
-    vectorstore = QdrantVectorStore(
-        client=client,
-        collection_name=QDRANT_COLLECTION_NAME,
-        embedding=embeddings,
+def delete_points(point_ids: Iterable[str], batch_size: int = UPSERT_BATCH_SIZE):
+    point_ids = list(point_ids)
+    for start in range(0, len(point_ids), batch_size):
+        with qdrant_call("delete"):
+            get_client().delete(
+                collection_name=QDRANT_COLLECTION_NAME,
+                points_selector=models.PointIdsList(points=point_ids[start:start + batch_size]),
+            )
+
+# --- HÀM CHUẨN BỊ CHUNK (CHUNKING + EMBEDDING, CHƯA GHI QDRANT) ---
+def prepare_document_chunks(
+    text_content: str,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[EmbeddedChunk]:
+    """
+    Semantic Chunking và embedding trong một lượt (vector câu được dùng lại cho chunk).
+    Tách riêng khỏi upsert để có thể chạy trong process pool.
+    """
+    if not text_content:
+        raise ValueError("Document content cannot be empty.")
+
+    # Semantic Chunking: Cắt dựa trên ý nghĩa, vector chunk tính luôn từ vector câu
+    return semantic_chunk(
+        text_content,
+        get_embeddings(),
+        batch_size=EMBED_BATCH_SIZE,
+        breakpoint_percentile=CHUNK_BREAKPOINT_PERCENTILE,
+        vector_mode=CHUNK_VECTOR_MODE,
+        timings=timings,
+    )
+
+# --- HÀM CHUẨN BỊ CHUNK CHO MỘT CỬA SỔ TRANG (STREAMING INGESTION) ---
+def prepare_page_chunks(
+    pages: List[tuple],
+    timings: Optional[Dict[str, float]] = None,
+) -> List[EmbeddedChunk]:
+    """
+    Chunking + embedding cho một cửa sổ trang [(page, text), ...], giữ số trang trong metadata.
+    """
+    return semantic_chunk_pages(
+        pages,
+        get_embeddings(),
+        batch_size=EMBED_BATCH_SIZE,
+        breakpoint_percentile=CHUNK_BREAKPOINT_PERCENTILE,
+        vector_mode=CHUNK_VECTOR_MODE,
+        timings=timings,
+    )
+
+# --- HÀM CHUẨN BỊ CHUNK CHO NHIỀU TÀI LIỆU (BULK INGESTION) ---
+def prepare_documents_chunks(
+    documents: List[List[tuple]],
+    timings: Optional[Dict[str, float]] = None,
+) -> List[List[EmbeddedChunk]]:
+    """
+    Chunking + embedding cho nhiều tài liệu một lượt: câu của các file được embed chung batch.
+    """
+    return semantic_chunk_many(
+        documents,
+        get_embeddings(),
+        batch_size=EMBED_BATCH_SIZE,
+        breakpoint_percentile=CHUNK_BREAKPOINT_PERCENTILE,
+        vector_mode=CHUNK_VECTOR_MODE,
+        timings=timings,
     )
-    
-    return vectorstore.as_retriever(search_kwargs=search_kwargs)
 
 # --- HÀM THÊM TÀI LIỆU (SEMANTIC CHUNKING + METADATA) ---
-def add_document_to_vectorstore(text_content: str, source_filename: str):
+def add_document_to_vectorstore(
+    text_content: str,
+    source_filename: str,
+    file_hash: Optional[str] = None,
+    byte_size: Optional[int] = None,
+) -> IngestResult:
     """
-    Sử dụng Semantic Chunking để cắt văn bản và đẩy vào Qdrant kèm Metadata tên file.
+    Chunking + embedding rồi đẩy vào Qdrant kèm Metadata tên file.
+    Idempotent: upload lại cùng nội dung thì bỏ qua, nội dung sửa đổi thì chỉ ghi chunk thay đổi.
+    file_hash / byte_size: sha256 + kích thước byte gốc của file (như upload / ingest_dir);
+    không truyền -> coi text UTF-8 là byte gốc (file .txt).
     """
     if not text_content:
         raise ValueError("Document content cannot be empty.")
 
-    print(f"Initializing Semantic Chunking for file: {source_filename}...")
-    
-    # Semantic Chunking: Cắt dựa trên ý nghĩa
-    text_splitter = SemanticChunker(
-        embeddings=embeddings, 
-        breakpoint_threshold_type="percentile" 
-    )
-    
-    # Tạo metadata source cho file
-    metadatas = [{"source": source_filename}]
-    
-    # Tạo documents (LangChain sẽ tự nhân bản metadata cho các chunk)
-    documents = text_splitter.create_documents([text_content], metadatas=metadatas)
-    
-    print(f"Semantic Chunking created {len(documents)} chunks based on meaning.")
-    
-    if not documents:
-        print("No documents created from chunking.")
-        return 0
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
 
-    # Kiểm tra và tạo Collection nếu chưa có
-    try:
-        if not client.collection_exists(QDRANT_COLLECTION_NAME):
-             print(f"Creating new Qdrant collection: {QDRANT_COLLECTION_NAME}")
-             client.create_collection(
-                 collection_name=QDRANT_COLLECTION_NAME,
-                 vectors_config=models.VectorParams(
-                     size=384, 
-                     distance=models.Distance.COSINE
-                 )
-             )
-    except Exception as e:
-        print(f"Check collection error: {e}")
+    ensure_collection()
+    if file_hash is None:
+        raw = text_content.encode("utf-8")
+        file_hash = hashlib.sha256(raw).hexdigest()
+        byte_size = len(raw)
+    if is_file_unchanged(source_filename, file_hash):
+        logger.info("'%s' is unchanged since last ingestion. Skipping.", source_filename)
+        return IngestResult(chunks=0, timings=timings, skipped=True)
 
-    print(f"Adding {len(documents)} chunks to Qdrant collection '{QDRANT_COLLECTION_NAME}'...")
+    logger.info("Initializing Semantic Chunking for file: %s", source_filename)
+    indexer = IncrementalIndexer(source_filename, file_hash, byte_size=byte_size or 0)
+    chunks = prepare_document_chunks(text_content, timings)
     
-    # Upsert vào Qdrant
-    QdrantVectorStore.from_documents(
-        documents=documents,
-        embedding=embeddings,
-        url=QDRANT_URL,
-        api_key=QDRANT_API_KEY,
-        collection_name=QDRANT_COLLECTION_NAME,
-        force_recreate=False
-    )
+    logger.info("Semantic Chunking created %d chunks, adding to Qdrant collection '%s'", len(chunks), QDRANT_COLLECTION_NAME)
     
-    print(f"Successfully added chunks from '{source_filename}' to Qdrant.")
-    return len(documents)
+    # Upsert vào Qdrant bằng vector đã có (không embed lại lần 2), chỉ chunk thay đổi
+    t0 = time.perf_counter()
+    indexer.write(chunks)
+    result = indexer.finish()
+    timings["upsert_s"] = time.perf_counter() - t0
+    timings["total_s"] = time.perf_counter() - started
+    result.timings = timings
+    
+    logger.info(
+        "Indexed '%s': %d new, %d unchanged, %d stale chunks removed (%s)",
+        source_filename, result.written, result.unchanged, result.deleted,
+        ", ".join(f"{k}={v:.2f}" for k, v in timings.items()),
+        extra={"source": source_filename, "timings": timings},
+    )
+    return result
 
 # --- HÀM LẤY DANH SÁCH FILE ĐÃ UPLOAD ---
 def list_indexed_documents():
     """
-    Quét Qdrant để lấy danh sách các tên file (source) duy nhất.
+    Lấy danh sách tên file từ danh mục (O(số file), không scroll chunk).
     """
     try:
-        if not client.collection_exists(QDRANT_COLLECTION_NAME):
-            return []
-        
-        # Scroll lấy mẫu dữ liệu (limit 1000 để quét sâu)
-        response = client.scroll(
-            collection_name=QDRANT_COLLECTION_NAME,
-            limit=1000, 
-            with_payload=True,
-            with_vectors=False
-        )
-        points, _ = response
-        unique_files = set()
-        
-        for point in points:
-            payload = point.payload or {}
-            # Cấu trúc: payload -> metadata -> source (như trong ảnh bạn gửi)
-            metadata = payload.get("metadata", {})
-            if isinstance(metadata, dict):
-                source = metadata.get("source")
-                if source:
-                    unique_files.add(source)
-        
-        return sorted(list(unique_files))
-
+        return catalog.list_names()
     except Exception as e:
-        print(f"Error listing documents: {e}")
-        return []
\ No newline at end of file
+        logger.error("Error listing documents: %s", e)
+        return []
+
+# --- BẢN ASYNC: LẤY DANH SÁCH FILE ---
+async def alist_indexed_documents():
+    """
+    Giống list_indexed_documents (thường đọc từ RAM, chỉ chạm Qdrant khi refresh catalog).
+    """
+    return await asyncio.to_thread(list_indexed_documents)
+
+# --- THỐNG KÊ EMBEDDING CACHE ---
+def get_embedding_cache_stats():
+    """Trả về hit/miss của embedding cache (rỗng nếu cache bị tắt)."""
+    if isinstance(_embeddings, CachedEmbeddings):
+        return _embeddings.stats()
+    return {}
+
+def prime_query_embeddings(queries: List[str]) -> int:
+    """Embed trước các query của /chat/batch trong một lần chạy model (no-op nếu tắt cache)."""
+    embeddings = get_embeddings()
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.prime_queries(queries)
+    return 0
@@ -0,0 +1,107 @@
+# warmup.py
+import logging
+import threading
+import time
+from typing import Callable, Dict, List
+
+from agent import init_clients, prerouter
+from config import PREROUTER_ENABLED, RERANK_MODE
+from rerank import get_cross_encoder
+from vectorstore import catalog, ensure_collection, get_client, get_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """
+    Trạng thái warm-up của từng thành phần: "pending" | "ok" | "error: ...".
+    Worker chỉ "ready" khi mọi thành phần bắt buộc đã "ok".
+    """
+
+    def __init__(self):
+        self.components: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}
+        self.required: List[str] = []
+        self._lock = threading.Lock()
+
+    def require(self, *names: str):
+        with self._lock:
+            for name in names:
+                if name not in self.required:
+                    self.required.append(name)
+                self.components.setdefault(name, "pending")
+
+    def mark(self, name: str, status: str, seconds: float = 0.0):
+        with self._lock:
+            self.components[name] = status
+            if seconds:
+                self.timings[name] = round(seconds, 3)
+
+    def is_ok(self, name: str) -> bool:
+        return self.components.get(name) == "ok"
+
+    @property
+    def ready(self) -> bool:
+        return all(self.is_ok(name) for name in self.required)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "ready": all(self.components.get(name) == "ok" for name in self.required),
+                "components": dict(self.components),
+                "timings": dict(self.timings),
+            }
+
+
+readiness = Readiness()
+
+
+def _run_step(name: str, func: Callable[[], object]):
+    if readiness.is_ok(name):
+        return
+    t0 = time.perf_counter()
+    try:
+        func()
+        readiness.mark(name, "ok", time.perf_counter() - t0)
+        logger.info("Warm-up '%s' done in %.2fs", name, time.perf_counter() - t0)
+    except Exception as e:
+        readiness.mark(name, f"error: {e}", time.perf_counter() - t0)
+        logger.warning("Warm-up '%s' failed: %s", name, e)
+
+
+def _warm_qdrant():
+    get_client().get_collections()  # ping: lỗi kết nối -> raise
+    ensure_collection()
+    catalog.load()
+
+
+def _warm_embeddings():
+    # Load model + chạy 1 lượt suy luận (lần chạy đầu của torch chậm hơn hẳn)
+    get_embeddings().embed_query("warm up")
+
+
+def _warm_reranker():
+    get_cross_encoder().predict([("warm up", "warm up")])
+
+
+def register_components():
+    """Đăng ký các thành phần warm-up bắt buộc (gọi trước khi nhận traffic -> /ready trả 503 ngay từ đầu)."""
+    readiness.require("qdrant", "embeddings", "llm_clients")
+    if RERANK_MODE == "cross_encoder":
+        readiness.require("reranker")
+
+
+def warm_up() -> Dict[str, object]:
+    """
+    Khởi tạo trước các thành phần nặng (chạy trong thread, có thể gọi lại: chỉ chạy bước chưa "ok").
+    """
+    register_components()
+    _run_step("qdrant", _warm_qdrant)
+    _run_step("embeddings", _warm_embeddings)
+    _run_step("llm_clients", init_clients)
+    if RERANK_MODE == "cross_encoder":
+        _run_step("reranker", _warm_reranker)
+    if PREROUTER_ENABLED:
+        # Không bắt buộc cho /ready: exemplar tự được embed ở query đầu tiên nếu bước này lỗi
+        _run_step("prerouter", prerouter.warm_up)
+    return readiness.snapshot()
@@ -0,0 +1,136 @@
+# web_cache.py
+import asyncio
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hoá query làm key cache: chữ thường, gộp khoảng trắng, bỏ dấu câu cuối."""
+    return " ".join(query.lower().split()).rstrip(" ?!.")
+
+
+class _Flight:
+    """Một lượt search đang chạy (bản sync), các thread khác cùng query chờ kết quả này."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class WebSearchCache:
+    """
+    Cache kết quả web search (text đã format) theo query chuẩn hoá:
+    - TTL + giới hạn số entry (bỏ entry cũ nhất khi đầy).
+    - Single-flight: nhiều request cùng query đang chờ -> chỉ 1 lần gọi Tavily, các request khác dùng chung kết quả.
+    Mỗi lần search trả về kèm nguồn: "hit" (từ cache) / "coalesced" (dùng chung lượt đang chạy) / "miss" (gọi Tavily).
+    Lỗi không được cache.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._sync_flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[str, asyncio.Future] = {}
+        self._stats: Counter = Counter()
+
+    # --- CACHE ---
+    def _get_locked(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self._stats["hit"] += 1
+            return value
+
+    # --- SYNC ---
+    def search(self, query: str, fetch: Callable[[str], str]) -> Tuple[str, str]:
+        key = normalize_query(query)
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self._stats["hit"] += 1
+                return value, "hit"
+            flight = self._sync_flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._sync_flights[key] = _Flight()
+
+        if not leader:
+            self._stats["coalesced"] += 1
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, "coalesced"
+
+        self._stats["miss"] += 1
+        try:
+            flight.result = fetch(query)
+            self._store(key, flight.result)
+            return flight.result, "miss"
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._sync_flights.pop(key, None)
+            flight.event.set()
+
+    # --- ASYNC ---
+    async def asearch(self, query: str, afetch: Callable[[str], Awaitable[str]]) -> Tuple[str, str]:
+        key = normalize_query(query)
+        value = self._lookup(key)
+        if value is not None:
+            return value, "hit"
+
+        loop = asyncio.get_running_loop()
+        flight = self._async_flights.get(key)
+        if flight is not None and flight.get_loop() is loop:
+            self._stats["coalesced"] += 1
+            # shield: request chờ bị huỷ không huỷ lượt search dùng chung
+            return await asyncio.shield(flight), "coalesced"
+
+        flight = loop.create_future()
+        # Tránh cảnh báo "exception was never retrieved" khi không có ai chờ
+        flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._async_flights[key] = flight
+        self._stats["miss"] += 1
+        try:
+            value = await afetch(query)
+            self._store(key, value)
+            flight.set_result(value)
+            return value, "miss"
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            if not flight.done():
+                # Request dẫn đầu bị huỷ -> báo lỗi cho các request đang chờ (chúng sẽ trả lời không có web)
+                flight.set_exception(RuntimeError("Shared web search was cancelled."))
+            if self._async_flights.get(key) is flight:
+                del self._async_flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
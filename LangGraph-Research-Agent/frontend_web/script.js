@@ -71,13 +71,14 @@ function toggleFileSelection(filename, divElement) {
     console.log("Files Selected:", selectedFiles);
 }
 
-// --- 2. File Upload ---
+// --- 2. File Upload (job chạy nền + theo dõi tiến độ) ---
 fileUpload.addEventListener('change', async (e) => {
     const file = e.target.files[0];
     if (!file) return;
 
-    const btnText = document.querySelector('.btn-primary').innerHTML;
-    document.querySelector('.btn-primary').innerHTML = `<span class="material-icons-outlined">hourglass_top</span> Uploading...`;
+    const uploadBtn = document.querySelector('.btn-primary');
+    const btnText = uploadBtn.innerHTML;
+    uploadBtn.innerHTML = `<span class="material-icons-outlined">hourglass_top</span> Uploading...`;
 
     const formData = new FormData();
     formData.append('file', file);
@@ -87,21 +88,40 @@ fileUpload.addEventListener('change', async (e) => {
             method: 'POST',
             body: formData
         });
-        if (response.ok) {
-            loadDocuments(); // Reload list sau khi upload
-        } else {
+        if (!response.ok) {
             alert("Upload failed.");
+            return;
         }
+
+        const job = await waitForJob(await response.json(), (j) => {
+            uploadBtn.innerHTML = `<span class="material-icons-outlined">hourglass_top</span> ${j.stage} ${Math.round(j.percent)}%`;
+        });
+        if (job.stage === 'failed') {
+            alert(`Indexing failed: ${job.error}`);
+        }
+        loadDocuments(); // Reload list sau khi upload
     } catch (err) {
         console.error(err);
         alert("Error connecting to server.");
     } finally {
-        document.querySelector('.btn-primary').innerHTML = btnText;
+        uploadBtn.innerHTML = btnText;
         fileUpload.value = '';
     }
 });
 
-// --- 3. Chat Logic ---
+// Poll /jobs/{id} đến khi job xong (done / failed)
+async function waitForJob(job, onProgress, intervalMs = 1000) {
+    while (job.stage !== 'done' && job.stage !== 'failed') {
+        onProgress(job);
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+        const response = await fetch(`${API_BASE_URL}/jobs/${job.job_id}`);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        job = await response.json();
+    }
+    return job;
+}
+
+// --- 3. Chat Logic (streaming qua SSE) ---
 async function sendMessage() {
     const text = userInput.value.trim();
     if (!text) return;
@@ -114,9 +134,10 @@ async function sendMessage() {
 
     // Loading State
     const loadingId = addLoadingMessage();
+    let streamView = null;
 
     try {
-        const response = await fetch(`${API_BASE_URL}/chat/`, {
+        const response = await fetch(`${API_BASE_URL}/chat/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -126,23 +147,71 @@ async function sendMessage() {
                 selected_files: selectedFiles // Gửi danh sách file hiện tại
             })
         });
-
-        const data = await response.json();
-        removeMessage(loadingId);
-        
-        // Render Response
-        addMessage(data.response, 'assistant', data.trace_events);
+        if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+        const traces = [];
+        let answerText = '';
+
+        await readEventStream(response, (event, data) => {
+            // Event đầu tiên -> thay "Thinking..." bằng message đang stream
+            if (!streamView) {
+                removeMessage(loadingId);
+                streamView = createStreamingMessage();
+            }
+
+            if (event === 'trace') {
+                traces.push(data);
+                streamView.update(traces, answerText);
+            } else if (event === 'token') {
+                answerText += data.text;
+                streamView.update(traces, answerText);
+            } else if (event === 'done') {
+                streamView.finish(data.trace_events, data.response);
+            } else if (event === 'error') {
+                streamView.finish(traces, "Sorry, something went wrong while generating the answer.");
+                console.error(data.detail);
+            }
+        });
 
     } catch (error) {
         removeMessage(loadingId);
+        if (streamView) streamView.remove();
         addMessage("Sorry, I encountered an error connecting to the server.", 'assistant');
         console.error(error);
     } finally {
+        removeMessage(loadingId);
         sendBtn.disabled = false;
         userInput.focus();
     }
 }
 
+// Đọc body dạng text/event-stream và gọi onEvent(event, data) cho từng event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 // --- Helper Functions ---
 function addMessage(text, role, traces = []) {
     const div = document.createElement('div');
@@ -174,6 +243,41 @@ function addMessage(text, role, traces = []) {
     });
 }
 
+// Message assistant được cập nhật dần theo trace/token
+function createStreamingMessage() {
+    const div = document.createElement('div');
+    div.className = 'message assistant';
+    div.innerHTML = `
+        <div class="avatar"><span class="material-icons-outlined">smart_toy</span></div>
+        <div class="message-content"></div>
+    `;
+    const content = div.querySelector('.message-content');
+    chatHistory.appendChild(div);
+
+    function render(traces, text) {
+        let html = traces.length > 0 ? buildThinkingBlock(traces) : '';
+        html += `<div class="markdown-body">${marked.parse(text || '')}</div>`;
+        // Giữ trạng thái mở/đóng của khối Thinking Process khi render lại
+        const wasOpen = content.querySelector('details.thinking-process')?.open;
+        content.innerHTML = html;
+        if (wasOpen) content.querySelector('details.thinking-process').open = true;
+        scrollToBottom();
+    }
+
+    return {
+        update: render,
+        finish(traces, text) {
+            render(traces, text);
+            div.querySelectorAll('pre code').forEach((block) => {
+                hljs.highlightElement(block);
+            });
+        },
+        remove() {
+            div.remove();
+        }
+    };
+}
+
 function buildThinkingBlock(traces) {
     let stepsHtml = traces.map(t => {
         let iconMap = {